@@ -1,15 +1,34 @@
+import os
 import pygad
-from behavior_tree_test import simulacao
+from evaluator import ParallelEvaluator
+from cache import EvaluationCache, CachedEvaluator
+from surrogate import SurrogateEvaluator
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from multi_fidelity import SuccessiveHalvingEvaluator, screen_population, default_fidelities
 import numpy as np
 from constants import *
 
-def fitness_func(solution, solution_idx):
-    output = simulacao(solution[0],solution[1],solution[2],solution[3],solution[4])
-    fitness = 1.0 / np.abs(output)
+def fitness_func(solutions, solutions_idx):
+    global resumed_fitness
+    if resumed_fitness is not None:
+        # pygad evaluates the population again when it is resumed, but its fitness was saved in the checkpoint
+        fitness = [resumed_fitness[idx] for idx in solutions_idx]
+        resumed_fitness = None
+        return fitness
+    # pygad hands over the whole population at once (fitness_batch_size), which is simulated by the worker processes
+    outputs = batch_evaluator.map(solutions)
+    fitness = [1.0 / np.abs(output) for output in outputs]
     return fitness
 
 fitness_function = fitness_func
 
+def on_generation(ga_instance):
+    # A resumed instance keeps counting the generations from the checkpoint
+    generations = ga_instance.generations_completed
+    if generations % checkpoint_interval == 0:
+        save_checkpoint(checkpoint_path, {'ga_instance': ga_instance, 'generations': generations,
+                                          'surrogate': evaluator.get_state() if use_surrogate else None})
+
 num_generations = 50
 num_parents_mating = 4
 
@@ -27,27 +46,80 @@ crossover_type = "single_point"
 mutation_type = "random"
 mutation_percent_genes = 10
 
+replicate_seeds = [1, 2, 3]  # common random numbers: every candidate is simulated with the same replicate seeds
+cache_path = 'evaluations.sqlite'  # evaluations reused across runs
+cache_tolerance = 1.0e-3 * 0.4 * np.array([MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL])  # points closer than this share the same evaluation
+use_surrogate = False  # only the candidates a surrogate model finds most promising are simulated; the others get predicted costs
+screen_fraction = 0.4  # fraction of each generation that is simulated when using the surrogate model
+checkpoint_path = 'ga_checkpoint.pkl'  # the run is resumed from this file if it exists
+checkpoint_interval = 1  # number of generations between checkpoints
+resumed_fitness = None  # fitness of the population saved in the checkpoint, reused when the run is resumed
+use_successive_halving = False  # generations are evaluated with successive halving over fidelities
+fidelities = default_fidelities  # fidelities of successive halving, from the cheapest one to the full fidelity
+eta = 3  # only the best 1/eta of the candidates are promoted to the next fidelity
+initial_pool_factor = 4  # with successive halving, the initial population is screened from this many times more candidates
 
-ga_instance = pygad.GA(num_generations=num_generations,
-                       num_parents_mating=num_parents_mating,
-                       fitness_func=fitness_function,
-                       sol_per_pop=sol_per_pop,
-                       num_genes=num_genes,
-                       init_range_low=init_range_low,
-                       init_range_high=init_range_high,
-                       parent_selection_type=parent_selection_type,
-                       keep_parents=keep_parents,
-                       crossover_type=crossover_type,
-                       mutation_type=mutation_type,
-                       mutation_percent_genes=mutation_percent_genes,
-                       gene_space=[[MOVE_FORWARD_TIME_ORIGINAL*0.8,MOVE_FORWARD_TIME_ORIGINAL*1.2],[MOVE_IN_SPIRAL_TIME_ORIGINAL*0.8,MOVE_IN_SPIRAL_TIME_ORIGINAL*1.2],[GO_BACK_TIME_ORIGINAL*0.8,GO_BACK_TIME_ORIGINAL*1.2],[SPIRAL_FACTOR_ORIGINAL*0.8,SPIRAL_FACTOR_ORIGINAL*1.2],[INITIAL_RADIUS_SPIRAL_ORIGINAL*0.8,INITIAL_RADIUS_SPIRAL_ORIGINAL*1.2]])
 
-ga_instance.run()
+if __name__ == '__main__':
+    cache = EvaluationCache(cache_path, tolerance=cache_tolerance)
+    evaluator = CachedEvaluator(ParallelEvaluator(seeds=replicate_seeds), cache)
+    if use_surrogate:
+        # The surrogate model starts from the evaluations cached by previous runs
+        lower_bound = 0.8 * np.array([MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL])
+        upper_bound = 1.2 * np.array([MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL])
+        evaluator = SurrogateEvaluator(evaluator, lower_bound, upper_bound, screen_fraction)
+        evaluator.load_archive(*cache.get_archive(replicate_seeds, len(replicate_seeds)))
+    gene_space = [[MOVE_FORWARD_TIME*0.8,MOVE_FORWARD_TIME*1.2],[MOVE_IN_SPIRAL_TIME*0.8,MOVE_IN_SPIRAL_TIME*1.2],[GO_BACK_TIME*0.8,GO_BACK_TIME*1.2],[SPIRAL_FACTOR*0.8,SPIRAL_FACTOR*1.2],[INITIAL_RADIUS_SPIRAL*0.8,INITIAL_RADIUS_SPIRAL*1.2]]
+    batch_evaluator = evaluator
+    initial_population = None
+    if use_successive_halving:
+        batch_evaluator = SuccessiveHalvingEvaluator(evaluator, fidelities, eta)
+        if not os.path.exists(checkpoint_path):
+            # The initial population is the best of a larger random pool, screened at low fidelity
+            bounds = np.array(gene_space)
+            pool = np.random.uniform(bounds[:, 0], bounds[:, 1], (initial_pool_factor * sol_per_pop, num_genes))
+            initial_population = np.array(screen_population(evaluator, pool, sol_per_pop, fidelities, eta)[0])
+    ga_instance = pygad.GA(num_generations=num_generations,
+                           num_parents_mating=num_parents_mating,
+                           fitness_func=fitness_function,
+                           sol_per_pop=sol_per_pop,
+                           num_genes=num_genes,
+                           initial_population=initial_population,
+                           init_range_low=init_range_low,
+                           init_range_high=init_range_high,
+                           parent_selection_type=parent_selection_type,
+                           keep_parents=keep_parents,
+                           crossover_type=crossover_type,
+                           mutation_type=mutation_type,
+                           mutation_percent_genes=mutation_percent_genes,
+                           fitness_batch_size=sol_per_pop,
+                           gene_space=gene_space,
+                           on_generation=on_generation)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        # The population goes on from the checkpoint, and pygad runs num_generations more generations after the
+        # ones already completed
+        ga_instance = checkpoint['ga_instance']
+        resumed_fitness = ga_instance.last_generation_fitness
+        ga_instance.num_generations = num_generations - ga_instance.generations_completed
+        if use_surrogate:
+            evaluator.set_state(checkpoint['surrogate'])
+        print('Resuming from', checkpoint_path, 'after', ga_instance.generations_completed, 'generations')
 
+    ga_instance.run()
+    # The run has finished, so the next one starts from scratch
+    remove_checkpoint(checkpoint_path)
+    print('Cache:', cache.get_statistics())
+    if use_surrogate:
+        print('Surrogate:', evaluator.get_statistics())
+    if use_successive_halving:
+        print('Successive halving:', batch_evaluator.get_statistics())
 
-solution, solution_fitness, solution_idx = ga_instance.best_solution()
-print("Parameters of the best solution : {solution}".format(solution=solution))
-print("Fitness value of the best solution = {solution_fitness}".format(solution_fitness=solution_fitness))
+    # The fitness of the last generation is reused, since the evaluator is closed afterwards
+    solution, solution_fitness, solution_idx = ga_instance.best_solution(pop_fitness=ga_instance.last_generation_fitness)
+    evaluator.close()
+    print("Parameters of the best solution : {solution}".format(solution=solution))
+    print("Fitness value of the best solution = {solution_fitness}".format(solution_fitness=solution_fitness))
 
 #prediction = np.sum(np.array(function_inputs)*solution)
 #print("Predicted output based on the best solution : {prediction}".format(prediction=prediction))
@@ -0,0 +1,272 @@
+import numpy as np
+from constants import *
+from footprint import Footprint
+from coverage_grid import PackedCoverageGrids, pack_mask
+
+
+class BatchSimulation(object):
+    """
+    Simulates many independent roomba episodes in lockstep, with the state of every episode stored in NumPy arrays.
+
+    Each episode follows the same rules as an episode of simulacao: the robot starts in the center of the room,
+    is controlled by a freshly built RoombaBehaviorTree and finishes when the coverage target or the time limit
+    is reached. Finished episodes are retired from the active mask and no longer simulated.
+    Each episode draws its rotations from its own random number generator, in the same order as RotateNode, so an
+    episode with a given seed is identical to run_replicate with that seed.
+    """
+    def __init__(self, parameters, seeds=None, roomba_radius=ROOMBA_RADIUS, cell_size=PIX2M):
+        """
+        Creates the batch simulation.
+
+        :param parameters: behavior parameters of each episode, one row of (move_forward_time, move_in_spiral_time,
+        go_back_time, spiral_factor, initial_radius_spiral) per episode.
+        :type parameters: numpy array.
+        :param seeds: seed of the random number generator of each episode, or None to seed them from fresh entropy.
+        :type seeds: list of int.
+        :param roomba_radius: the robots' radius.
+        :type roomba_radius: float.
+        :param cell_size: side of a cell of the coverage grids, in meters.
+        :type cell_size: float.
+        """
+        parameters = np.atleast_2d(np.asarray(parameters, dtype=float))
+        self.num_episodes = parameters.shape[0]
+        self.move_forward_time = parameters[:, 0].copy()
+        self.move_in_spiral_time = parameters[:, 1].copy()
+        self.go_back_time = parameters[:, 2].copy()
+        self.spiral_factor = parameters[:, 3].copy()
+        self.initial_radius_spiral = parameters[:, 4].copy()
+        self.roomba_radius = roomba_radius
+        if seeds is None:
+            seeds = np.random.SeedSequence().spawn(self.num_episodes)
+        self.rngs = [np.random.default_rng(seed) for seed in seeds]
+
+        num_episodes = self.num_episodes
+        # Robots' state
+        self.x = np.full(num_episodes, PIX2M * SCREEN_WIDTH / 2.0)
+        self.y = np.full(num_episodes, PIX2M * SCREEN_HEIGHT / 2.0)
+        self.rotation = np.zeros(num_episodes)
+        self.linear_speed = np.zeros(num_episodes)
+        self.angular_speed = np.zeros(num_episodes)
+        # Behavior tree's state: the running leaf, how many ticks it has run and the parameters of the rotation
+        self.node = np.full(num_episodes, NO_NODE)
+        self.node_ticks = np.zeros(num_episodes, dtype=int)
+        self.rotation_time = np.zeros(num_episodes)
+        self.rotation_signal = np.ones(num_episodes)
+        # Coverage grids, one bit per cell and per episode, with a margin as wide as the footprint
+        self.footprint = Footprint(roomba_radius, 1.0 / cell_size)
+        self.packed_footprint = pack_mask(self.footprint.mask)
+        self.coverage = PackedCoverageGrids(num_episodes, cell_size, margin=self.footprint.half_size)
+        # Episodes' bookkeeping
+        self.active = np.ones(num_episodes, dtype=bool)
+        self.times = np.zeros(num_episodes)
+        self.t = 0
+
+    def run(self):
+        """
+        Runs the simulation until every episode has finished.
+
+        :return: the time each episode needed to reach the coverage target (or the time limit).
+        :rtype: numpy array.
+        """
+        while self.active.any():
+            self.step()
+        return self.times
+
+    def step(self):
+        """
+        Advances every active episode by one time step.
+        """
+        episodes = np.flatnonzero(self.active)
+        if self.t > MAX_EPISODE_TIME:
+            self.retire(episodes)
+            return
+        self.stamp(episodes)
+        finished = self.coverage.cleaned_cells[episodes] / self.coverage.total_cells >= COVERAGE_TARGET
+        self.retire(episodes[finished])
+        episodes = episodes[~finished]
+
+        self.t += SAMPLE_TIME
+        bumper_state = self.check_collision(episodes)
+        self.update_behavior(episodes, bumper_state)
+        self.move(episodes)
+
+    def retire(self, episodes):
+        """
+        Removes finished episodes from the active mask, recording their times.
+
+        :param episodes: indices of the finished episodes.
+        :type episodes: numpy array.
+        """
+        self.times[episodes] = self.t
+        self.active[episodes] = False
+
+    def stamp(self, episodes):
+        """
+        Marks the area under the robots as clean.
+
+        :param episodes: indices of the episodes to be stamped.
+        :type episodes: numpy array.
+        """
+        rows, cols = self.coverage.get_cell(self.x[episodes], self.y[episodes])
+        half_size = self.footprint.half_size
+        self.coverage.stamp_mask(episodes, rows - half_size, cols - half_size, self.packed_footprint)
+
+    def check_collision(self, episodes):
+        """
+        Checks collision between the robots and the walls, moving the robots back inside the room.
+
+        :param episodes: indices of the episodes to be checked.
+        :type episodes: numpy array.
+        :return: the bumper state of each episode.
+        :rtype: numpy array.
+        """
+        width = SCREEN_WIDTH * PIX2M
+        height = SCREEN_HEIGHT * PIX2M
+        radius = self.roomba_radius
+        x = self.x[episodes]
+        y = self.y[episodes]
+        hit_left = x - radius <= 0.0
+        hit_right = x + radius >= width
+        hit_top = y - radius <= 0.0
+        hit_bottom = y + radius >= height
+        x[hit_left] = radius
+        x[hit_right] = width - radius
+        y[hit_top] = radius
+        y[hit_bottom] = height - radius
+        self.x[episodes] = x
+        self.y[episodes] = y
+        return hit_left | hit_right | hit_top | hit_bottom
+
+    def update_behavior(self, episodes, bumper_state):
+        """
+        Executes one tick of RoombaBehaviorTree for each episode.
+
+        A tick may run more than one leaf (e.g. MoveForward fails and GoBack starts in the same tick), so the
+        leaves are executed in passes until every episode has a running leaf or has finished the tree.
+
+        :param episodes: indices of the episodes to be updated.
+        :type episodes: numpy array.
+        :param bumper_state: the bumper state of each episode.
+        :type bumper_state: numpy array.
+        """
+        node = self.node[episodes]
+        node_ticks = self.node_ticks[episodes]
+        linear_speed = np.zeros(len(episodes))
+        angular_speed = np.zeros(len(episodes))
+        # The root selector starts again from its first leaf when it is not running any child
+        entering = node == NO_NODE
+        node[entering] = MOVE_FORWARD
+        node_ticks[entering] = 0
+
+        pending = np.ones(len(episodes), dtype=bool)
+        while pending.any():
+            node_ticks[pending] += 1
+            t = node_ticks * SAMPLE_TIME
+            move_forward = pending & (node == MOVE_FORWARD)
+            move_in_spiral = pending & (node == MOVE_IN_SPIRAL)
+            go_back = pending & (node == GO_BACK)
+            rotate = pending & (node == ROTATE)
+            pending[:] = False
+
+            # MoveForward fails when hitting a wall and succeeds after its time, starting the spiral
+            linear_speed[move_forward] = FORWARD_SPEED
+            angular_speed[move_forward] = 0.0
+            failure = move_forward & bumper_state
+            success = move_forward & ~bumper_state & (t > self.move_forward_time[episodes])
+            self.enter(node, node_ticks, failure, GO_BACK)
+            self.enter(node, node_ticks, success, MOVE_IN_SPIRAL)
+            pending |= failure | success
+
+            # MoveInSpiral finishes the tree after its time and fails when hitting a wall
+            radius = self.initial_radius_spiral[episodes] + self.spiral_factor[episodes] * t
+            linear_speed[move_in_spiral] = FORWARD_SPEED
+            angular_speed[move_in_spiral] = FORWARD_SPEED / radius[move_in_spiral]
+            success = move_in_spiral & (t > self.move_in_spiral_time[episodes])
+            failure = move_in_spiral & ~success & bumper_state
+            node[success] = NO_NODE
+            self.enter(node, node_ticks, failure, GO_BACK)
+            pending |= failure
+
+            # GoBack succeeds after its time, starting the rotation
+            linear_speed[go_back] = BACKWARD_SPEED
+            angular_speed[go_back] = 0.0
+            success = go_back & (t > self.go_back_time[episodes])
+            self.enter(node, node_ticks, success, ROTATE)
+            for episode in episodes[success]:
+                rng = self.rngs[episode]
+                self.rotation_time[episode] = 3.0 * rng.random()
+                self.rotation_signal[episode] = -1 if rng.random() < 0.5 else 1
+            pending |= success
+
+            # Rotate finishes the tree after its random time
+            linear_speed[rotate] = 0.0
+            angular_speed[rotate] = self.rotation_signal[episodes[rotate]] * ANGULAR_SPEED
+            success = rotate & (t > self.rotation_time[episodes])
+            node[success] = NO_NODE
+
+        self.node[episodes] = node
+        self.node_ticks[episodes] = node_ticks
+        self.linear_speed[episodes] = np.clip(linear_speed, -MAX_LINEAR_SPEED, MAX_LINEAR_SPEED)
+        self.angular_speed[episodes] = np.clip(angular_speed, -MAX_ANGULAR_SPEED, MAX_ANGULAR_SPEED)
+
+    @staticmethod
+    def enter(node, node_ticks, mask, new_node):
+        """
+        Enters a new leaf in the masked episodes.
+
+        :param node: running leaf of each episode.
+        :type node: numpy array.
+        :param node_ticks: ticks the running leaf of each episode has run.
+        :type node_ticks: numpy array.
+        :param mask: episodes entering the new leaf.
+        :type mask: numpy array.
+        :param new_node: code of the leaf being entered.
+        :type new_node: int.
+        """
+        node[mask] = new_node
+        node_ticks[mask] = 0
+
+    def move(self, episodes):
+        """
+        Moves the robots during one time step, using the same equations as Roomba.move.
+
+        :param episodes: indices of the episodes to be moved.
+        :type episodes: numpy array.
+        """
+        dt = SAMPLE_TIME
+        v = self.linear_speed[episodes]
+        w = self.angular_speed[episodes]
+        rotation = self.rotation[episodes]
+        straight = np.abs(w) < 1.0e-3
+        # Avoiding the division by zero of the straight motion, which uses the limit equation instead
+        w_curve = np.where(straight, 1.0, w)
+        cos_rotation = np.cos(rotation + w * dt / 2.0)
+        sin_rotation = np.sin(rotation + w * dt / 2.0)
+        self.x[episodes] += np.where(straight, v * dt * cos_rotation, (2.0 * v / w_curve) * cos_rotation * np.sin(w * dt / 2.0))
+        self.y[episodes] += np.where(straight, v * dt * sin_rotation, (2.0 * v / w_curve) * sin_rotation * np.sin(w * dt / 2.0))
+        self.rotation[episodes] = rotation + w * dt
+
+
+def simulate_batch(candidates, replicates=3, seeds=None, cell_size=PIX2M):
+    """
+    Evaluates many parameter vectors at once, simulating all their replicate episodes in a single batch.
+
+    :param candidates: parameter vectors to be evaluated, one per row.
+    :type candidates: numpy array.
+    :param replicates: number of episodes simulated for each parameter vector.
+    :type replicates: int.
+    :param seeds: seeds of the replicate episodes, shared by every parameter vector (common random numbers, then
+    the number of seeds is the number of replicates), or None for unseeded episodes.
+    :type seeds: list of int.
+    :param cell_size: side of a cell of the coverage grids, in meters.
+    :type cell_size: float.
+    :return: the mean time of each parameter vector and the times of all its episodes.
+    :rtype: tuple of numpy arrays.
+    """
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=float))
+    if seeds is not None:
+        replicates = len(seeds)
+        seeds = list(seeds) * len(candidates)
+    batch = BatchSimulation(np.repeat(candidates, replicates, axis=0), seeds, cell_size=cell_size)
+    times = batch.run().reshape(len(candidates), replicates)
+    return times.mean(axis=1), times
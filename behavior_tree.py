@@ -4,6 +4,29 @@ import random
 import math
 
 
+def get_remaining_ticks(n, duration, sample_time, max_ticks):
+    """
+    Counts the next ticks in which a leaf's timer has not expired yet, i.e. the leaf keeps running unless an
+    event other than its timer (e.g. a collision) ends it.
+
+    :param n: number of ticks the leaf has already run.
+    :type n: int
+    :param duration: time after which the leaf's timer expires.
+    :type duration: float
+    :param sample_time: duration of a tick.
+    :type sample_time: float
+    :param max_ticks: maximum number of ticks counted.
+    :type max_ticks: int
+    :return: number of remaining ticks, at most max_ticks.
+    :rtype: int
+    """
+    ticks = 0
+    # The same test as the leaves' execute, so the count is exact
+    while ticks < max_ticks and not (n + ticks + 1) * sample_time > duration:
+        ticks += 1
+    return ticks
+
+
 class ExecutionStatus(Enum):
     """
     Represents the execution status of a behavior tree node.
@@ -35,6 +58,18 @@ class BehaviorTree(object):
         if self.root is not None:
             self.root.execute(agent)
 
+    def get_running_leaf_node(self):
+        """
+        Obtains the leaf that is running, i.e. the one the next tick resumes.
+
+        :return: the running leaf, or None if no leaf is running.
+        :rtype: LeafNode
+        """
+        node = self.root
+        while isinstance(node, CompositeNode):
+            node = node.running_child
+        return node
+
 
 class TreeNode(object):
     """
@@ -75,6 +110,30 @@ class LeafNode(TreeNode):
     def __init__(self, node_name):
         super().__init__(node_name)
 
+    def get_remaining_ticks(self, agent, max_ticks):
+        """
+        Counts the next ticks in which this running leaf keeps the velocity it has just set, unless the robot
+        touches a wall. Leaves that do not know it return 0, so they are ticked one time step at a time.
+
+        :param agent: the agent this node is being executed on.
+        :param max_ticks: maximum number of ticks counted.
+        :type max_ticks: int
+        :return: number of remaining ticks, at most max_ticks.
+        :rtype: int
+        """
+        return 0
+
+    def skip(self, agent, ticks):
+        """
+        Advances this running leaf by ticks it would have executed without changing its status, setting the mean
+        velocity of the skipped ticks and of the last executed one.
+
+        :param agent: the agent this node is being executed on.
+        :param ticks: number of skipped ticks, at most get_remaining_ticks.
+        :type ticks: int
+        """
+        raise NotImplementedError("This method must be implemented by leaves whose get_remaining_ticks is not 0")
+
 
 class CompositeNode(TreeNode):
     """
@@ -181,13 +240,19 @@ class RoombaBehaviorTree(BehaviorTree):
     """
     Represents a behavior tree of a roomba cleaning robot.
     """
-    def __init__(self,move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral):
+    def __init__(self,move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral, rng=None):
+        """
+        Creates the behavior tree of a roomba cleaning robot.
+
+        :param rng: random number generator used to draw the rotations (e.g. numpy.random.Generator), or None to
+        use the random module.
+        """
         super().__init__()
         # Todo: construct the tree here
         move_forward = MoveForwardNode(move_foward_time)
         move_in_spiral = MoveInSpiralNode(move_in_spiral_time, spiral_factor, initial_radius_spiral)
         go_back = GoBackNode(go_back_time)
-        rotate = RotateNode()
+        rotate = RotateNode(rng)
         move_sequence = SequenceNode("MoveSequence")
         move_sequence.add_child(move_forward)
         move_sequence.add_child(move_in_spiral)
@@ -216,7 +281,7 @@ class MoveForwardNode(LeafNode):
     def execute(self, agent):
         # Todo: add execution logic
         self.n += 1
-        t = self.n * SAMPLE_TIME
+        t = self.n * agent.sample_time
         if(agent.status == ExecutionStatus.RUNNING):
             agent.set_velocity(FORWARD_SPEED,0)
             if(agent.get_bumper_state()):
@@ -227,6 +292,12 @@ class MoveForwardNode(LeafNode):
                 return ExecutionStatus.RUNNING
         pass
 
+    def get_remaining_ticks(self, agent, max_ticks):
+        return get_remaining_ticks(self.n, self.move_forward_time, agent.sample_time, max_ticks)
+
+    def skip(self, agent, ticks):
+        self.n += ticks
+
 
 class MoveInSpiralNode(LeafNode):
     def __init__(self,move_in_spiral_time, spiral_factor, initial_radius_spiral):
@@ -246,7 +317,7 @@ class MoveInSpiralNode(LeafNode):
     def execute(self, agent):
         # Todo: add execution logic
         self.n += 1
-        t = self.n * SAMPLE_TIME
+        t = self.n * agent.sample_time
         r = self.initial_radius_spiral + self.spiral_factor * t
         #linear_velocity = ANGULAR_SPEED * r
         angular_velocity = FORWARD_SPEED/r
@@ -260,6 +331,19 @@ class MoveInSpiralNode(LeafNode):
                 return ExecutionStatus.RUNNING
         pass
 
+    def get_remaining_ticks(self, agent, max_ticks):
+        return get_remaining_ticks(self.n, self.move_in_spiral_time, agent.sample_time, max_ticks)
+
+    def skip(self, agent, ticks):
+        # The angular speed changes at every tick, so the mean of the (clamped) speeds keeps the final heading
+        angular_speed = agent.angular_speed
+        for k in range(ticks):
+            self.n += 1
+            t = self.n * agent.sample_time
+            agent.set_velocity(FORWARD_SPEED, FORWARD_SPEED / (self.initial_radius_spiral + self.spiral_factor * t))
+            angular_speed += agent.angular_speed
+        agent.set_velocity(FORWARD_SPEED, angular_speed / (ticks + 1))
+
 
 class GoBackNode(LeafNode):
     def __init__(self,go_back_time):
@@ -276,7 +360,7 @@ class GoBackNode(LeafNode):
     def execute(self, agent):
         # Todo: add execution logic
         self.n += 1
-        t = self.n * SAMPLE_TIME
+        t = self.n * agent.sample_time
         if(agent.status == ExecutionStatus.RUNNING):
             agent.set_velocity(BACKWARD_SPEED,0)
             if(t > self.go_back_time ):
@@ -285,27 +369,35 @@ class GoBackNode(LeafNode):
                 return ExecutionStatus.RUNNING
         pass
 
+    def get_remaining_ticks(self, agent, max_ticks):
+        return get_remaining_ticks(self.n, self.go_back_time, agent.sample_time, max_ticks)
+
+    def skip(self, agent, ticks):
+        self.n += ticks
+
 
 class RotateNode(LeafNode):
-    def __init__(self):
+    def __init__(self, rng=None):
         super().__init__("Rotate")
         # Todo: add initialization code
         self.n = 0
-        self.random_time = random.uniform(0,3)
-        self.signal = random.randrange(-1,2,2)
-        
-        
+        # Any object with a random() method works, like the random module or a numpy Generator.
+        # The rotation is only drawn when the node is entered, so that each episode's draws depend on its seed only.
+        self.rng = rng if rng is not None else random
+        self.random_time = 0.0
+        self.signal = 1
+
     def enter(self, agent):
         # Todo: add enter logic
         self.n = 0
-        self.random_time = random.uniform(0,3)
-        self.signal = random.randrange(-1,2,2)
+        self.random_time = 3.0 * self.rng.random()
+        self.signal = -1 if self.rng.random() < 0.5 else 1
         agent.status = ExecutionStatus.RUNNING
 
     def execute(self, agent):
         # Todo: add execution logic
         self.n += 1
-        t = self.n * SAMPLE_TIME
+        t = self.n * agent.sample_time
         if(agent.status == ExecutionStatus.RUNNING):
             agent.set_velocity(0,self.signal*ANGULAR_SPEED)
             if(t > self.random_time):
@@ -314,3 +406,8 @@ class RotateNode(LeafNode):
                 return ExecutionStatus.RUNNING
         pass
 
+    def get_remaining_ticks(self, agent, max_ticks):
+        return get_remaining_ticks(self.n, self.random_time, agent.sample_time, max_ticks)
+
+    def skip(self, agent, ticks):
+        self.n += ticks
@@ -1,64 +1,409 @@
 from utils import Pose
-from constants import FREQUENCY, SAMPLE_TIME, SCREEN_HEIGHT, SCREEN_WIDTH, PIX2M, M2PIX
+from constants import FREQUENCY, SAMPLE_TIME, SCREEN_HEIGHT, SCREEN_WIDTH, PIX2M, M2PIX, COVERAGE_TARGET, MAX_EPISODE_TIME, ROOMBA_RADIUS
+from constants import FORWARD_SPEED, BACKWARD_SPEED, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED
 from roomba import Roomba
-from simulation import *
+from simulation import Simulation, draw
 from behavior_tree import RoombaBehaviorTree
+from compiled_behavior_tree import CompiledBehaviorTree
+from coverage_grid import CoverageTracker, get_grid_shape
+from footprint import Footprint
+from trajectory import TrajectoryRecorder
+from episode_stats import EpisodeStats
 import numpy as np
+import random
+import time
+from math import ceil
 
-def simulacao(move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral):
 
-    behavior = RoombaBehaviorTree(move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral)
-    pose = Pose(PIX2M * SCREEN_WIDTH / 2.0, PIX2M * SCREEN_HEIGHT / 2.0, 0.0)
-    roomba_radius = 0.34/2.0
-    roomba = Roomba(pose, 1.0, 2.0, roomba_radius, behavior)
+class CensoredTime(float):
+    """
+    Time of an episode (or mean time of several episodes) that was aborted because it could not beat a cutoff.
 
-    # Notacao:
-    # 0: não foi limpo
-    # 1: já foi limpo
-    
-    pixeis_totais = SCREEN_HEIGHT*SCREEN_WIDTH
-    
-    n = 3  # número de amostras da simulação utilizadas para cálculo do tempo médio
-    tempo = n * [0]
-    for k in range(len(tempo)):
-        roomba.pose = Pose(PIX2M * SCREEN_WIDTH / 2.0, PIX2M * SCREEN_HEIGHT / 2.0, 0.0)
-        simulation = Simulation(roomba)
-        
-        pygame.init()
+    Its value is a lower bound of the time that would have been measured, and it is always above the cutoff.
+    Being a float, it can be used wherever a time is expected; isinstance tells it apart from a measured time.
+    """
+    censored = True
 
-        window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
-        pygame.display.set_caption("Exame")
+def get_max_new_cells(footprint, sample_time=SAMPLE_TIME, swept=False):
+    """
+    Computes the maximum number of cells the robot may newly clean in one time step.
+
+    Between two stamps the robot moves at most FORWARD_SPEED * sample_time, plus as much again when a wall pushes
+    it back into the room, so the bound is the largest area a shifted footprint uncovers (or the area swept along
+    such a path, with swept stamps). A swept stamp spanning several time steps (see run_episode) cleans at most
+    the bound of each of them, since the walls only push the robot back before the first one.
+
+    :param footprint: cells cleaned around the robot.
+    :type footprint: Footprint
+    :param sample_time: duration of a time step.
+    :type sample_time: float
+    :param swept: if the area swept during the time steps is stamped (see run_episode).
+    :type swept: bool
+    :return: maximum number of newly cleaned cells per time step.
+    :rtype: int
+    """
+    max_speed = max(abs(FORWARD_SPEED), abs(BACKWARD_SPEED))
+    if swept:
+        return footprint.get_max_swept_cells(2.0 * max_speed * sample_time)
+    return footprint.get_max_new_cells(int(ceil(2.0 * max_speed * sample_time * footprint.m2pix)))
+
+
+def get_max_ticks(sample_time):
+    """
+    Computes how many time steps of SAMPLE_TIME make up a longer time step, which is the longest step of the
+    episodes with swept stamps (see run_episode).
+
+    :param sample_time: duration of the longer time step.
+    :type sample_time: float
+    :return: number of time steps, at least 1.
+    :rtype: int
+    """
+    return max(1, int(round(sample_time / SAMPLE_TIME)))
+
 
+def get_time_bound(t, missing_cells, max_new_cells, sample_time=SAMPLE_TIME, max_time=MAX_EPISODE_TIME):
+    """
+    Computes a lower bound of the time an episode will finish at.
+
+    :param t: current time of the episode.
+    :type t: float
+    :param missing_cells: number of cells that still have to be cleaned to reach the coverage target.
+    :type missing_cells: int
+    :param max_new_cells: maximum number of newly cleaned cells per time step.
+    :type max_new_cells: int
+    :param sample_time: duration of a time step.
+    :type sample_time: float
+    :param max_time: time limit of the episode.
+    :type max_time: float
+    :return: lower bound of the episode's time.
+    :rtype: float
+    """
+    return min(t + ceil(missing_cells / max_new_cells) * sample_time, max_time)
+
+
+def get_min_episode_time(footprint=None, sample_time=SAMPLE_TIME, max_time=MAX_EPISODE_TIME, swept=False):
+    """
+    Computes a lower bound of the time of any episode, which starts with the robot in the center of the room.
+
+    :param footprint: cells cleaned around the robot, built from ROOMBA_RADIUS if not given.
+    :type footprint: Footprint
+    :param sample_time: duration of a time step, SAMPLE_TIME with swept stamps.
+    :type sample_time: float
+    :param max_time: time limit of the episode.
+    :type max_time: float
+    :param swept: if the area swept during the time steps is stamped (see run_episode).
+    :type swept: bool
+    :return: lower bound of the episode's time.
+    :rtype: float
+    """
+    if footprint is None:
+        footprint = Footprint(ROOMBA_RADIUS, M2PIX)
+    if swept:
+        # Episodes with swept stamps may stamp after every time step of SAMPLE_TIME (see run_replicate)
+        sample_time = SAMPLE_TIME
+    coverage = CoverageTracker(*get_grid_shape(footprint.m2pix))
+    target_cells = coverage.get_target_cells(COVERAGE_TARGET)
+    initial_cells = footprint.num_cells
+    if swept:
+        initial_cells = footprint.stamp_swept(coverage, PIX2M * SCREEN_WIDTH / 2.0, PIX2M * SCREEN_HEIGHT / 2.0, 0.0,
+                                              0.0, 0.0, 0.0)
+    return get_time_bound(0.0, target_cells - initial_cells, get_max_new_cells(footprint, sample_time, swept),
+                          sample_time, max_time)
+
+
+def run_episode(simulation, footprint=None, window=None, time_cutoff=None, recorder=None, stats=None, max_time=MAX_EPISODE_TIME,
+                swept=False, max_ticks=1):
+    """
+    Runs one episode of the simulation until the coverage target or the time limit is reached.
+    The time step is the roomba's sample time, and the coverage grid has the footprint's cell size.
+
+    By default, the footprint is stamped at the robot's position after each time step, which leaves gaps between
+    the stamps when the robot moves more than a cell per step. With swept, the whole area swept by the robot
+    during the step is stamped instead. Then a step may also span up to max_ticks time steps of the roomba (see
+    Roomba.update): it ends early where the running leaf's timer expires or the robot may touch a wall, so longer
+    steps (e.g. 5 to 10 Hz) still simulate the events at the roomba's time steps, and the coverage of the
+    continuous motion.
+
+    With a time cutoff, the episode is aborted as soon as a lower bound of its time (the current time plus the
+    uncovered area divided by the maximum sweep rate) exceeds the cutoff, and the bound is returned as a CensoredTime.
+
+    :param simulation: the simulation of the roomba being evaluated.
+    :type simulation: Simulation
+    :param footprint: cells cleaned around the robot, built from the robot's radius if not given.
+    :type footprint: Footprint
+    :param window: pygame's window used to draw the episode, or None to run headless.
+    :param time_cutoff: time above which the episode is aborted, or None to always run it to the end.
+    :type time_cutoff: float
+    :param recorder: recorder of the robot's state after every time step, or None to not record the episode.
+    :type recorder: TrajectoryRecorder
+    :param stats: statistics where the time of each phase of the time steps is accumulated, or None to not
+    measure it.
+    :type stats: EpisodeStats
+    :param max_time: time limit of the episode.
+    :type max_time: float
+    :param swept: if the area swept during each time step is stamped, instead of the footprint at its end.
+    :type swept: bool
+    :param max_ticks: maximum number of time steps of the roomba per step of the episode, used with swept only.
+    :type max_ticks: int
+    :return: the time needed to clean the area.
+    :rtype: float
+    """
+    roomba = simulation.roomba
+    sample_time = roomba.sample_time
+    if footprint is None:
+        footprint = Footprint(roomba.radius, M2PIX)
+    # Notacao:
+    # False: não foi limpo
+    # True: já foi limpo
+    limpeza = CoverageTracker(*get_grid_shape(footprint.m2pix))
+    if time_cutoff is not None:
+        target_cells = limpeza.get_target_cells(COVERAGE_TARGET)
+        max_new_cells = get_max_new_cells(footprint, sample_time, swept)
+    if window is not None:
+        import pygame
         clock = pygame.time.Clock()
-        
-        limpeza = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH))
-        t = 0
-        run = True
-        while run:
-            clock.tick(FREQUENCY)
-            for i in range(3000):
-                if t > 300:
-                    tempo[k] = t
-                    run = False
-                    break
-                    
-                for height in range(int(roomba_radius*M2PIX + 1)):
-                    for width in range(int(roomba_radius*M2PIX + 1)):
-                        limpeza[int(roomba.pose.position.y*M2PIX - (roomba_radius*M2PIX + 1)/2 + width)][int(roomba.pose.position.x*M2PIX - (roomba_radius*M2PIX + 1)/2 + height)] = 1
-                if np.count_nonzero(limpeza)/pixeis_totais >= 0.6:
-                    tempo[k] = t
-                    run = False
-                    break
-                    
+    if stats is not None:
+        timer = time.perf_counter
+        phase_times = stats.phase_times
+        stats.start_episode()
+        episode_start = timer()
+    if not swept:
+        max_ticks = 1
+    t = 0
+    ticks = 1
+    step = 0
+    try:
+        while True:
+            if window is not None and step % 3000 == 0:
+                clock.tick(FREQUENCY)
+            step += 1
+            if t > max_time:
+                return t
+
+            if stats is not None:
+                phase_start = timer()
+            if swept:
+                # The motion of the last step, traced back from the current pose
+                footprint.stamp_swept(limpeza, roomba.pose.position.x, roomba.pose.position.y, roomba.pose.rotation,
+                                      roomba.linear_speed, roomba.angular_speed, -ticks * sample_time)
+            else:
+                footprint.stamp(limpeza, roomba.pose.position.x, roomba.pose.position.y)
+            if stats is not None:
+                stamp_end = timer()
+                phase_times['stamp'] += stamp_end - phase_start
+            if limpeza.has_reached(COVERAGE_TARGET):
+                return t
+            if time_cutoff is not None:
+                time_bound = get_time_bound(t, target_cells - limpeza.cleaned_cells, max_new_cells, sample_time, max_time)
+                if time_bound > time_cutoff:
+                    return CensoredTime(time_bound)
+            if stats is not None:
+                phase_times['coverage_check'] += timer() - stamp_end
+
+            if window is not None:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
-                        run = False
-                t += SAMPLE_TIME
-                simulation.update()
+                        return t
+            ticks = simulation.update(stats, max_ticks)
+            # Adding one time step at a time keeps the same times as ticking every step
+            for k in range(ticks):
+                t += sample_time
+            if recorder is not None:
+                recorder.record(t, roomba)
+            if window is not None:
+                if stats is not None:
+                    phase_start = timer()
                 draw(simulation, window)
+                if stats is not None:
+                    phase_times['draw'] += timer() - phase_start
+    finally:
+        if stats is not None:
+            stats.episode_time += timer() - episode_start
 
-        pygame.quit()
+
+def run_replicate(parameters, seed=None, footprint=None, window=None, time_cutoff=None, record_path=None, stats=None,
+                  fidelity=None):
+    """
+    Runs one independent replicate episode, with its own roomba and behavior tree.
+
+    :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral).
+    :type parameters: tuple
+    :param seed: seed (or numpy.random.Generator) of the random numbers drawn by the behavior tree, or None to use
+    the random module. Episodes with the same seed and parameters are identical.
+    :type seed: int
+    :param footprint: cells cleaned around the robot.
+    :type footprint: Footprint
+    :param window: pygame's window used to draw the episode, or None to run headless.
+    :param time_cutoff: time above which the episode is aborted, returning a CensoredTime.
+    :type time_cutoff: float
+    :param record_path: path of the trajectory file where the episode is recorded (see trajectory.py), or None to
+    not record it.
+    :type record_path: str
+    :param stats: statistics where the time of each phase of the episode is accumulated, or None to not measure it.
+    :type stats: EpisodeStats
+    :param fidelity: time step, cell size, stamping and time limit of the episode (see multi_fidelity.py), or None
+    for the full fidelity. The footprint, if given, must have the fidelity's cell size.
+    :type fidelity: Fidelity
+    :return: the time needed to clean the area.
+    :rtype: float
+    """
+    sample_time, max_time, swept, max_ticks = SAMPLE_TIME, MAX_EPISODE_TIME, False, 1
+    if fidelity is not None:
+        sample_time, max_time, swept = fidelity.sample_time, fidelity.max_time, fidelity.swept
+        if swept:
+            # The roomba keeps the full fidelity's time step, and the episode's steps span several of them
+            sample_time, max_ticks = SAMPLE_TIME, get_max_ticks(fidelity.sample_time)
+        if footprint is None:
+            footprint = Footprint(ROOMBA_RADIUS, fidelity.m2pix)
+    rng = None if seed is None else np.random.default_rng(seed)
+    # The compiled tree ticks the same leaves without walking the composite nodes, which is faster
+    behavior = CompiledBehaviorTree(RoombaBehaviorTree(*parameters, rng=rng))
+    pose = Pose(PIX2M * SCREEN_WIDTH / 2.0, PIX2M * SCREEN_HEIGHT / 2.0, 0.0)
+    roomba = Roomba(pose, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED, ROOMBA_RADIUS, behavior, sample_time)
+    # The movement history is only needed to draw the episode
+    simulation = Simulation(roomba, 2000 if window is not None else 0)
+    if record_path is None:
+        return run_episode(simulation, footprint, window, time_cutoff, stats=stats, max_time=max_time, swept=swept,
+                           max_ticks=max_ticks)
+    recorder = TrajectoryRecorder(int(ceil(max_time / sample_time)) + 2)
+    t = run_episode(simulation, footprint, window, time_cutoff, recorder, stats, max_time, swept, max_ticks)
+    recorder.save(record_path, {'seed': int(seed) if isinstance(seed, (int, np.integer)) else None,
+                                'parameters': [float(parameter) for parameter in parameters],
+                                'node_names': behavior.node_names, 'sample_time': sample_time,
+                                'radius': ROOMBA_RADIUS, 'time': float(t),
+                                'censored': isinstance(t, CensoredTime)})
+    return t
+
+
+def _run_seeded_replicate(task):
+    """
+    Runs a replicate episode described by a (parameters, seed, time_cutoff, record_path, profile, fidelity) tuple,
+    in a worker process. When profiling, the episode's time is returned with its EpisodeStats.
+    """
+    parameters, seed, time_cutoff, record_path, profile, fidelity = task
+    if not profile:
+        return run_replicate(parameters, seed, time_cutoff=time_cutoff, record_path=record_path, fidelity=fidelity)
+    stats = EpisodeStats()
+    return run_replicate(parameters, seed, time_cutoff=time_cutoff, record_path=record_path, stats=stats,
+                         fidelity=fidelity), stats
+
+
+def get_record_path(record, k):
+    """
+    Obtains the path of the trajectory file of a replicate episode.
+
+    :param record: prefix of the trajectory files, or None if the episodes are not recorded.
+    :type record: str
+    :param k: index of the replicate.
+    :type k: int
+    :return: path of the trajectory file, or None.
+    :rtype: str
+    """
+    return None if record is None else '{}_{}.npy'.format(record, k)
+
+
+def summarize_replicates(tempo):
+    """
+    Reduces the times of the replicate episodes to their mean, printing them.
+    If any time is censored, the mean is only a lower bound and is returned as a CensoredTime.
+
+    :param tempo: times of the replicate episodes.
+    :type tempo: list of float
+    :return: mean time of the episodes.
+    :rtype: float
+    """
+    if any(isinstance(time, CensoredTime) for time in tempo):
+        print('Média (censurada): >',np.mean(tempo),'Tempos: ',tempo)
+        return CensoredTime(np.mean(tempo))
     print('Média: ',np.mean(tempo),'Tempos: ',tempo)
     return np.mean(tempo)
 
+
+def simulacao(move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral, render=False, executor=None, n=3, seeds=None, cutoff=None, record=None, stats=None, fidelity=None):
+    """
+    Computes the mean time the roomba needs to clean 60% of the area with the given behavior parameters.
+
+    By default the episodes run headless, as fast as possible, without importing pygame.
+    Setting render draws every step in a pygame window, which is useful for debugging only.
+    The replicate episodes are independent, so they may run in parallel in the worker processes of an executor;
+    each one then gets its own seed, drawn from the random module of the calling process.
+    Passing the same seeds when evaluating different parameters compares them under common random numbers.
+
+    With a cutoff (e.g. the cost of the best parameters known so far), the episodes are aborted as soon as the
+    times already measured plus lower bounds of the remaining ones prove that the mean time is above the cutoff.
+    The result is then a CensoredTime, a lower bound of the mean time that is above the cutoff, so an optimizer
+    comparing it with the cutoff's owner still makes the right decision.
+
+    :param render: if the episodes should be drawn in a pygame window.
+    :type render: bool
+    :param executor: executor (e.g. concurrent.futures.ProcessPoolExecutor or multiprocessing.Pool) used to run
+    the replicates in parallel, or None to run them one after the other.
+    :param n: number of replicate episodes used to compute the mean time.
+    :type n: int
+    :param seeds: seeds of the replicate episodes (then n is the number of seeds), or None for unseeded episodes.
+    :type seeds: list of int
+    :param cutoff: mean time above which the evaluation is aborted, or None to run every episode to the end.
+    :type cutoff: float
+    :param record: prefix of the trajectory files where the episodes are recorded, replicate k being saved in
+    record + '_k.npy' (see replay.py), or None to not record them.
+    :type record: str
+    :param stats: statistics where the time of each phase of the episodes is accumulated (see episode_stats.py),
+    or None to not measure it.
+    :type stats: EpisodeStats
+    :param fidelity: time step, cell size, stamping and time limit of the episodes (see multi_fidelity.py), e.g.
+    Fidelity(sample_time=0.1, swept=True) to simulate at 10 Hz, or None for the full fidelity. Its replicates are
+    ignored: the number of episodes is n or the number of seeds.
+    :type fidelity: Fidelity
+    :return: mean time of the episodes.
+    :rtype: float
+    """
+    parameters = (move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral)
+    footprint = Footprint(ROOMBA_RADIUS, M2PIX if fidelity is None else fidelity.m2pix)
+    episode_bounds = (footprint,) if fidelity is None else (footprint, fidelity.sample_time, fidelity.max_time, fidelity.swept)
+    if executor is not None:
+        if render:
+            raise ValueError("Replicates running in parallel cannot be rendered")
+        if seeds is None:
+            seeds = [random.getrandbits(32) for k in range(n)]
+        time_cutoff = None
+        if cutoff is not None:
+            # The episodes run at the same time, so each one assumes the others take their minimum time
+            time_cutoff = len(seeds) * cutoff - (len(seeds) - 1) * get_min_episode_time(*episode_bounds)
+        tasks = [(parameters, seed, time_cutoff, get_record_path(record, k), stats is not None, fidelity)
+                 for k, seed in enumerate(seeds)]
+        tempo = list(executor.map(_run_seeded_replicate, tasks))
+        if stats is not None:
+            for result in tempo:
+                stats.merge(result[1])
+            tempo = [result[0] for result in tempo]
+        return summarize_replicates(tempo)
+
+    if cutoff is not None:
+        min_episode_time = get_min_episode_time(*episode_bounds)
+    window = None
+    if render:
+        import pygame
+        pygame.init()
+        window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Exame")
+
+    if seeds is None:
+        seeds = n * [None]  # n: número de amostras da simulação utilizadas para cálculo do tempo médio
+    tempo = len(seeds) * [0]
+    for k in range(len(tempo)):
+        time_cutoff = None
+        if cutoff is not None:
+            # Time left for this episode after the finished ones, assuming the next ones take their minimum time
+            time_cutoff = len(tempo) * cutoff - sum(tempo[:k]) - (len(tempo) - k - 1) * min_episode_time
+        tempo[k] = run_replicate(parameters, seeds[k], footprint, window, time_cutoff, get_record_path(record, k), stats,
+                                 fidelity)
+        if isinstance(tempo[k], CensoredTime):
+            # The mean cannot beat the cutoff anymore, so the next episodes are not run
+            tempo[k + 1:] = [CensoredTime(min_episode_time) for i in range(k + 1, len(tempo))]
+            break
+
+    if render:
+        pygame.quit()
+    return summarize_replicates(tempo)
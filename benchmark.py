@@ -0,0 +1,248 @@
+import os
+# The benchmarks never open a window, but pygame must not need a display if anything imports it
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+from utils import Pose
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT, PIX2M, M2PIX, COVERAGE_TARGET, ROOMBA_RADIUS, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED
+from constants import MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL
+from roomba import Roomba
+from simulation import Simulation
+from behavior_tree import RoombaBehaviorTree
+from compiled_behavior_tree import CompiledBehaviorTree
+from coverage_grid import CoverageTracker
+from footprint import Footprint
+from behavior_tree_test import run_replicate
+
+
+parameters = (MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL)
+baseline_path = 'benchmark_baseline.json'  # baseline of this machine, written by --save
+
+
+def make_roomba(behavior=None, seed=1):
+    """
+    Creates a roomba in the center of the room, like run_replicate.
+
+    :param behavior: the robot's behavior, by default the compiled RoombaBehaviorTree with the default parameters.
+    :param seed: seed of the random numbers drawn by the behavior tree.
+    :type seed: int
+    :return: the roomba.
+    :rtype: Roomba
+    """
+    if behavior is None:
+        behavior = CompiledBehaviorTree(RoombaBehaviorTree(*parameters, rng=np.random.default_rng(seed)))
+    pose = Pose(PIX2M * SCREEN_WIDTH / 2.0, PIX2M * SCREEN_HEIGHT / 2.0, 0.0)
+    return Roomba(pose, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED, ROOMBA_RADIUS, behavior)
+
+
+def bench_roomba_move(steps):
+    """
+    Moves a roomba along an arc.
+    """
+    roomba = make_roomba()
+    roomba.set_velocity(0.5, 0.3)
+    move = roomba.move
+    start = time.perf_counter()
+    for i in range(steps):
+        move()
+    return time.perf_counter() - start
+
+
+def bench_check_collision(steps):
+    """
+    Checks the collisions of a roomba that touches a wall in half of the steps.
+    """
+    simulation = Simulation(make_roomba(), 0)
+    position = simulation.roomba.pose.position
+    check_collision = simulation.check_collision
+    start = time.perf_counter()
+    for i in range(steps):
+        position.x = 0.0 if i % 2 else 1.0
+        check_collision()
+    return time.perf_counter() - start
+
+
+def bench_simulation_update(steps):
+    """
+    Updates a headless simulation, i.e. the collision check, the behavior tick and the movement of each step.
+    """
+    simulation = Simulation(make_roomba(), 0)
+    update = simulation.update
+    start = time.perf_counter()
+    for i in range(steps):
+        update()
+    return time.perf_counter() - start
+
+
+def bench_behavior_tree_update(steps):
+    """
+    Ticks RoombaBehaviorTree, walking the node objects, with the bumper pressed in some steps.
+    """
+    roomba = make_roomba(RoombaBehaviorTree(*parameters, rng=np.random.default_rng(1)))
+    update = roomba.behavior.update
+    start = time.perf_counter()
+    for i in range(steps):
+        roomba.bumper_state = i % 500 == 0
+        update(roomba)
+    return time.perf_counter() - start
+
+
+def bench_compiled_behavior_tree_update(steps):
+    """
+    Ticks the compiled RoombaBehaviorTree used by the episodes, with the bumper pressed in some steps.
+    """
+    roomba = make_roomba()
+    update = roomba.behavior.update
+    start = time.perf_counter()
+    for i in range(steps):
+        roomba.bumper_state = i % 500 == 0
+        update(roomba)
+    return time.perf_counter() - start
+
+
+def bench_coverage_stamp(steps):
+    """
+    Stamps the footprint and checks the coverage target, as each step of run_episode, along a random walk.
+    """
+    rng = np.random.default_rng(1)
+    angles = np.cumsum(rng.normal(0.0, 0.1, steps))
+    x = np.clip(PIX2M * SCREEN_WIDTH / 2.0 + np.cumsum(0.5 / 60.0 * np.cos(angles)), 0.0, PIX2M * SCREEN_WIDTH)
+    y = np.clip(PIX2M * SCREEN_HEIGHT / 2.0 + np.cumsum(0.5 / 60.0 * np.sin(angles)), 0.0, PIX2M * SCREEN_HEIGHT)
+    positions = list(zip(x.tolist(), y.tolist()))
+    footprint = Footprint(ROOMBA_RADIUS, M2PIX)
+    coverage = CoverageTracker(SCREEN_HEIGHT, SCREEN_WIDTH)
+    start = time.perf_counter()
+    for x, y in positions:
+        footprint.stamp(coverage, x, y)
+        coverage.has_reached(COVERAGE_TARGET)
+    return time.perf_counter() - start
+
+
+def bench_episode(steps):
+    """
+    Runs whole seeded episodes, one per step, with the seeds 1, 2, ...
+    """
+    start = time.perf_counter()
+    for seed in range(1, steps + 1):
+        run_replicate(parameters, seed)
+    return time.perf_counter() - start
+
+
+# Name, function and number of steps of each benchmark
+benchmarks = [('roomba_move', bench_roomba_move, 20000),
+              ('check_collision', bench_check_collision, 20000),
+              ('simulation_update', bench_simulation_update, 20000),
+              ('behavior_tree_update', bench_behavior_tree_update, 20000),
+              ('compiled_behavior_tree_update', bench_compiled_behavior_tree_update, 20000),
+              ('coverage_stamp', bench_coverage_stamp, 20000),
+              ('episode', bench_episode, 3)]
+
+
+def measure(function, steps, repeats=5):
+    """
+    Measures the time per step of a benchmark, as the minimum over several repetitions (the least disturbed one),
+    with the garbage collector disabled, after a warm-up run.
+
+    :param function: the benchmark, which runs the given number of steps and returns the time it took.
+    :type function: function
+    :param steps: number of steps of each repetition.
+    :type steps: int
+    :param repeats: number of repetitions.
+    :type repeats: int
+    :return: time per step, in seconds.
+    :rtype: float
+    """
+    function(max(steps // 10, 1))
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for k in range(repeats):
+            times.append(function(steps))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return min(times) / steps
+
+
+def get_machine():
+    """
+    Describes the machine, since the baselines are only comparable on the same one.
+    """
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'node': platform.node()}
+
+
+def run_benchmarks(names=None, repeats=5):
+    """
+    Runs the benchmarks.
+
+    :param names: names of the benchmarks to be run, or None to run all of them.
+    :type names: list of str
+    :param repeats: number of repetitions of each benchmark.
+    :type repeats: int
+    :return: time per step of each benchmark, in seconds.
+    :rtype: dict
+    """
+    return {name: measure(function, steps, repeats) for name, function, steps in benchmarks
+            if names is None or name in names}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results with a baseline, printing a report.
+
+    :param results: time per step of each benchmark, in seconds.
+    :type results: dict
+    :param baseline: baseline time per step of each benchmark, in seconds.
+    :type baseline: dict
+    :param threshold: relative slowdown above which a benchmark has regressed, e.g. 0.2 for 20%.
+    :type threshold: float
+    :return: names of the benchmarks that regressed.
+    :rtype: list of str
+    """
+    regressions = []
+    print('{:<32}{:>14}{:>16}{:>14}{:>10}'.format('benchmark', 'time/step', 'steps/s', 'baseline', 'change'))
+    for name, seconds in results.items():
+        line = '{:<32}{:>12.3f}us{:>16.1f}'.format(name, 1.0e6 * seconds, 1.0 / seconds)
+        if name in baseline:
+            change = seconds / baseline[name] - 1.0
+            line += '{:>12.3f}us{:>+9.1f}%'.format(1.0e6 * baseline[name], 100.0 * change)
+            if change > threshold:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the simulation hot path and compares it with a saved baseline.')
+    parser.add_argument('--only', nargs='+', choices=[name for name, function, steps in benchmarks], default=None,
+                        help='benchmarks to be run')
+    parser.add_argument('--repeats', type=int, default=5, help='repetitions of each benchmark')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--baseline', default=baseline_path, help='JSON file of the baseline')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.only, arguments.repeats)
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as baseline_file:
+            saved = json.load(baseline_file)
+        baseline = saved['results']
+        if saved['machine'] != get_machine():
+            print('Warning: the baseline was measured on another machine:', saved['machine'])
+    regressions = compare(results, baseline, arguments.threshold)
+    if arguments.save:
+        # Benchmarks that were not run keep their previous baseline
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump({'machine': get_machine(), 'results': dict(baseline, **results)}, baseline_file, indent=2)
+    if regressions and not arguments.save:
+        print('Regressions:', ', '.join(regressions))
+        sys.exit(1)
@@ -0,0 +1,292 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+from math import inf
+from functools import lru_cache
+from collections import OrderedDict
+from behavior_tree_test import CensoredTime
+
+
+# Modules whose code or values determine the cost of an evaluation
+SIMULATION_MODULES = ['constants.py', 'utils.py', 'roomba.py', 'simulation.py', 'behavior_tree.py',
+                      'compiled_behavior_tree.py', 'behavior_tree_test.py', 'coverage_grid.py', 'footprint.py',
+                      'jit_simulation.py', 'evaluator.py']
+
+
+@lru_cache(maxsize=None)
+def get_simulation_fingerprint():
+    """
+    Computes a fingerprint of the simulation: a hash of the source of its modules, including the constants.
+    Any change of the simulation changes the fingerprint, so the costs cached before the change are not reused.
+
+    :return: the fingerprint.
+    :rtype: str.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in SIMULATION_MODULES:
+        with open(os.path.join(directory, module), 'rb') as module_file:
+            digest.update(module_file.read())
+    return digest.hexdigest()[:16]
+
+
+class EvaluationCache(object):
+    """
+    Stores the costs of simulated parameter vectors, so that revisited points are not simulated again.
+
+    The keys are the parameter vectors quantized to a tolerance, plus the seeds of the replicate episodes (None
+    when the episodes were not seeded), the number of replicates and the fingerprint of the simulation. The cache
+    has an in-memory LRU tier and, optionally, an SQLite file that keeps every evaluation across runs; the
+    fingerprint keeps the evaluations of an older simulation from being reused.
+    """
+    def __init__(self, path=None, capacity=4096, tolerance=1.0e-9, fingerprint=None):
+        """
+        Creates the cache.
+
+        :param path: path of the SQLite file of the on-disk tier, or None to keep the evaluations in memory only.
+        :type path: str.
+        :param capacity: maximum number of evaluations kept in memory.
+        :type capacity: int.
+        :param tolerance: quantization step of the parameters, either one for all of them or one per parameter.
+        Parameter vectors closer than the tolerance share the same cached cost.
+        :type tolerance: float or numpy array.
+        :param fingerprint: fingerprint of the simulation, by default get_simulation_fingerprint().
+        :type fingerprint: str.
+        """
+        self.capacity = capacity
+        self.fingerprint = fingerprint if fingerprint is not None else get_simulation_fingerprint()
+        self.tolerance = np.asarray(tolerance, dtype=float)
+        self.memory = OrderedDict()
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, cost REAL NOT NULL)")
+            self.connection.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, candidate, seeds=None, replicates=None, fidelity=None):
+        """
+        Computes the key of a parameter vector.
+
+        :param candidate: parameter vector.
+        :type candidate: numpy array.
+        :param seeds: seeds of the replicate episodes, or None if they were not seeded.
+        :type seeds: list of int.
+        :param replicates: number of replicate episodes.
+        :type replicates: int.
+        :param fidelity: fidelity of the evaluation, or None for the full fidelity.
+        :type fidelity: Fidelity.
+        :return: the key.
+        :rtype: str.
+        """
+        quantized = np.round(np.asarray(candidate, dtype=float) / self.tolerance).astype(np.int64)
+        key = [quantized.tolist(), None if seeds is None else [int(seed) for seed in seeds], replicates, self.fingerprint]
+        if fidelity is not None:
+            key.append(fidelity.get_key())
+        return json.dumps(key)
+
+    def get(self, key):
+        """
+        Looks up the cost of a key, first in memory and then on disk.
+
+        :param key: the key.
+        :type key: str.
+        :return: the cached cost, or None if the key has not been evaluated.
+        :rtype: float.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+        if self.connection is not None:
+            row = self.connection.execute("SELECT cost FROM evaluations WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self.remember(key, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, cost):
+        """
+        Stores the cost of a key. The on-disk tier is only written when flush() is called.
+
+        :param key: the key.
+        :type key: str.
+        :param cost: the cost.
+        :type cost: float.
+        """
+        self.remember(key, cost)
+        if self.connection is not None:
+            self.connection.execute("INSERT OR REPLACE INTO evaluations (key, cost) VALUES (?, ?)", (key, cost))
+
+    def remember(self, key, cost):
+        """
+        Stores the cost of a key in memory, evicting the least recently used key if the memory is full.
+
+        :param key: the key.
+        :type key: str.
+        :param cost: the cost.
+        :type cost: float.
+        """
+        self.memory[key] = cost
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_archive(self, seeds=None, replicates=None):
+        """
+        Obtains every cached full-fidelity evaluation of the current simulation with the given seeds and number of
+        replicates, e.g. to train a surrogate model. The parameter vectors are recovered from the keys, so they are
+        quantized to the tolerance.
+
+        :param seeds: seeds of the replicate episodes, or None if they were not seeded.
+        :type seeds: list of int.
+        :param replicates: number of replicate episodes.
+        :type replicates: int.
+        :return: the parameter vectors and their costs.
+        :rtype: tuple of lists.
+        """
+        if self.connection is not None:
+            self.flush()
+            items = self.connection.execute("SELECT key, cost FROM evaluations").fetchall()
+        else:
+            items = list(self.memory.items())
+        seeds = None if seeds is None else [int(seed) for seed in seeds]
+        candidates = []
+        costs = []
+        for key, cost in items:
+            fields = json.loads(key)
+            if len(fields) != 4 or fields[3] != self.fingerprint:
+                # Lower-fidelity evaluation, or evaluation of another simulation
+                continue
+            quantized, key_seeds, key_replicates, key_fingerprint = fields
+            if key_seeds == seeds and key_replicates == replicates:
+                candidates.append(np.array(quantized) * self.tolerance)
+                costs.append(cost)
+        return candidates, costs
+
+    def flush(self):
+        """
+        Writes the stored costs to the on-disk tier.
+        """
+        if self.connection is not None:
+            self.connection.commit()
+
+    def get_statistics(self):
+        """
+        Obtains the usage statistics of the cache.
+
+        :return: number of hits (in memory and on disk), misses and evictions, and the size of the memory tier.
+        :rtype: dict.
+        """
+        return {'hits': self.memory_hits + self.disk_hits, 'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.memory)}
+
+    def close(self):
+        """
+        Writes the pending costs and closes the on-disk tier.
+        """
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+
+class CachedEvaluator(object):
+    """
+    Puts an EvaluationCache in front of an evaluator, such as ParallelEvaluator.
+
+    Only the parameter vectors missing from the cache are sent to the evaluator, in a single batch. An evaluator
+    without seeds draws new episodes for every evaluation, so its costs are not cached.
+    """
+    def __init__(self, evaluator, cache):
+        """
+        Creates the cached evaluator.
+
+        :param evaluator: evaluator used for the parameter vectors missing from the cache.
+        :type evaluator: ParallelEvaluator.
+        :param cache: the cache.
+        :type cache: EvaluationCache.
+        """
+        self.evaluator = evaluator
+        self.cache = cache
+
+    def map(self, candidates, cutoff=None, fidelity=None):
+        """
+        Evaluates a batch of parameter vectors, simulating only the ones missing from the cache.
+        Censored costs of aborted evaluations are not cached, since they depend on the cutoff.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param cutoff: cost above which the evaluations are aborted, either one for all of them or one per
+        parameter vector, as in ParallelEvaluator.map.
+        :type cutoff: float or list of float.
+        :param fidelity: fidelity of the evaluations, as in ParallelEvaluator.map. Each fidelity is cached apart.
+        :type fidelity: Fidelity.
+        :return: cost of each parameter vector, in the same order.
+        :rtype: list of float.
+        """
+        if self.evaluator.seeds is None:
+            return self.evaluator.map(candidates, cutoff, fidelity=fidelity)
+        candidates = list(candidates)
+        keys = [self.cache.make_key(candidate, self.evaluator.seeds, self.evaluator.replicates, fidelity)
+                for candidate in candidates]
+        costs = [self.cache.get(key) for key in keys]
+        # Parameter vectors repeated inside the batch are simulated only once
+        missing = OrderedDict()
+        for i, cost in enumerate(costs):
+            if cost is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            missing_cutoff = cutoff
+            if cutoff is not None and np.ndim(cutoff) > 0:
+                # Repeated parameter vectors are aborted only when they are above every one of their cutoffs
+                missing_cutoff = [max(cutoff[i] for i in indices) for indices in missing.values()]
+            new_costs = self.evaluator.map([candidates[indices[0]] for indices in missing.values()], missing_cutoff,
+                                           fidelity=fidelity)
+            for (key, indices), cost in zip(missing.items(), new_costs):
+                if not isinstance(cost, CensoredTime):
+                    self.cache.put(key, cost)
+                for i in indices:
+                    costs[i] = cost
+            self.cache.flush()
+        return costs
+
+    def race(self, candidates, incumbent=inf, max_replicates=10, **options):
+        """
+        Races a batch of parameter vectors with the evaluator. Races are not cached, since how many episodes
+        they use depends on the incumbent.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param incumbent: cost of the best parameter vector known so far.
+        :type incumbent: float.
+        :param max_replicates: maximum number of episodes of each race.
+        :type max_replicates: int.
+        :param options: other keyword arguments of ParallelEvaluator.race.
+        :return: estimate of the mean time, its standard error and the number of episodes used, for each
+        parameter vector.
+        :rtype: list of tuple.
+        """
+        return self.evaluator.race(candidates, incumbent, max_replicates, **options)
+
+    def close(self):
+        """
+        Closes the evaluator and the cache.
+        """
+        self.evaluator.close()
+        self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,52 @@
+import os
+import pickle
+import random
+import numpy as np
+
+
+def save_checkpoint(path, state):
+    """
+    Saves the state of an optimization run, together with the states of the random and numpy.random modules.
+
+    The file is written next to the old one and then renamed over it, so a crash while saving never leaves a
+    broken checkpoint behind.
+
+    :param path: path of the checkpoint file.
+    :type path: str
+    :param state: state of the run (optimizer, counters, surrogate model...), which must be picklable.
+    :type state: dict
+    """
+    state = dict(state, random_state=random.getstate(), numpy_random_state=np.random.get_state())
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as checkpoint_file:
+        pickle.dump(state, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads the state of an optimization run, restoring the states of the random and numpy.random modules.
+
+    :param path: path of the checkpoint file.
+    :type path: str
+    :return: the state of the run, or None if there is no checkpoint.
+    :rtype: dict
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as checkpoint_file:
+        state = pickle.load(checkpoint_file)
+    random.setstate(state.pop('random_state'))
+    np.random.set_state(state.pop('numpy_random_state'))
+    return state
+
+
+def remove_checkpoint(path):
+    """
+    Removes the checkpoint of a run that has finished, so the next run starts from scratch instead of resuming it.
+
+    :param path: path of the checkpoint file, or None if the run was not checkpointed.
+    :type path: str
+    """
+    if path is not None and os.path.exists(path):
+        os.remove(path)
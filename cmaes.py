@@ -1,5 +1,9 @@
 import cma
-from behavior_tree_test import simulacao
+from evaluator import ParallelEvaluator, is_exact_cost
+from cache import EvaluationCache, CachedEvaluator
+from surrogate import SurrogateEvaluator
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from multi_fidelity import SuccessiveHalvingEvaluator, screen_population, default_fidelities
 import numpy as np
 from math import inf
 
@@ -16,24 +20,131 @@ initial_radius_spiral = 0.2  # initial spiral radius
 initial_guess = np.array([move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral])
 '''
 
+def rank_censored_last(costs):
+    """
+    Replaces the censored costs of a generation by values above all its other costs, keeping their order, since
+    an aborted sample is only known to be worse than the cutoff, while other costs may be above the cutoff too.
+
+    :param costs: costs of the samples.
+    :type costs: list of float.
+    :return: the costs to be ranked.
+    :rtype: list of float.
+    """
+    censored = [getattr(cost, 'censored', False) for cost in costs]
+    if not any(censored) or all(censored):
+        return [float(cost) for cost in costs]
+    worst = max(float(cost) for cost, is_censored in zip(costs, censored) if not is_censored)
+    lowest = min(float(cost) for cost, is_censored in zip(costs, censored) if is_censored)
+    return [float(np.nextafter(worst, inf)) + float(cost) - lowest if is_censored else float(cost)
+            for cost, is_censored in zip(costs, censored)]
+
+
+def evaluate_generation(evaluator, samples, mu, cutoff=inf):
+    """
+    Evaluates a generation of CMA-ES, aborting the samples that cannot be among its mu best ones.
+
+    The cutoff is a guess of the mu-th best cost of the generation (e.g. the previous generation's). When at least
+    mu samples have exact costs up to the cutoff, the aborted samples are provably worse than the mu best ones;
+    otherwise they are evaluated again without cutoff. The aborted samples are ranked below all the exact costs.
+
+    :param evaluator: evaluator whose map accepts a cutoff, such as CachedEvaluator.
+    :param samples: samples of the generation.
+    :type samples: list of numpy array.
+    :param mu: number of samples selected by the recombination.
+    :type mu: int.
+    :param cutoff: cost above which the evaluations are aborted.
+    :type cutoff: float.
+    :return: the costs to be told to CMA-ES, the mu-th best exact cost of the generation (inf if there are fewer
+    than mu exact costs) and the costs returned by the evaluator.
+    :rtype: tuple.
+    """
+    costs = list(evaluator.map(samples, cutoff=None if cutoff == inf else cutoff))
+    exact = [float(cost) for cost in costs if is_exact_cost(cost)]
+    if sum(cost <= cutoff for cost in exact) < mu:
+        aborted = [i for i, cost in enumerate(costs) if getattr(cost, 'censored', False)]
+        if aborted:
+            for i, cost in zip(aborted, evaluator.map([samples[i] for i in aborted])):
+                costs[i] = cost
+            exact = [float(cost) for cost in costs if is_exact_cost(cost)]
+    mu_best = sorted(exact)[mu - 1] if len(exact) >= mu else inf
+    return rank_censored_last(costs), mu_best, costs
+
+
 # CMA-ES parameters
 lower_bound = np.array([0.8*3.0, 0.8*20.0, 0.8*0.5, 0.8*0.05, 0.8*0.2])
 upper_bound = np.array([1.2*3.0, 1.2*20.0, 1.2*0.5, 1.2*0.05, 1.2*0.2])
-m0 = np.random.uniform(lower_bound, upper_bound)  # initial guess used in the optimization algorithm
 sigma0 = 1.0  # initial step size (CMA-ES)
-
-es = cma.CMAEvolutionStrategy(m0, sigma0,{'popsize':5})
-
 num_iterations = 50
-n = 0
 epsilon = 75
-value = inf
-while n < num_iterations and value > epsilon:
-    n += 1
-    print(n,'. ')
-    samples = es.ask()
-    fitnesses = [simulacao(sample[0],sample[1],sample[2],sample[3],sample[4]) for sample in samples]
-    value = np.min(fitnesses)
-    es.tell(samples, fitnesses)
-
-es.result_pretty()  # where the result can be found
\ No newline at end of file
+replicate_seeds = [1, 2, 3]  # common random numbers: every candidate is simulated with the same replicate seeds
+use_racing = False  # candidates that cannot beat the best one so far use fewer episodes; races are not cached
+max_replicates = 10  # maximum number of episodes of a race
+cache_path = 'evaluations.sqlite'  # evaluations reused across runs
+cache_tolerance = 1.0e-3 * (upper_bound - lower_bound)  # points closer than this share the same evaluation
+use_surrogate = False  # only the candidates a surrogate model finds most promising are simulated; the others get predicted costs
+screen_fraction = 0.4  # fraction of each generation that is simulated when using the surrogate model
+checkpoint_path = 'cmaes_checkpoint.pkl'  # the run is resumed from this file if it exists
+checkpoint_interval = 1  # number of iterations between checkpoints
+use_successive_halving = False  # generations are evaluated with successive halving over fidelities, instead of racing
+fidelities = default_fidelities  # fidelities of successive halving, from the cheapest one to the full fidelity
+eta = 3  # only the best 1/eta of the samples are promoted to the next fidelity
+initial_pool_size = 30  # with successive halving, the initial guess is the best of this many random points
+
+if __name__ == '__main__':
+    n = 0
+    value = inf
+    best_value = inf
+    cutoff = inf
+    cache = EvaluationCache(cache_path, tolerance=cache_tolerance)
+    evaluator = CachedEvaluator(ParallelEvaluator(seeds=replicate_seeds), cache)
+    if use_surrogate:
+        # The surrogate model starts from the evaluations cached by previous runs
+        evaluator = SurrogateEvaluator(evaluator, lower_bound, upper_bound, screen_fraction)
+        evaluator.load_archive(*cache.get_archive(replicate_seeds, len(replicate_seeds)))
+    batch_evaluator = evaluator
+    if use_successive_halving:
+        batch_evaluator = SuccessiveHalvingEvaluator(evaluator, fidelities, eta)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        es, n, value, best_value = checkpoint['es'], checkpoint['n'], checkpoint['value'], checkpoint['best_value']
+        cutoff = checkpoint.get('cutoff', inf)
+        if use_surrogate:
+            evaluator.set_state(checkpoint['surrogate'])
+        print('Resuming from', checkpoint_path, 'after', n, 'iterations')
+    else:
+        if use_successive_halving:
+            # The initial guess is the best point of a random pool, screened at low fidelity
+            pool = np.random.uniform(lower_bound, upper_bound, (initial_pool_size, len(lower_bound)))
+            m0 = screen_population(evaluator, pool, 1, fidelities, eta)[0][0]
+        else:
+            m0 = np.random.uniform(lower_bound, upper_bound)  # initial guess used in the optimization algorithm
+        es = cma.CMAEvolutionStrategy(m0, sigma0,{'popsize':5})
+    with evaluator:
+        while n < num_iterations and value > epsilon:
+            n += 1
+            print(n,'. ')
+            samples = es.ask()
+            # The whole population is simulated at once by the worker processes
+            if use_racing and not use_successive_halving:
+                costs = [mean for mean, stderr, replicates in evaluator.race(samples, best_value, max_replicates)]
+                fitnesses = costs
+            else:
+                # Samples that cannot be among the mu best ones of the generation are aborted, at the previous
+                # generation's mu-th best cost
+                fitnesses, cutoff, costs = evaluate_generation(batch_evaluator, samples, es.sp.weights.mu, cutoff)
+            value = min([float(cost) for cost in costs if is_exact_cost(cost)], default=inf)
+            best_value = min(best_value, value)
+            es.tell(samples, fitnesses)
+            if n % checkpoint_interval == 0:
+                save_checkpoint(checkpoint_path, {'es': es, 'n': n, 'value': value, 'best_value': best_value,
+                                                  'cutoff': cutoff,
+                                                  'surrogate': evaluator.get_state() if use_surrogate else None})
+        # The run has finished, so the next one starts from scratch
+        remove_checkpoint(checkpoint_path)
+        print('Cache:', cache.get_statistics())
+        if use_surrogate:
+            print('Surrogate:', evaluator.get_statistics())
+        if use_successive_halving:
+            print('Successive halving:', batch_evaluator.get_statistics())
+
+    es.result_pretty()  # where the result can be found
@@ -0,0 +1,165 @@
+from behavior_tree import ExecutionStatus, CompositeNode, SequenceNode, SelectorNode
+
+
+# Integer codes of the execution status, the same as the values of ExecutionStatus
+SUCCESS = ExecutionStatus.SUCCESS.value
+FAILURE = ExecutionStatus.FAILURE.value
+RUNNING = ExecutionStatus.RUNNING.value
+
+NO_CHILD = -1  # a composite node is not running any child, or a node has no next sibling or parent
+
+
+class CompiledBehaviorTree(object):
+    """
+    Represents a behavior tree compiled into flat tables, which is ticked without walking the node objects.
+
+    The nodes are numbered in preorder. For each node, the tables hold its parent, its first child, its next
+    sibling and, for composite nodes, the status of a child that makes the node move on to the next child
+    (success for sequences, failure for selectors); any other status ends the node with that status.
+    The running child of each composite node is kept in a list indexed by the node's number.
+    The leaves are the original node objects, whose enter and execute methods are called directly, so a tick
+    behaves the same as BehaviorTree.update on the original tree.
+    """
+    def __init__(self, tree):
+        """
+        Compiles a behavior tree built from SequenceNode, SelectorNode and leaf nodes.
+
+        The compiled tree starts with no running child, and the original tree must not be updated anymore,
+        since both share the leaves.
+
+        :param tree: the behavior tree to be compiled.
+        :type tree: BehaviorTree
+        """
+        self.parent = []
+        self.first_child = []
+        self.next_sibling = []
+        self.advance_on = []
+        self.is_leaf = []
+        self.leaf_enter = []
+        self.leaf_execute = []
+        self.leaves = []
+        self.node_names = []
+        if tree.root is not None:
+            self.add_node(tree.root, NO_CHILD)
+        self.running_child = len(self.parent) * [NO_CHILD]
+
+    def add_node(self, node, parent):
+        """
+        Adds a node and its subtree to the tables, in preorder.
+
+        :param node: the node to be added.
+        :type node: TreeNode
+        :param parent: number of the node's parent, or NO_CHILD for the root.
+        :type parent: int
+        :return: number of the node.
+        :rtype: int
+        """
+        index = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(NO_CHILD)
+        self.next_sibling.append(NO_CHILD)
+        if isinstance(node, SequenceNode):
+            self.advance_on.append(SUCCESS)
+        elif isinstance(node, SelectorNode):
+            self.advance_on.append(FAILURE)
+        elif isinstance(node, CompositeNode):
+            raise TypeError("Composite node {} of type {} cannot be compiled".format(node.node_name, type(node).__name__))
+        else:
+            self.advance_on.append(None)
+        self.is_leaf.append(self.advance_on[index] is None)
+        self.leaf_enter.append(node.enter if self.is_leaf[index] else None)
+        self.leaf_execute.append(node.execute if self.is_leaf[index] else None)
+        self.leaves.append(node if self.is_leaf[index] else None)
+        self.node_names.append(node.node_name)
+        if not self.is_leaf[index]:
+            if not node.children:
+                raise ValueError("Composite node {} has no children".format(node.node_name))
+            previous = NO_CHILD
+            for child in node.children:
+                child_index = self.add_node(child, index)
+                if previous == NO_CHILD:
+                    self.first_child[index] = child_index
+                else:
+                    self.next_sibling[previous] = child_index
+                previous = child_index
+        return index
+
+    def enter(self, node, agent):
+        """
+        Enters a node.
+
+        :param node: number of the node.
+        :type node: int
+        :param agent: the agent this behavior tree is being executed on.
+        """
+        if self.is_leaf[node]:
+            self.leaf_enter[node](agent)
+        else:
+            # When a composite node is entered, no child should be running
+            self.running_child[node] = NO_CHILD
+
+    def get_running_leaf(self):
+        """
+        Obtains the leaf that is running, i.e. the one the next tick resumes.
+
+        :return: number of the running leaf, or NO_CHILD if no leaf is running.
+        :rtype: int
+        """
+        if not self.parent:
+            return NO_CHILD
+        node = 0
+        while not self.is_leaf[node]:
+            node = self.running_child[node]
+            if node == NO_CHILD:
+                return NO_CHILD
+        return node
+
+    def get_running_leaf_node(self):
+        """
+        Obtains the leaf that is running, like BehaviorTree.get_running_leaf_node.
+
+        :return: the running leaf, or None if no leaf is running.
+        :rtype: LeafNode
+        """
+        leaf = self.get_running_leaf()
+        return self.leaves[leaf] if leaf != NO_CHILD else None
+
+    def update(self, agent):
+        """
+        Updates the behavior tree, i.e. executes one tick.
+
+        :param agent: the agent this behavior tree is being executed on.
+        :return: status code of the root (SUCCESS, FAILURE or RUNNING), or None if the tree is empty.
+        :rtype: int
+        """
+        if not self.parent:
+            return None
+        is_leaf = self.is_leaf
+        running_child = self.running_child
+        parent = self.parent
+        node = 0
+        while True:
+            # Descends through the running children down to a leaf, entering the first child where none is running
+            while not is_leaf[node]:
+                child = running_child[node]
+                if child == NO_CHILD:
+                    child = self.first_child[node]
+                    running_child[node] = child
+                    self.enter(child, agent)
+                node = child
+            status = self.leaf_execute[node](agent).value
+            # Ascends while the nodes finish, until a composite node moves on to its next child
+            while True:
+                if status == RUNNING:
+                    return RUNNING
+                node_parent = parent[node]
+                if node_parent == NO_CHILD:
+                    return status
+                sibling = self.next_sibling[node]
+                if status == self.advance_on[node_parent] and sibling != NO_CHILD:
+                    running_child[node_parent] = sibling
+                    self.enter(sibling, agent)
+                    node = sibling
+                    break
+                running_child[node_parent] = NO_CHILD
+                node = node_parent
@@ -10,11 +10,25 @@ M2PIX = 100.0  # factor to convert from meters to pixels
 FREQUENCY = 60.0  # simulation frequency
 SAMPLE_TIME = 1.0 / FREQUENCY  # simulation sample time
 
+# Episode Parameters
+COVERAGE_TARGET = 0.6  # fraction of the area that must be cleaned to finish an episode
+MAX_EPISODE_TIME = 300.0  # time limit of an episode
+ROOMBA_RADIUS = 0.34 / 2.0  # radius of the roomba used in the episodes
+MAX_LINEAR_SPEED = 1.0  # maximum linear speed of the roomba used in the episodes
+MAX_ANGULAR_SPEED = 2.0  # maximum angular speed of the roomba used in the episodes
+
 # Behavior Parameters
 FORWARD_SPEED = 0.5  # default linear speed when going forward
 BACKWARD_SPEED = -0.1 # default backward speed when going back after hitting a wall
 ANGULAR_SPEED = 0.5  # default angular speed
 
+# Integer codes of the leaves of RoombaBehaviorTree, used by the simulators that keep the tree's state in arrays
+NO_NODE = -1  # the root is not running any child, so the next tick starts moving forward again
+MOVE_FORWARD = 0
+MOVE_IN_SPIRAL = 1
+GO_BACK = 2
+ROTATE = 3
+
 # Parametros a se otimizarem
 MOVE_FORWARD_TIME = 3.0  # time moving forward before switching to the spiral behavior
 MOVE_IN_SPIRAL_TIME = 20.0  # time moving in spiral before switching back to moving forward
@@ -0,0 +1,96 @@
+from collections import Counter
+
+# Phases of a time step of run_episode
+PHASES = ('stamp', 'coverage_check', 'history', 'collision', 'behavior', 'kinematics', 'draw')
+
+
+class EpisodeStats(object):
+    """
+    Accumulates where the time of the episodes goes: the wall time of each phase of a time step, the number of
+    time steps and wall collisions, and the transitions between the leaves of the behavior tree.
+
+    It is filled by run_episode(..., stats=stats) and Simulation.update(stats), and can be merged across episodes
+    (e.g. all the episodes of an optimization run) with merge. The time of the episodes not spent in any phase is
+    the loop's own overhead.
+    """
+    def __init__(self):
+        """
+        Creates empty statistics.
+        """
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.episode_time = 0.0
+        self.episodes = 0
+        self.steps = 0
+        self.collisions = 0
+        self.transitions = Counter()
+        self.leaf_steps = Counter()
+        self.leaf = None  # name of the leaf running in the current episode
+
+    def start_episode(self):
+        """
+        Starts counting a new episode.
+        """
+        self.episodes += 1
+        self.leaf = None
+
+    def record_leaf(self, leaf):
+        """
+        Records the leaf running after a behavior tick, counting a transition when it changed.
+
+        :param leaf: name of the running leaf, or None if no leaf is running (the tree has just finished).
+        :type leaf: str
+        """
+        if leaf is None:
+            return
+        if leaf != self.leaf:
+            if self.leaf is not None:
+                self.transitions[(self.leaf, leaf)] += 1
+            self.leaf = leaf
+        self.leaf_steps[leaf] += 1
+
+    def merge(self, other):
+        """
+        Adds the statistics of other episodes to these ones.
+
+        :param other: the other statistics.
+        :type other: EpisodeStats
+        :return: these statistics.
+        :rtype: EpisodeStats
+        """
+        for phase in PHASES:
+            self.phase_times[phase] += other.phase_times[phase]
+        self.episode_time += other.episode_time
+        self.episodes += other.episodes
+        self.steps += other.steps
+        self.collisions += other.collisions
+        self.transitions.update(other.transitions)
+        self.leaf_steps.update(other.leaf_steps)
+        return self
+
+    def get_overhead(self):
+        """
+        Obtains the time of the episodes not spent in any phase.
+
+        :return: the time, in seconds.
+        :rtype: float
+        """
+        return max(self.episode_time - sum(self.phase_times.values()), 0.0)
+
+    def report(self):
+        """
+        Formats the statistics as a table, with the phases sorted by time.
+
+        :return: the report.
+        :rtype: str
+        """
+        steps = max(self.steps, 1)
+        total = self.episode_time if self.episode_time > 0.0 else 1.0
+        lines = ['{} episodes, {} steps, {:.3f} s, {} wall collisions'.format(self.episodes, self.steps,
+                                                                             self.episode_time, self.collisions)]
+        phases = sorted(self.phase_times.items(), key=lambda item: -item[1]) + [('overhead', self.get_overhead())]
+        for phase, seconds in phases:
+            lines.append('  {:<16}{:>10.3f} s{:>8.1f}%{:>10.3f} us/step'.format(phase, seconds, 100.0 * seconds / total,
+                                                                           1.0e6 * seconds / steps))
+        for (source, destination), count in self.transitions.most_common():
+            lines.append('  {} -> {}: {}'.format(source, destination, count))
+        return '\n'.join(lines)
@@ -0,0 +1,228 @@
+import os
+import random
+import multiprocessing
+import numpy as np
+from math import inf
+from behavior_tree_test import summarize_replicates, get_min_episode_time
+from episode_stats import EpisodeStats
+from footprint import Footprint
+from constants import ROOMBA_RADIUS
+
+
+def is_exact_cost(cost):
+    """
+    Checks if a cost was measured at full fidelity, i.e. it is not a lower bound of an aborted evaluation
+    (CensoredTime), a prediction of the surrogate model (PredictedCost) or a ranking value of successive halving
+    (LowFidelityCost).
+
+    :param cost: the cost.
+    :type cost: float.
+    :return: if the cost is exact.
+    :rtype: bool.
+    """
+    return not (getattr(cost, 'censored', False) or getattr(cost, 'predicted', False)
+                or getattr(cost, 'low_fidelity', False))
+
+
+def _initialize_worker(jit=False):
+    """
+    Imports the simulator once in each worker process, so that the evaluations do not pay for it.
+
+    :param jit: if the episodes run in the Numba-compiled kernel of jit_simulation.
+    :type jit: bool.
+    """
+    global _run_replicate, _race
+    if jit:
+        from jit_simulation import run_jit_replicate as run_replicate
+    else:
+        from behavior_tree_test import run_replicate
+    from racing import race
+    _run_replicate = run_replicate
+    _race = race
+
+
+def _evaluate(task):
+    """
+    Runs one replicate episode of a parameter vector inside a worker process.
+
+    :param task: parameter vector (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral), the seed of the episode, its time cutoff and its fidelity.
+    :type task: tuple.
+    :return: time of the episode, a CensoredTime if it was aborted.
+    :rtype: float.
+    """
+    candidate, seed, time_cutoff, fidelity = task
+    return _run_replicate(candidate, seed, time_cutoff=time_cutoff, fidelity=fidelity)
+
+
+def _evaluate_profiled(task):
+    """
+    Runs one replicate episode of a parameter vector inside a worker process, measuring where its time goes.
+    The episode always runs in the pure-Python simulation, whose phases can be measured.
+
+    :param task: parameter vector, the seed of the episode, its time cutoff and its fidelity, as in _evaluate.
+    :type task: tuple.
+    :return: time of the episode and its EpisodeStats.
+    :rtype: tuple.
+    """
+    from behavior_tree_test import run_replicate
+    candidate, seed, time_cutoff, fidelity = task
+    stats = EpisodeStats()
+    return run_replicate(candidate, seed, time_cutoff=time_cutoff, stats=stats, fidelity=fidelity), stats
+
+
+def _evaluate_race(task):
+    """
+    Races a parameter vector against the incumbent inside a worker process.
+
+    :param task: parameter vector, the seeds of its episodes and the keyword arguments of racing.race.
+    :type task: tuple.
+    :return: estimate of the mean time, its standard error and the number of episodes used.
+    :rtype: tuple.
+    """
+    candidate, seeds, options = task
+    return _race(candidate, seeds, **options)
+
+
+class ParallelEvaluator(object):
+    """
+    Evaluates batches of parameter vectors with simulacao in a pool of worker processes.
+
+    Every replicate episode of every parameter vector is a separate task, so even a batch with a single
+    parameter vector keeps several workers busy. The cost of a parameter vector is the mean time of its replicates.
+    The workers are started (and import the simulator) when the evaluator is created, so the first batch does
+    not wait for them. With a single process, the evaluations run in the calling process instead.
+    The number of episodes simulated so far is kept in episodes, e.g. to compare optimizers under the same budget.
+    When profiling, the EpisodeStats of the episodes of map are accumulated in stats.
+    """
+    def __init__(self, processes=None, replicates=3, seeds=None, jit=False, profile=False):
+        """
+        Creates the evaluator.
+
+        :param processes: number of worker processes. Defaults to the number of CPUs.
+        :type processes: int.
+        :param replicates: number of replicate episodes simulated for each parameter vector.
+        :type replicates: int.
+        :param seeds: seeds of the replicate episodes, shared by every parameter vector (then the number of seeds
+        is the number of replicates), or None to draw new seeds for every episode.
+        :type seeds: list of int.
+        :param jit: if the episodes of map run in the Numba-compiled kernel of jit_simulation (which falls back to
+        the pure-Python simulation when Numba is not installed).
+        :type jit: bool.
+        :param profile: if the time of each phase of the episodes of map is measured, in which case they run in the
+        pure-Python simulation.
+        :type profile: bool.
+        """
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.seeds = None if seeds is None else [int(seed) for seed in seeds]
+        self.replicates = replicates if seeds is None else len(self.seeds)
+        self.episodes = 0
+        self.stats = EpisodeStats() if profile else None
+        self.pool = None
+        if self.processes > 1:
+            self.pool = multiprocessing.Pool(self.processes, initializer=_initialize_worker, initargs=(jit,))
+        else:
+            _initialize_worker(jit)
+
+    def map(self, candidates, cutoff=None, fidelity=None):
+        """
+        Evaluates a batch of parameter vectors.
+
+        With a cutoff, the episodes of a parameter vector are aborted as soon as its cost is proven to be above the
+        cutoff, and its cost is a CensoredTime (a lower bound above the cutoff), as in simulacao.
+        The episodes run at the same time, so each one is aborted assuming the others take their minimum time.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param cutoff: cost above which the evaluations are aborted, either one for all of them or one per
+        parameter vector, or None to run every episode to the end.
+        :type cutoff: float or list of float.
+        :param fidelity: fidelity of the episodes (see multi_fidelity.py), which may use fewer replicates (the first
+        seeds), or None for the full fidelity.
+        :type fidelity: Fidelity.
+        :return: cost of each parameter vector, in the same order.
+        :rtype: list of float.
+        """
+        candidates = [tuple(candidate) for candidate in candidates]
+        replicates = self.replicates
+        if fidelity is not None and fidelity.replicates is not None:
+            replicates = min(fidelity.replicates, self.replicates)
+        time_cutoffs = len(candidates) * [None]
+        if cutoff is not None:
+            cutoffs = np.broadcast_to(np.asarray(cutoff, dtype=float), len(candidates))
+            if fidelity is None:
+                min_episode_time = get_min_episode_time()
+            else:
+                min_episode_time = get_min_episode_time(Footprint(ROOMBA_RADIUS, fidelity.m2pix), fidelity.sample_time,
+                                                        fidelity.max_time, fidelity.swept)
+            time_cutoffs = [float(replicates * c - (replicates - 1) * min_episode_time) for c in cutoffs]
+        # Each replicate gets its own seed, drawn here so that seeding the calling process reproduces the batch
+        if self.seeds is None:
+            tasks = [(candidate, random.getrandbits(32), time_cutoff, fidelity)
+                     for candidate, time_cutoff in zip(candidates, time_cutoffs) for k in range(replicates)]
+        else:
+            tasks = [(candidate, seed, time_cutoff, fidelity) for candidate, time_cutoff in zip(candidates, time_cutoffs)
+                     for seed in self.seeds[:replicates]]
+        self.episodes += len(tasks)
+        evaluate = _evaluate if self.stats is None else _evaluate_profiled
+        if self.pool is None:
+            times = [evaluate(task) for task in tasks]
+        else:
+            # One episode per task, since the episodes' durations vary a lot
+            times = self.pool.map(evaluate, tasks, chunksize=1)
+        if self.stats is not None:
+            for result in times:
+                self.stats.merge(result[1])
+            times = [result[0] for result in times]
+        return [summarize_replicates(times[i:i + replicates]) for i in range(0, len(times), replicates)]
+
+    def race(self, candidates, incumbent=inf, max_replicates=10, **options):
+        """
+        Evaluates a batch of parameter vectors with racing.race, so that candidates that cannot beat the
+        incumbent use fewer episodes. Each race runs in a single worker.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param incumbent: cost of the best parameter vector known so far.
+        :type incumbent: float.
+        :param max_replicates: maximum number of episodes of each race. When the evaluator has fixed seeds, they
+        are the first seeds of every race and the remaining ones are derived from them, so that every race uses
+        the same seeds.
+        :type max_replicates: int.
+        :param options: other keyword arguments of racing.race (min_replicates, confidence, precision).
+        :return: estimate of the mean time, its standard error and the number of episodes used, for each
+        parameter vector.
+        :rtype: list of tuple.
+        """
+        options['incumbent'] = incumbent
+        if self.seeds is not None:
+            extra_seeds = np.random.SeedSequence(self.seeds).generate_state(max(max_replicates - len(self.seeds), 0))
+            common_seeds = (self.seeds + extra_seeds.tolist())[:max_replicates]
+        tasks = []
+        for candidate in candidates:
+            if self.seeds is None:
+                seeds = [random.getrandbits(32) for k in range(max_replicates)]
+            else:
+                seeds = common_seeds
+            tasks.append((tuple(candidate), seeds, options))
+        if self.pool is None:
+            races = [_evaluate_race(task) for task in tasks]
+        else:
+            races = self.pool.map(_evaluate_race, tasks, chunksize=1)
+        self.episodes += sum(replicates for mean, stderr, replicates in races)
+        return races
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,405 @@
+import random
+import numpy as np
+from math import sin, cos, fabs, floor
+from constants import *
+from coverage_grid import CoverageTracker, get_grid_shape
+from footprint import Footprint
+
+
+# Time after each number of steps, accumulated the same way as the fixed-step loop of run_episode
+STEP_TIMES = np.cumsum(np.concatenate(([0.0], np.full(int(MAX_EPISODE_TIME / SAMPLE_TIME) + 2, SAMPLE_TIME))))
+# Number of steps after which an episode reaches its time limit
+MAX_STEPS = int(np.argmax(STEP_TIMES > MAX_EPISODE_TIME))
+
+
+def clamp(value, min_value, max_value):
+    """
+    Clamps a value to keep it within the interval [min_value, max_value], like roomba.clamp.
+    """
+    return min(max(value, min_value), max_value)
+
+
+class EventSimulation(object):
+    """
+    Simulates a roomba episode jumping from one behavior event to the next, instead of ticking every time step.
+
+    Between two events (a leaf's timer expiring, or the robot touching a wall) the running leaf of
+    RoombaBehaviorTree keeps the same motion law, so the whole segment is computed at once: the poses of all its
+    time steps are obtained with cumulative sums, the first step touching a wall ends the segment and the area
+    swept by the robot is rasterized into the coverage grid as a union of row spans. The steps where an event
+    happens are simulated one at a time, with the same rules as simulacao.
+    The segments reproduce the fixed-step arithmetic (the same per-step increments accumulated in the same order),
+    so the episodes match run_replicate with the same seed up to the last bits of NumPy's trigonometric
+    functions; the rare step where such a difference changes a wall contact makes the episodes diverge
+    afterwards, but not their statistics.
+    """
+    def __init__(self, parameters, rng=None, roomba_radius=ROOMBA_RADIUS, footprint=None):
+        """
+        Creates the event-driven simulation of an episode.
+
+        :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+        initial_radius_spiral).
+        :type parameters: tuple
+        :param rng: random number generator used to draw the rotations, or None to use the random module.
+        :param roomba_radius: the robot's radius.
+        :type roomba_radius: float
+        :param footprint: cells cleaned around the robot, built from the robot's radius if not given. The coverage grid
+        has the footprint's cell size.
+        :type footprint: Footprint
+        """
+        self.move_forward_time, self.move_in_spiral_time, self.go_back_time, self.spiral_factor, \
+            self.initial_radius_spiral = [float(parameter) for parameter in parameters]
+        self.rng = rng if rng is not None else random
+        self.radius = roomba_radius
+        self.footprint = footprint if footprint is not None else Footprint(roomba_radius, M2PIX)
+        # Row spans of the footprint: row offset and half width of each row of the circular mask
+        row_counts = self.footprint.mask.sum(axis=1)
+        self.span_rows = np.flatnonzero(row_counts) - self.footprint.half_size
+        self.span_half_widths = row_counts[row_counts > 0] // 2
+        # The grid's cells have the footprint's size
+        self.m2pix = self.footprint.m2pix
+        self.height, self.width = get_grid_shape(self.m2pix)
+        self.coverage = CoverageTracker(self.height, self.width)
+        self.target_cells = self.coverage.get_target_cells(COVERAGE_TARGET)
+        # Robot's state
+        self.x = PIX2M * SCREEN_WIDTH / 2.0
+        self.y = PIX2M * SCREEN_HEIGHT / 2.0
+        self.rotation = 0.0
+        self.linear_speed = 0.0
+        self.angular_speed = 0.0
+        # Behavior tree's state
+        self.node = NO_NODE
+        self.node_ticks = 0
+        self.rotation_time = 0.0
+        self.rotation_signal = 1
+        # Velocities and poses of the next segment, computed by get_segment_steps
+        self.segment = None
+        self.trajectory = None
+        # Number of time steps simulated, and of steps and segments simulated by Python-level iterations
+        self.step = 0
+        self.single_steps = 0
+        self.segments = 0
+
+    def run(self):
+        """
+        Runs the episode until the coverage target or the time limit is reached.
+
+        :return: the time needed to clean the area.
+        :rtype: float
+        """
+        while True:
+            num_steps = self.get_segment_steps()
+            if num_steps > 0:
+                t = self.advance(num_steps)
+                if t is not None:
+                    return t
+            t = self.tick()
+            if t is not None:
+                return t
+
+    def tick(self):
+        """
+        Simulates one time step, where the behavior tree may change its running leaf.
+
+        :return: the episode's time if it has finished, None otherwise.
+        :rtype: float
+        """
+        self.single_steps += 1
+        t = STEP_TIMES[self.step]
+        if t > MAX_EPISODE_TIME:
+            return t
+        self.footprint.stamp(self.coverage, self.x, self.y)
+        if self.coverage.cleaned_cells >= self.target_cells:
+            return t
+        self.step += 1
+        bumper_state = self.check_collision()
+        self.update_behavior(bumper_state)
+        self.move()
+        return None
+
+    def check_collision(self):
+        """
+        Checks collision between the robot and the walls, moving the robot back inside the room.
+
+        :return: the bumper state.
+        :rtype: bool
+        """
+        width = SCREEN_WIDTH * PIX2M
+        height = SCREEN_HEIGHT * PIX2M
+        bumper_state = False
+        if self.x - self.radius <= 0.0:
+            self.x = self.radius
+            bumper_state = True
+        if self.x + self.radius >= width:
+            self.x = width - self.radius
+            bumper_state = True
+        if self.y - self.radius <= 0.0:
+            self.y = self.radius
+            bumper_state = True
+        if self.y + self.radius >= height:
+            self.y = height - self.radius
+            bumper_state = True
+        return bumper_state
+
+    def update_behavior(self, bumper_state):
+        """
+        Executes one tick of RoombaBehaviorTree, following its leaves' transitions.
+
+        :param bumper_state: the bumper state.
+        :type bumper_state: bool
+        """
+        if self.node == NO_NODE:
+            self.enter(MOVE_FORWARD)
+        while True:
+            self.node_ticks += 1
+            t = self.node_ticks * SAMPLE_TIME
+            if self.node == MOVE_FORWARD:
+                self.set_velocity(FORWARD_SPEED, 0.0)
+                if bumper_state:
+                    self.enter(GO_BACK)
+                elif t > self.move_forward_time:
+                    self.enter(MOVE_IN_SPIRAL)
+                else:
+                    return
+            elif self.node == MOVE_IN_SPIRAL:
+                self.set_velocity(FORWARD_SPEED, FORWARD_SPEED / (self.initial_radius_spiral + self.spiral_factor * t))
+                if t > self.move_in_spiral_time:
+                    self.node = NO_NODE
+                    return
+                elif bumper_state:
+                    self.enter(GO_BACK)
+                else:
+                    return
+            elif self.node == GO_BACK:
+                self.set_velocity(BACKWARD_SPEED, 0.0)
+                if t > self.go_back_time:
+                    self.enter(ROTATE)
+                    self.rotation_time = 3.0 * self.rng.random()
+                    self.rotation_signal = -1 if self.rng.random() < 0.5 else 1
+                else:
+                    return
+            else:
+                self.set_velocity(0.0, self.rotation_signal * ANGULAR_SPEED)
+                if t > self.rotation_time:
+                    self.node = NO_NODE
+                return
+
+    def enter(self, node):
+        """
+        Enters a new leaf.
+
+        :param node: code of the leaf being entered.
+        :type node: int
+        """
+        self.node = node
+        self.node_ticks = 0
+
+    def set_velocity(self, linear_speed, angular_speed):
+        """
+        Sets the robot's velocity, clamped like Roomba.set_velocity.
+        """
+        self.linear_speed = clamp(linear_speed, -MAX_LINEAR_SPEED, MAX_LINEAR_SPEED)
+        self.angular_speed = clamp(angular_speed, -MAX_ANGULAR_SPEED, MAX_ANGULAR_SPEED)
+
+    def move(self):
+        """
+        Moves the robot during one time step, using the same equations as Roomba.move.
+        """
+        dt = SAMPLE_TIME
+        v = self.linear_speed
+        w = self.angular_speed
+        if fabs(w) < 1.0e-3:
+            self.x += v * dt * cos(self.rotation + w * dt / 2.0)
+            self.y += v * dt * sin(self.rotation + w * dt / 2.0)
+        else:
+            self.x += (2.0 * v / w) * cos(self.rotation + w * dt / 2.0) * sin(w * dt / 2.0)
+            self.y += (2.0 * v / w) * sin(self.rotation + w * dt / 2.0) * sin(w * dt / 2.0)
+        self.rotation += w * dt
+
+    def get_leaf_time(self):
+        """
+        Obtains the time after which the running leaf finishes.
+
+        :return: the running leaf's time, or None if no leaf is running.
+        :rtype: float
+        """
+        if self.node == MOVE_FORWARD:
+            return self.move_forward_time
+        if self.node == MOVE_IN_SPIRAL:
+            return self.move_in_spiral_time
+        if self.node == GO_BACK:
+            return self.go_back_time
+        if self.node == ROTATE:
+            return self.rotation_time
+        return None
+
+    def get_velocities(self, num_steps):
+        """
+        Computes the velocities the running leaf sets in the next time steps.
+
+        :param num_steps: number of time steps.
+        :type num_steps: int
+        :return: linear and angular speed of each time step.
+        :rtype: tuple of numpy arrays
+        """
+        if self.node == MOVE_FORWARD:
+            linear_speed, angular_speed = FORWARD_SPEED, np.zeros(num_steps)
+        elif self.node == GO_BACK:
+            linear_speed, angular_speed = BACKWARD_SPEED, np.zeros(num_steps)
+        elif self.node == ROTATE:
+            linear_speed, angular_speed = 0.0, np.full(num_steps, self.rotation_signal * ANGULAR_SPEED)
+        else:
+            t = (self.node_ticks + np.arange(1, num_steps + 1)) * SAMPLE_TIME
+            linear_speed, angular_speed = FORWARD_SPEED, FORWARD_SPEED / (self.initial_radius_spiral + self.spiral_factor * t)
+        linear_speed = np.full(num_steps, clamp(linear_speed, -MAX_LINEAR_SPEED, MAX_LINEAR_SPEED))
+        angular_speed = np.clip(angular_speed, -MAX_ANGULAR_SPEED, MAX_ANGULAR_SPEED)
+        return linear_speed, angular_speed
+
+    def get_trajectory(self, linear_speed, angular_speed):
+        """
+        Computes the poses of the robot over a segment, with the same per-step increments as Roomba.move.
+
+        :param linear_speed: linear speed of each time step.
+        :type linear_speed: numpy array
+        :param angular_speed: angular speed of each time step.
+        :type angular_speed: numpy array
+        :return: x, y and rotation before each time step and after the last one.
+        :rtype: tuple of numpy arrays
+        """
+        dt = SAMPLE_TIME
+        v = linear_speed
+        w = angular_speed
+        rotation = np.cumsum(np.concatenate(([self.rotation], w * dt)))
+        straight = np.abs(w) < 1.0e-3
+        # Avoiding the division by zero of the straight motion, which uses the limit equation instead
+        w_curve = np.where(straight, 1.0, w)
+        heading = rotation[:-1] + w * dt / 2.0
+        dx = np.where(straight, v * dt * np.cos(heading), (2.0 * v / w_curve) * np.cos(heading) * np.sin(w * dt / 2.0))
+        dy = np.where(straight, v * dt * np.sin(heading), (2.0 * v / w_curve) * np.sin(heading) * np.sin(w * dt / 2.0))
+        x = np.cumsum(np.concatenate(([self.x], dx)))
+        y = np.cumsum(np.concatenate(([self.y], dy)))
+        return x, y, rotation
+
+    def get_segment_steps(self):
+        """
+        Computes how many of the next time steps run without any event, i.e. without a leaf changing and
+        without the walls changing the robot's pose or (for leaves that react to it) its bumper state.
+
+        :return: number of time steps of the segment.
+        :rtype: int
+        """
+        leaf_time = self.get_leaf_time()
+        if leaf_time is None:
+            return 0
+        # Last node tick before the leaf's timer expires, computed with the same comparison as the leaves
+        last_tick = int(floor(leaf_time / SAMPLE_TIME))
+        while (last_tick + 1) * SAMPLE_TIME <= leaf_time:
+            last_tick += 1
+        while last_tick >= 0 and last_tick * SAMPLE_TIME > leaf_time:
+            last_tick -= 1
+        num_steps = min(last_tick - self.node_ticks, MAX_STEPS - self.step)
+        if num_steps <= 0:
+            return 0
+        self.segment = self.get_velocities(num_steps)
+        x, y, rotation = self.get_trajectory(*self.segment)
+        width = SCREEN_WIDTH * PIX2M
+        height = SCREEN_HEIGHT * PIX2M
+        radius = self.radius
+        x_steps = x[:-1]
+        y_steps = y[:-1]
+        hit_left = x_steps - radius <= 0.0
+        hit_right = x_steps + radius >= width
+        hit_top = y_steps - radius <= 0.0
+        hit_bottom = y_steps + radius >= height
+        if self.node == MOVE_FORWARD or self.node == MOVE_IN_SPIRAL:
+            # These leaves react to the bumper
+            event = hit_left | hit_right | hit_top | hit_bottom
+        else:
+            # The other leaves ignore the bumper, so only a pose moved by the walls is an event
+            event = (hit_left & (x_steps != radius)) | (hit_right & (x_steps != width - radius)) | \
+                    (hit_top & (y_steps != radius)) | (hit_bottom & (y_steps != height - radius))
+        if event.any():
+            num_steps = int(np.argmax(event))
+        self.trajectory = x, y, rotation
+        return num_steps
+
+    def advance(self, num_steps):
+        """
+        Simulates a segment computed by get_segment_steps, stamping all its poses at once.
+
+        :param num_steps: number of time steps of the segment.
+        :type num_steps: int
+        :return: the episode's time if it has finished, None otherwise.
+        :rtype: float
+        """
+        self.segments += 1
+        x, y, rotation = self.trajectory
+        rows = np.floor(y[:num_steps] * self.m2pix).astype(int)
+        cols = np.floor(x[:num_steps] * self.m2pix).astype(int)
+        top, swept = self.rasterize(rows, cols)
+        missing_cells = self.target_cells - self.coverage.cleaned_cells
+        if np.count_nonzero(swept & ~self.coverage.grid[top:top + swept.shape[0]]) >= missing_cells:
+            # The coverage target is reached during the segment: bisection of the first step reaching it
+            low, high = 0, num_steps
+            while high - low > 1:
+                middle = (low + high) // 2
+                top, swept = self.rasterize(rows[:middle], cols[:middle])
+                if np.count_nonzero(swept & ~self.coverage.grid[top:top + swept.shape[0]]) >= missing_cells:
+                    high = middle
+                else:
+                    low = middle
+            top, swept = self.rasterize(rows[:high], cols[:high])
+            self.coverage.stamp_mask(top, 0, swept)
+            self.step += high - 1
+            return STEP_TIMES[self.step]
+        self.coverage.stamp_mask(top, 0, swept)
+        self.step += num_steps
+        self.node_ticks += num_steps
+        self.x, self.y, self.rotation = x[num_steps], y[num_steps], rotation[num_steps]
+        self.linear_speed, self.angular_speed = self.segment[0][num_steps - 1], self.segment[1][num_steps - 1]
+        return None
+
+    def rasterize(self, rows, cols):
+        """
+        Rasterizes the union of the footprints centered at some cells, as spans of cells in each row.
+
+        :param rows: rows of the footprints' centers.
+        :type rows: numpy array
+        :param cols: columns of the footprints' centers.
+        :type cols: numpy array
+        :return: first row of the band of rows touched by the footprints, and the cells covered in that band.
+        :rtype: tuple
+        """
+        span_rows = rows[:, np.newaxis] + self.span_rows[np.newaxis, :]
+        starts = np.clip(cols[:, np.newaxis] - self.span_half_widths[np.newaxis, :], 0, self.width)
+        ends = np.clip(cols[:, np.newaxis] + self.span_half_widths[np.newaxis, :] + 1, 0, self.width)
+        valid = (span_rows >= 0) & (span_rows < self.height) & (ends > starts)
+        span_rows = span_rows[valid]
+        if span_rows.size == 0:
+            return 0, np.zeros((0, self.width), dtype=bool)
+        top = span_rows.min()
+        num_rows = span_rows.max() - top + 1
+        # Difference array of each row: +1 where a span starts and -1 after it ends
+        offsets = (span_rows - top) * (self.width + 1)
+        size = num_rows * (self.width + 1)
+        difference = np.bincount(offsets + starts[valid], minlength=size) - np.bincount(offsets + ends[valid], minlength=size)
+        swept = np.cumsum(difference.reshape(num_rows, self.width + 1), axis=1)[:, :self.width] > 0
+        return top, swept
+
+
+def run_event_replicate(parameters, seed=None, footprint=None):
+    """
+    Runs one replicate episode with the event-driven simulation, the counterpart of run_replicate.
+
+    :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral).
+    :type parameters: tuple
+    :param seed: seed of the random numbers drawn by the behavior tree, or None to use the random module.
+    :type seed: int
+    :param footprint: cells cleaned around the robot.
+    :type footprint: Footprint
+    :return: the time needed to clean the area.
+    :rtype: float
+    """
+    rng = None if seed is None else np.random.default_rng(seed)
+    return EventSimulation(parameters, rng, ROOMBA_RADIUS, footprint).run()
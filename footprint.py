@@ -0,0 +1,229 @@
+import numpy as np
+from functools import lru_cache
+from math import floor, ceil, sin, cos, atan2, fabs, copysign, pi, sqrt
+from constants import M2PIX, SAMPLE_TIME, FORWARD_SPEED
+
+
+@lru_cache(maxsize=None)
+def get_swept_margin(radius_cells, step_cells, num_headings=64, lengths=(20.0, 220.0)):
+    """
+    Computes how much further than its radius the circular mask reaches along a straight path, when it is stamped
+    on the cell that contains the center every step_cells. The mask is moved along paths of two lengths for headings
+    between 0 and 45 degrees (the others are symmetric), and the extra cells cleaned per unit of length give the
+    width of the band it cleans; the margin is half that width minus the radius, on average over the headings.
+
+    :param radius_cells: the robot's radius, in cells.
+    :type radius_cells: float
+    :param step_cells: distance between two stamps of the mask, in cells.
+    :type step_cells: float
+    :param num_headings: number of headings of the paths.
+    :type num_headings: int
+    :param lengths: lengths of the paths, in cells.
+    :type lengths: tuple of float
+    :return: the margin, in cells.
+    :rtype: float
+    """
+    half_size = int(ceil(radius_cells))
+    offsets = np.arange(-half_size, half_size + 1)
+    rows, cols = np.nonzero(offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2 <= radius_cells ** 2)
+    rows -= half_size
+    cols -= half_size
+    widths = []
+    for k in range(num_headings):
+        heading = (k + 0.5) * (pi / 4.0) / num_headings
+        counts = []
+        for length in lengths:
+            distances = np.arange(0.0, length, step_cells)
+            center_rows = np.floor(0.5 + distances * sin(heading)).astype(np.int64)
+            center_cols = np.floor(0.5 + distances * cos(heading)).astype(np.int64)
+            cells = (center_rows[:, np.newaxis] + rows[np.newaxis, :]) * (1 << 20) + center_cols[:, np.newaxis] + cols[np.newaxis, :]
+            counts.append(len(np.unique(cells)))
+        widths.append((counts[1] - counts[0]) / (lengths[1] - lengths[0]) / 2.0)
+    return float(np.mean(widths)) - radius_cells
+
+
+class Footprint(object):
+    """
+    Represents the cells cleaned by the roomba around its center, i.e. its circular body on the coverage grid.
+
+    The circular mask is computed once, so stamping it at a new position is a single slice operation.
+    """
+    def __init__(self, radius, m2pix=M2PIX):
+        """
+        Creates the footprint of a roomba.
+
+        :param radius: the robot's radius.
+        :type radius: float
+        :param m2pix: factor to convert from meters to grid cells.
+        :type m2pix: float
+        """
+        self.m2pix = m2pix
+        self.radius = radius
+        radius_cells = radius * m2pix
+        self.half_size = int(ceil(radius_cells))
+        offsets = np.arange(-self.half_size, self.half_size + 1)
+        self.mask = offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2 <= radius_cells ** 2
+        # Offsets of the cleaned cells relative to the center cell, used by vectorized stampers
+        rows, cols = np.nonzero(self.mask)
+        self.row_offsets = rows - self.half_size
+        self.col_offsets = cols - self.half_size
+        self.num_cells = len(rows)
+        self.swept_margin = None
+
+    def get_center_cell(self, x, y):
+        """
+        Obtains the grid cell that contains a position.
+
+        :param x: x coordinate of the position.
+        :type x: float
+        :param y: y coordinate of the position.
+        :type y: float
+        :return: row and column of the cell.
+        :rtype: tuple of int
+        """
+        return floor(y * self.m2pix), floor(x * self.m2pix)
+
+    def get_swept_radius(self):
+        """
+        Obtains the radius used by swept stamps: the robot's radius plus the margin by which the mask, stamped at
+        every default time step of the robot moving forward, reaches beyond it (see get_swept_margin). So swept
+        stamps measure the same coverage as the mask stamped at every time step of 1/60 s.
+
+        :return: the radius, in cells.
+        :rtype: float
+        """
+        if self.swept_margin is None:
+            self.swept_margin = get_swept_margin(self.radius * self.m2pix, FORWARD_SPEED * SAMPLE_TIME * self.m2pix)
+        return self.radius * self.m2pix + self.swept_margin
+
+    def stamp(self, coverage, x, y):
+        """
+        Marks the cells under the robot as clean.
+
+        :param coverage: the coverage grid of the room.
+        :type coverage: CoverageTracker
+        :param x: x coordinate of the robot's center.
+        :type x: float
+        :param y: y coordinate of the robot's center.
+        :type y: float
+        :return: number of cells cleaned by this stamp that were not clean before.
+        :rtype: int
+        """
+        row, col = self.get_center_cell(x, y)
+        return coverage.stamp_mask(row - self.half_size, col - self.half_size, self.mask)
+
+    def stamp_swept(self, coverage, x, y, rotation, linear_speed, angular_speed, duration):
+        """
+        Marks as clean the cells swept by the robot while it moves with a constant velocity, with the same
+        equations as Roomba.move: the cells whose centers are within the swept radius (see get_swept_radius) of its
+        path. The swept area is a capsule for a straight motion and an annular sector with round ends for an arc,
+        so nothing is left uncovered between two poses however long the time step is.
+
+        :param coverage: the coverage grid of the room.
+        :type coverage: CoverageTracker
+        :param x: x coordinate of the robot's center at the start of the motion.
+        :type x: float
+        :param y: y coordinate of the robot's center at the start of the motion.
+        :type y: float
+        :param rotation: the robot's rotation at the start of the motion.
+        :type rotation: float
+        :param linear_speed: the robot's linear speed.
+        :type linear_speed: float
+        :param angular_speed: the robot's angular speed.
+        :type angular_speed: float
+        :param duration: duration of the motion. A negative duration sweeps the motion that ended at the pose.
+        :type duration: float
+        :return: number of cells cleaned by this stamp that were not clean before.
+        :rtype: int
+        """
+        # Working in cell units, where the center of cell (row, col) is (col + 0.5, row + 0.5)
+        radius = self.get_swept_radius()
+        x0 = x * self.m2pix
+        y0 = y * self.m2pix
+        v = linear_speed * self.m2pix
+        w = angular_speed
+        dt = duration
+        straight = fabs(w) < 1.0e-3
+        if straight:
+            x1 = x0 + v * dt * cos(rotation + w * dt / 2.0)
+            y1 = y0 + v * dt * sin(rotation + w * dt / 2.0)
+            xs = [x0, x1]
+            ys = [y0, y1]
+        else:
+            # The center moves on a circle around the instantaneous center of rotation
+            turn_radius = v / w
+            center_x = x0 - turn_radius * sin(rotation)
+            center_y = y0 + turn_radius * cos(rotation)
+            turn_radius = fabs(turn_radius)
+            start_angle = atan2(y0 - center_y, x0 - center_x)
+            sweep = w * dt
+            x1 = center_x + turn_radius * cos(start_angle + sweep)
+            y1 = center_y + turn_radius * sin(start_angle + sweep)
+            xs = [x0, x1]
+            ys = [y0, y1]
+            # The bounding box of an arc also includes the extreme points of the circle inside the sector
+            for k in range(4):
+                if fabs(sweep) >= 2.0 * pi or (copysign(1.0, sweep) * (k * pi / 2.0 - start_angle)) % (2.0 * pi) <= fabs(sweep):
+                    xs.append(center_x + turn_radius * cos(k * pi / 2.0))
+                    ys.append(center_y + turn_radius * sin(k * pi / 2.0))
+        top = int(floor(min(ys) - radius))
+        left = int(floor(min(xs) - radius))
+        rows = np.arange(top, int(floor(max(ys) + radius)) + 1)[:, np.newaxis] + 0.5
+        cols = np.arange(left, int(floor(max(xs) + radius)) + 1)[np.newaxis, :] + 0.5
+        radius_squared = radius * radius
+        # Round ends, i.e. the robot at the start and at the end of the motion
+        mask = ((cols - x0) ** 2 + (rows - y0) ** 2 <= radius_squared) | ((cols - x1) ** 2 + (rows - y1) ** 2 <= radius_squared)
+        if straight:
+            length_squared = (x1 - x0) ** 2 + (y1 - y0) ** 2
+            if length_squared > 0.0:
+                # Distance to the segment, projecting each cell center on it
+                along = np.clip(((cols - x0) * (x1 - x0) + (rows - y0) * (y1 - y0)) / length_squared, 0.0, 1.0)
+                mask |= (cols - x0 - along * (x1 - x0)) ** 2 + (rows - y0 - along * (y1 - y0)) ** 2 <= radius_squared
+        elif turn_radius > 0.0:
+            # Inside the sector, the distance to the arc is the distance to its circle
+            angles = np.arctan2(rows - center_y, cols - center_x) - start_angle
+            if fabs(sweep) < 2.0 * pi:
+                inside = np.mod(np.copysign(1.0, sweep) * angles, 2.0 * pi) <= fabs(sweep)
+            else:
+                inside = True
+            distances = np.sqrt((cols - center_x) ** 2 + (rows - center_y) ** 2)
+            mask |= inside & (np.abs(distances - turn_radius) <= radius)
+        return coverage.stamp_mask(top, left, mask)
+
+    def get_max_new_cells(self, max_shift):
+        """
+        Computes the maximum number of cells a stamp may newly clean when the center cell has moved by at most
+        max_shift cells along each axis since the previous stamp.
+
+        :param max_shift: maximum displacement of the center cell along each axis, in cells.
+        :type max_shift: int
+        :return: maximum number of newly cleaned cells.
+        :rtype: int
+        """
+        size = self.mask.shape[0]
+        previous = np.zeros((size + 2 * max_shift, size + 2 * max_shift), dtype=bool)
+        previous[max_shift:max_shift + size, max_shift:max_shift + size] = self.mask
+        max_new_cells = 0
+        for row_shift in range(2 * max_shift + 1):
+            for col_shift in range(2 * max_shift + 1):
+                shifted = previous[row_shift:row_shift + size, col_shift:col_shift + size]
+                max_new_cells = max(max_new_cells, np.count_nonzero(self.mask & ~shifted))
+        return max_new_cells
+
+    def get_max_swept_cells(self, max_distance):
+        """
+        Computes an upper bound of the number of cells stamp_swept may newly clean when the robot has moved by at
+        most max_distance (along its path, including the pushes of the walls) since the end of the previous stamp.
+
+        The new cells have their centers within the swept radius of the path but not of its start, an area of at
+        most 2 * radius * max_distance; counting every cell that touches such an area adds a ring of half a cell
+        diagonal around the robot.
+
+        :param max_distance: maximum length of the path, in meters.
+        :type max_distance: float
+        :return: maximum number of newly cleaned cells.
+        :rtype: int
+        """
+        radius = self.get_swept_radius()
+        margin = sqrt(2.0) / 2.0
+        return int(ceil(4.0 * pi * radius * margin + 2.0 * (radius + margin) * max_distance * self.m2pix))
@@ -0,0 +1,350 @@
+import random
+import numpy as np
+from math import sin, cos, atan2, fabs, copysign, sqrt, pi, ceil, floor, inf
+from constants import *
+from coverage_grid import CoverageTracker, get_grid_shape
+from footprint import Footprint
+from behavior_tree_test import run_replicate, get_max_new_cells, get_max_ticks, CensoredTime
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # Numba is optional: without it, the episodes run in the pure-Python simulation
+    NUMBA_AVAILABLE = False
+
+
+def _clamp(value, min_value, max_value):
+    if value > max_value:
+        return max_value
+    elif value < min_value:
+        return min_value
+    return value
+
+
+def _stamp_swept(grid, x, y, rotation, v, w, dt, radius):
+    """
+    Marks as clean the cells swept by the robot while it moves with a constant velocity, with the same rules and
+    arithmetic as Footprint.stamp_swept. Everything is in cell units. This function is compiled by Numba.
+
+    :return: number of cells cleaned by this stamp that were not clean before.
+    :rtype: int
+    """
+    height, width = grid.shape
+    straight = fabs(w) < 1.0e-3
+    center_x = 0.0
+    center_y = 0.0
+    turn_radius = 0.0
+    start_angle = 0.0
+    sweep = 0.0
+    if straight:
+        x1 = x + v * dt * cos(rotation + w * dt / 2.0)
+        y1 = y + v * dt * sin(rotation + w * dt / 2.0)
+        min_x, max_x, min_y, max_y = min(x, x1), max(x, x1), min(y, y1), max(y, y1)
+    else:
+        turn_radius = v / w
+        center_x = x - turn_radius * sin(rotation)
+        center_y = y + turn_radius * cos(rotation)
+        turn_radius = fabs(turn_radius)
+        start_angle = atan2(y - center_y, x - center_x)
+        sweep = w * dt
+        x1 = center_x + turn_radius * cos(start_angle + sweep)
+        y1 = center_y + turn_radius * sin(start_angle + sweep)
+        min_x, max_x, min_y, max_y = min(x, x1), max(x, x1), min(y, y1), max(y, y1)
+        for k in range(4):
+            if fabs(sweep) >= 2.0 * pi or (copysign(1.0, sweep) * (k * pi / 2.0 - start_angle)) % (2.0 * pi) <= fabs(sweep):
+                extreme_x = center_x + turn_radius * cos(k * pi / 2.0)
+                extreme_y = center_y + turn_radius * sin(k * pi / 2.0)
+                min_x, max_x = min(min_x, extreme_x), max(max_x, extreme_x)
+                min_y, max_y = min(min_y, extreme_y), max(max_y, extreme_y)
+    radius_squared = radius * radius
+    length_squared = (x1 - x) ** 2 + (y1 - y) ** 2
+    newly_cleaned = 0
+    for row in range(max(int(floor(min_y - radius)), 0), min(int(floor(max_y + radius)) + 1, height)):
+        cy = row + 0.5
+        for col in range(max(int(floor(min_x - radius)), 0), min(int(floor(max_x + radius)) + 1, width)):
+            if grid[row, col]:
+                continue
+            cx = col + 0.5
+            covered = (cx - x) ** 2 + (cy - y) ** 2 <= radius_squared or (cx - x1) ** 2 + (cy - y1) ** 2 <= radius_squared
+            if not covered:
+                if straight:
+                    if length_squared > 0.0:
+                        along = min(max(((cx - x) * (x1 - x) + (cy - y) * (y1 - y)) / length_squared, 0.0), 1.0)
+                        covered = (cx - x - along * (x1 - x)) ** 2 + (cy - y - along * (y1 - y)) ** 2 <= radius_squared
+                elif turn_radius > 0.0:
+                    inside = True
+                    if fabs(sweep) < 2.0 * pi:
+                        inside = (copysign(1.0, sweep) * (atan2(cy - center_y, cx - center_x) - start_angle)) % (2.0 * pi) <= fabs(sweep)
+                    covered = inside and fabs(sqrt((cx - center_x) ** 2 + (cy - center_y) ** 2) - turn_radius) <= radius
+            if covered:
+                grid[row, col] = True
+                newly_cleaned += 1
+    return newly_cleaned
+
+
+def _run_episode(parameters, random_numbers, grid, span_rows, span_half_widths, radius, target_cells, max_new_cells,
+                 time_cutoff, sample_time, m2pix, max_time, swept, swept_radius, room_width, room_height, speeds,
+                 max_ticks):
+    """
+    Runs a whole episode on plain arrays, with the same rules and arithmetic as run_episode with a Roomba ticking
+    RoombaBehaviorTree. This function is compiled by Numba.
+
+    :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral).
+    :type parameters: numpy array
+    :param random_numbers: uniform random numbers, consumed in pairs by each rotation like RotateNode.
+    :type random_numbers: numpy array
+    :param grid: coverage grid, where no cell has been cleaned yet.
+    :type grid: numpy array of bool
+    :param span_rows: row offset of each row of the footprint relative to its center cell.
+    :type span_rows: numpy array
+    :param span_half_widths: half width of each row of the footprint, in cells.
+    :type span_half_widths: numpy array
+    :param radius: the robot's radius.
+    :type radius: float
+    :param target_cells: number of clean cells that finishes the episode.
+    :type target_cells: int
+    :param max_new_cells: maximum number of newly cleaned cells per time step.
+    :type max_new_cells: int
+    :param time_cutoff: time above which the episode is aborted.
+    :type time_cutoff: float
+    :param sample_time: duration of a time step.
+    :type sample_time: float
+    :param m2pix: factor to convert from meters to grid cells.
+    :type m2pix: float
+    :param max_time: time limit of the episode.
+    :type max_time: float
+    :param swept: if the area swept during each time step is stamped, instead of the footprint at its end.
+    :type swept: bool
+    :param swept_radius: radius of the swept stamps, in cells (see Footprint.get_swept_radius).
+    :type swept_radius: float
+    :param room_width: width of the room.
+    :type room_width: float
+    :param room_height: height of the room.
+    :type room_height: float
+    :param speeds: forward, backward and angular speeds of the leaves, and the maximum linear and angular speeds.
+    :type speeds: tuple of float
+    :param max_ticks: maximum number of time steps per step of the episode, used with swept only.
+    :type max_ticks: int
+    :return: the episode's time (a lower bound if aborted) and if it was aborted.
+    :rtype: tuple
+    """
+    move_forward_time = parameters[0]
+    move_in_spiral_time = parameters[1]
+    go_back_time = parameters[2]
+    spiral_factor = parameters[3]
+    initial_radius_spiral = parameters[4]
+    height, width = grid.shape
+    forward_speed, backward_speed, angular_speed, max_linear_speed, max_angular_speed = speeds
+    dt = sample_time
+    # Robot's state
+    x = room_width / 2.0
+    y = room_height / 2.0
+    rotation = 0.0
+    # Behavior tree's state
+    node = NO_NODE
+    node_ticks = 0
+    rotation_time = 0.0
+    rotation_signal = 1.0
+    draws = 0
+    cleaned_cells = 0
+    last_row = -1
+    last_col = -1
+    last_x = -inf
+    last_y = -inf
+    v = 0.0
+    w = 0.0
+    t = 0.0
+    ticks = 1
+    while True:
+        if t > max_time:
+            return t, False
+        # Stamping the footprint
+        row = int(floor(y * m2pix))
+        col = int(floor(x * m2pix))
+        if swept:
+            # The motion of the last step, traced back from the current pose; a rotation in place where the
+            # last stamp ended cannot clean anything new
+            if v != 0.0 or x != last_x or y != last_y:
+                cleaned_cells += _stamp_swept(grid, x * m2pix, y * m2pix, rotation, v * m2pix, w, -ticks * dt, swept_radius)
+            last_x = x
+            last_y = y
+        # Stamping again on the same center cell cannot clean anything new
+        elif row != last_row or col != last_col:
+            for i in range(span_rows.shape[0]):
+                r = row + span_rows[i]
+                if r < 0 or r >= height:
+                    continue
+                for c in range(max(col - span_half_widths[i], 0), min(col + span_half_widths[i] + 1, width)):
+                    if not grid[r, c]:
+                        grid[r, c] = True
+                        cleaned_cells += 1
+            last_row = row
+            last_col = col
+        if cleaned_cells >= target_cells:
+            return t, False
+        time_bound = min(t + ceil((target_cells - cleaned_cells) / max_new_cells) * dt, max_time)
+        if time_bound > time_cutoff:
+            return time_bound, True
+        # Checking collision
+        bumper_state = False
+        if x - radius <= 0.0:
+            x = radius
+            bumper_state = True
+        if x + radius >= room_width:
+            x = room_width - radius
+            bumper_state = True
+        if y - radius <= 0.0:
+            y = radius
+            bumper_state = True
+        if y + radius >= room_height:
+            y = room_height - radius
+            bumper_state = True
+        # Ticking the behavior tree
+        if node == NO_NODE:
+            node = MOVE_FORWARD
+            node_ticks = 0
+        v = 0.0
+        w = 0.0
+        while True:
+            node_ticks += 1
+            node_time = node_ticks * dt
+            if node == MOVE_FORWARD:
+                v, w = forward_speed, 0.0
+                if bumper_state:
+                    node = GO_BACK
+                    node_ticks = 0
+                elif node_time > move_forward_time:
+                    node = MOVE_IN_SPIRAL
+                    node_ticks = 0
+                else:
+                    break
+            elif node == MOVE_IN_SPIRAL:
+                v, w = forward_speed, forward_speed / (initial_radius_spiral + spiral_factor * node_time)
+                if node_time > move_in_spiral_time:
+                    node = NO_NODE
+                    break
+                elif bumper_state:
+                    node = GO_BACK
+                    node_ticks = 0
+                else:
+                    break
+            elif node == GO_BACK:
+                v, w = backward_speed, 0.0
+                if node_time > go_back_time:
+                    node = ROTATE
+                    node_ticks = 0
+                    rotation_time = 3.0 * random_numbers[draws]
+                    rotation_signal = -1.0 if random_numbers[draws + 1] < 0.5 else 1.0
+                    draws += 2
+                else:
+                    break
+            else:
+                v, w = 0.0, rotation_signal * angular_speed
+                if node_time > rotation_time:
+                    node = NO_NODE
+                break
+        v = _clamp(v, -max_linear_speed, max_linear_speed)
+        w = _clamp(w, -max_angular_speed, max_angular_speed)
+        # Skipping the next ticks of the running leaf while its timer runs and the robot cannot touch a wall
+        ticks = 1
+        if swept and max_ticks > 1 and node != NO_NODE:
+            if node == MOVE_FORWARD:
+                duration = move_forward_time
+            elif node == MOVE_IN_SPIRAL:
+                duration = move_in_spiral_time
+            elif node == GO_BACK:
+                duration = go_back_time
+            else:
+                duration = rotation_time
+            while ticks < max_ticks and not (node_ticks + ticks) * dt > duration:
+                ticks += 1
+            clearance = min(x - radius, room_width - radius - x, y - radius, room_height - radius - y)
+            distance = fabs(v) * dt
+            while ticks > 1 and ticks * distance >= clearance:
+                ticks -= 1
+            if node == MOVE_IN_SPIRAL:
+                total = w
+                for k in range(ticks - 1):
+                    node_ticks += 1
+                    node_time = node_ticks * dt
+                    total += _clamp(forward_speed / (initial_radius_spiral + spiral_factor * node_time), -max_angular_speed,
+                                    max_angular_speed)
+                w = _clamp(total / ticks, -max_angular_speed, max_angular_speed)
+            else:
+                node_ticks += ticks - 1
+        # Moving the robot
+        step_time = dt * ticks
+        if fabs(w) < 1.0e-3:
+            x += v * step_time * cos(rotation + w * step_time / 2.0)
+            y += v * step_time * sin(rotation + w * step_time / 2.0)
+        else:
+            x += (2.0 * v / w) * cos(rotation + w * step_time / 2.0) * sin(w * step_time / 2.0)
+            y += (2.0 * v / w) * sin(rotation + w * step_time / 2.0) * sin(w * step_time / 2.0)
+        rotation += w * step_time
+        for k in range(ticks):
+            t += dt
+
+
+if NUMBA_AVAILABLE:
+    # Numba's cache only checks this file, so the kernel gets the physical constants of constants.py as arguments: a
+    # global would be frozen into the cached machine code
+    _clamp = njit(cache=True)(_clamp)
+    _stamp_swept = njit(cache=True)(_stamp_swept)
+    _run_episode = njit(cache=True)(_run_episode)
+
+
+def run_jit_replicate(parameters, seed=None, footprint=None, time_cutoff=None, fidelity=None):
+    """
+    Runs one replicate episode in the Numba-compiled kernel, the counterpart of run_replicate.
+    Without Numba, it simply calls run_replicate.
+
+    The kernel draws all the random numbers an episode may need at once, so an episode with a seed is identical to
+    run_replicate with that seed. Without a seed, the episode's generator is seeded from the random module.
+
+    :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral).
+    :type parameters: tuple
+    :param seed: seed of the random numbers drawn by the behavior tree, or None to seed them from the random module.
+    :type seed: int
+    :param footprint: cells cleaned around the robot.
+    :type footprint: Footprint
+    :param time_cutoff: time above which the episode is aborted, returning a CensoredTime.
+    :type time_cutoff: float
+    :param fidelity: time step, cell size and time limit of the episode, or None for the full fidelity.
+    :type fidelity: Fidelity
+    :return: the time needed to clean the area.
+    :rtype: float
+    """
+    if not NUMBA_AVAILABLE:
+        return run_replicate(parameters, seed, footprint, time_cutoff=time_cutoff, fidelity=fidelity)
+    sample_time, m2pix, max_time, swept, max_ticks = SAMPLE_TIME, M2PIX, MAX_EPISODE_TIME, False, 1
+    if fidelity is not None:
+        sample_time, m2pix, max_time, swept = fidelity.sample_time, fidelity.m2pix, fidelity.max_time, fidelity.swept
+        if swept:
+            # Like run_replicate, the behavior keeps the full fidelity's time step
+            sample_time, max_ticks = SAMPLE_TIME, get_max_ticks(fidelity.sample_time)
+    if footprint is None:
+        footprint = Footprint(ROOMBA_RADIUS, m2pix)
+    if seed is None:
+        seed = random.getrandbits(64)
+    rng = np.random.default_rng(seed)
+    # A rotation starts at most once per time step (going back may end within a single step when go_back_time is
+    # below the sample time), and each one draws two numbers
+    max_steps = int(ceil(max_time / sample_time)) + 2
+    random_numbers = rng.random(2 * max_steps + 2)
+    # The footprint is stamped as a span of cells in each of its rows
+    row_counts = footprint.mask.sum(axis=1)
+    span_rows = np.flatnonzero(row_counts) - footprint.half_size
+    span_half_widths = row_counts[row_counts > 0] // 2
+    coverage = CoverageTracker(*get_grid_shape(footprint.m2pix))
+    t, censored = _run_episode(np.asarray(parameters, dtype=float), random_numbers, coverage.grid,
+                               span_rows, span_half_widths, ROOMBA_RADIUS,
+                               coverage.get_target_cells(COVERAGE_TARGET), get_max_new_cells(footprint, sample_time, swept),
+                               inf if time_cutoff is None else float(time_cutoff), sample_time, footprint.m2pix, max_time,
+                               swept, footprint.get_swept_radius() if swept else 0.0, SCREEN_WIDTH * PIX2M,
+                               SCREEN_HEIGHT * PIX2M,
+                               (FORWARD_SPEED, BACKWARD_SPEED, ANGULAR_SPEED, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED),
+                               max_ticks)
+    return CensoredTime(t) if censored else t
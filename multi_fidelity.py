@@ -0,0 +1,202 @@
+import numpy as np
+from math import inf, ceil
+from constants import SAMPLE_TIME, M2PIX, MAX_EPISODE_TIME
+
+
+class Fidelity(object):
+    """
+    Represents how accurately the episodes of an evaluation are simulated.
+
+    Cheaper fidelities use a longer time step, a coarser coverage grid, fewer replicate episodes and a shorter time
+    limit. Their costs are biased (e.g. the coverage is counted on bigger cells, and the robot turns and stops later
+    with a longer time step), but they rank the parameter vectors well enough to discard the bad ones. With swept
+    stamps, a longer time step only sets how far apart the stamps may be: the behavior keeps ticking at SAMPLE_TIME
+    and each stamp covers the area swept since the previous one (see run_episode).
+    """
+    def __init__(self, sample_time=SAMPLE_TIME, m2pix=M2PIX, replicates=None, max_time=MAX_EPISODE_TIME, swept=False):
+        """
+        Creates a fidelity level. The default values are the full fidelity.
+
+        :param sample_time: duration of a time step, or of the longest step between two swept stamps.
+        :type sample_time: float
+        :param m2pix: factor to convert from meters to coverage grid cells, i.e. the inverse of the cell size.
+        :type m2pix: float
+        :param replicates: number of replicate episodes, the first ones of the evaluator, or None for all of them.
+        :type replicates: int
+        :param max_time: time limit of an episode.
+        :type max_time: float
+        :param swept: if the area swept during each time step is stamped, instead of the footprint at its end.
+        :type swept: bool
+        """
+        self.sample_time = sample_time
+        self.m2pix = m2pix
+        self.replicates = replicates
+        self.max_time = max_time
+        self.swept = swept
+
+    def get_key(self):
+        """
+        Obtains the values of the fidelity, used in the keys of the cached evaluations.
+
+        :return: the sample time, the cell size factor, the number of replicates, the time limit and the stamping.
+        :rtype: list
+        """
+        return [self.sample_time, self.m2pix, self.replicates, self.max_time, self.swept]
+
+    def __repr__(self):
+        return 'Fidelity(sample_time={}, m2pix={}, replicates={}, max_time={}, swept={})'.format(*self.get_key())
+
+
+# Default fidelity levels of successive halving, from the cheapest to the full fidelity
+default_fidelities = [Fidelity(sample_time=1.0 / 15.0, m2pix=M2PIX / 4.0, replicates=1, max_time=MAX_EPISODE_TIME / 2.0, swept=True),
+                      Fidelity(sample_time=1.0 / 30.0, m2pix=M2PIX / 2.0, replicates=2, swept=True),
+                      None]
+
+
+class LowFidelityCost(float):
+    """
+    Cost of a parameter vector that was discarded by successive halving before reaching the full fidelity.
+
+    It keeps the order of the costs measured at the fidelity where the parameter vector was discarded, but is
+    above the cost of every parameter vector promoted further, so an optimizer ranks the discarded ones last, as
+    successive halving did. Being a float, it can be used wherever a cost is expected; isinstance tells it apart
+    from a full-fidelity cost.
+    """
+    low_fidelity = True
+
+
+def successive_halving(evaluator, candidates, fidelities=None, eta=3, cutoff=None):
+    """
+    Evaluates parameter vectors with successive halving: all of them are evaluated at the cheapest fidelity, the
+    best 1/eta of them are promoted to the next fidelity, and so on up to the last fidelity.
+
+    :param evaluator: evaluator whose map accepts a fidelity, such as ParallelEvaluator or CachedEvaluator.
+    :param candidates: parameter vectors to be evaluated.
+    :type candidates: list of numpy array.
+    :param fidelities: fidelity of each rung, from the cheapest one; None stands for the full fidelity.
+    :type fidelities: list of Fidelity.
+    :param eta: inverse of the fraction of parameter vectors promoted to the next rung.
+    :type eta: int.
+    :param cutoff: cost above which the evaluations of the last rung are aborted, as in ParallelEvaluator.map.
+    :type cutoff: float.
+    :return: cost of each parameter vector (a LowFidelityCost for the ones that did not reach the last rung) and
+    the rung each one reached.
+    :rtype: tuple of lists.
+    """
+    if fidelities is None:
+        fidelities = default_fidelities
+    candidates = [np.asarray(candidate, dtype=float) for candidate in candidates]
+    rungs = [0] * len(candidates)
+    rung_costs = [None] * len(candidates)
+    alive = list(range(len(candidates)))
+    for rung, fidelity in enumerate(fidelities):
+        last = rung == len(fidelities) - 1
+        costs = evaluator.map([candidates[i] for i in alive], cutoff if last else None, fidelity=fidelity)
+        for i, cost in zip(alive, costs):
+            rungs[i] = rung
+            rung_costs[i] = cost
+        if last:
+            break
+        # Ties are broken by the order of the parameter vectors, so that the promotions are reproducible
+        order = sorted(range(len(alive)), key=lambda k: (float(costs[k]), k))
+        alive = sorted(alive[k] for k in order[:max(1, int(ceil(len(alive) / eta)))])
+    # The discarded parameter vectors are ranked below every one promoted further, rung by rung
+    results = [None] * len(candidates)
+    floor = -inf
+    for rung in range(len(fidelities) - 1, -1, -1):
+        members = [i for i in range(len(candidates)) if rungs[i] == rung]
+        if not members:
+            continue
+        if rung == len(fidelities) - 1:
+            for i in members:
+                results[i] = rung_costs[i]
+        else:
+            lowest = min(float(rung_costs[i]) for i in members)
+            for i in members:
+                results[i] = LowFidelityCost(np.nextafter(floor, inf) + float(rung_costs[i]) - lowest)
+        floor = max(floor, max(float(results[i]) for i in members))
+    return results, rungs
+
+
+class SuccessiveHalvingEvaluator(object):
+    """
+    Evaluates each batch of an optimizer with successive halving, so that only the most promising parameter
+    vectors of the batch are simulated at full fidelity.
+    """
+    def __init__(self, evaluator, fidelities=None, eta=3):
+        """
+        Creates the evaluator.
+
+        :param evaluator: evaluator whose map accepts a fidelity, such as CachedEvaluator.
+        :param fidelities: fidelity of each rung, from the cheapest one; None stands for the full fidelity.
+        :type fidelities: list of Fidelity.
+        :param eta: inverse of the fraction of parameter vectors promoted to the next rung.
+        :type eta: int.
+        """
+        self.evaluator = evaluator
+        self.fidelities = fidelities if fidelities is not None else default_fidelities
+        self.eta = eta
+        self.evaluations = [0] * len(self.fidelities)
+
+    def map(self, candidates, cutoff=None):
+        """
+        Evaluates a batch of parameter vectors with successive halving.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param cutoff: cost above which the full-fidelity evaluations are aborted. A cutoff per parameter vector
+        is replaced by the largest one.
+        :type cutoff: float or list of float.
+        :return: cost of each parameter vector, in the same order.
+        :rtype: list of float.
+        """
+        if cutoff is not None and np.ndim(cutoff) > 0:
+            cutoff = float(np.max(cutoff))
+        costs, rungs = successive_halving(self.evaluator, candidates, self.fidelities, self.eta, cutoff)
+        for rung in rungs:
+            for k in range(rung + 1):
+                self.evaluations[k] += 1
+        return costs
+
+    def get_statistics(self):
+        """
+        Obtains the number of parameter vectors evaluated at each fidelity.
+
+        :return: the statistics.
+        :rtype: dict.
+        """
+        return {'evaluations': list(self.evaluations)}
+
+    def close(self):
+        """
+        Closes the evaluator.
+        """
+        self.evaluator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def screen_population(evaluator, candidates, size, fidelities=None, eta=3):
+    """
+    Selects the most promising parameter vectors of a large pool with successive halving, e.g. to build the
+    initial population of an optimizer.
+
+    :param evaluator: evaluator whose map accepts a fidelity, such as CachedEvaluator.
+    :param candidates: pool of parameter vectors.
+    :type candidates: list of numpy array.
+    :param size: number of parameter vectors selected.
+    :type size: int.
+    :param fidelities: fidelity of each rung, from the cheapest one; None stands for the full fidelity.
+    :type fidelities: list of Fidelity.
+    :param eta: inverse of the fraction of parameter vectors promoted to the next rung.
+    :type eta: int.
+    :return: the selected parameter vectors, from the best one, and their costs.
+    :rtype: tuple of lists.
+    """
+    costs, rungs = successive_halving(evaluator, candidates, fidelities, eta)
+    order = sorted(range(len(candidates)), key=lambda i: (float(costs[i]), i))[:size]
+    return [np.asarray(candidates[i], dtype=float) for i in order], [costs[i] for i in order]
@@ -0,0 +1,313 @@
+import json
+import time
+import argparse
+import numpy as np
+from math import inf
+from constants import MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL
+from evaluator import ParallelEvaluator, is_exact_cost
+from cache import EvaluationCache, CachedEvaluator
+from surrogate import SurrogateEvaluator
+
+
+initial_guess = np.array([MOVE_FORWARD_TIME, MOVE_IN_SPIRAL_TIME, GO_BACK_TIME, SPIRAL_FACTOR, INITIAL_RADIUS_SPIRAL])
+# Every optimizer searches the same box
+lower_bound = 0.8 * initial_guess
+upper_bound = 1.2 * initial_guess
+replicate_seeds = [1, 2, 3]  # common random numbers, shared by every optimizer
+cache_tolerance = 1.0e-3 * (upper_bound - lower_bound)  # points closer than this share the same evaluation
+
+
+class BudgetedEvaluator(object):
+    """
+    Evaluates batches of parameter vectors for an optimizer under a budget of simulated episodes or wall-clock
+    seconds, recording a convergence trace.
+
+    After each batch, the trace gets a record with the number of parameter vectors evaluated, the number of
+    episodes simulated and the seconds elapsed since the evaluator was created, and the best cost so far.
+    Censored costs (aborted evaluations), costs predicted by a surrogate model and low-fidelity costs never become
+    the best cost.
+    The budget is checked between batches, so the last batch may exceed it; its record has the actual numbers.
+    Since cached evaluations simulate no episodes, an optimizer that has converged would never use up an episode
+    budget: the budget is also used up after max_idle_batches batches in a row that simulate nothing.
+    """
+    def __init__(self, evaluator, counter, max_episodes=None, max_seconds=None, max_idle_batches=10):
+        """
+        Creates the evaluator.
+
+        :param evaluator: evaluator of the batches, such as CachedEvaluator.
+        :param counter: the ParallelEvaluator at the end of the chain of evaluators, whose episodes are counted.
+        :type counter: ParallelEvaluator.
+        :param max_episodes: maximum number of simulated episodes, or None for no limit.
+        :type max_episodes: int.
+        :param max_seconds: maximum wall-clock time, in seconds, or None for no limit.
+        :type max_seconds: float.
+        :param max_idle_batches: number of batches in a row without simulated episodes that ends the run.
+        :type max_idle_batches: int.
+        """
+        self.evaluator = evaluator
+        self.counter = counter
+        self.max_episodes = max_episodes
+        self.max_seconds = max_seconds
+        self.max_idle_batches = max_idle_batches
+        self.idle_batches = 0
+        self.start_episodes = counter.episodes
+        self.start_time = time.perf_counter()
+        self.evaluations = 0
+        self.best_cost = inf
+        self.best_candidate = None
+        self.trace = []
+
+    def get_episodes(self):
+        """
+        Obtains the number of episodes simulated through this evaluator.
+        """
+        return self.counter.episodes - self.start_episodes
+
+    def get_elapsed_time(self):
+        """
+        Obtains the wall-clock time since this evaluator was created, in seconds.
+        """
+        return time.perf_counter() - self.start_time
+
+    def is_exhausted(self):
+        """
+        Checks if the budget has been used up.
+
+        :return: if no more batches should be evaluated.
+        :rtype: bool.
+        """
+        if self.max_episodes is not None and self.get_episodes() >= self.max_episodes:
+            return True
+        if self.idle_batches >= self.max_idle_batches:
+            return True
+        return self.max_seconds is not None and self.get_elapsed_time() >= self.max_seconds
+
+    def map(self, candidates, cutoff=None, fidelity=None):
+        """
+        Evaluates a batch of parameter vectors and records the convergence trace.
+        Lower-fidelity costs never become the best cost.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param cutoff: cost above which the evaluations are aborted, as in ParallelEvaluator.map.
+        :type cutoff: float or list of float.
+        :param fidelity: fidelity of the evaluations, as in ParallelEvaluator.map.
+        :type fidelity: Fidelity.
+        :return: cost of each parameter vector, in the same order.
+        :rtype: list of float.
+        """
+        episodes = self.get_episodes()
+        costs = self.evaluator.map(candidates, cutoff, fidelity=fidelity)
+        self.idle_batches = self.idle_batches + 1 if self.get_episodes() == episodes else 0
+        self.evaluations += len(costs)
+        for candidate, cost in zip(candidates, costs):
+            if fidelity is not None or not is_exact_cost(cost):
+                continue
+            if cost < self.best_cost:
+                self.best_cost = float(cost)
+                self.best_candidate = np.array(candidate, dtype=float)
+        self.trace.append({'evaluations': self.evaluations, 'episodes': self.get_episodes(),
+                           'seconds': self.get_elapsed_time(), 'best_cost': self.best_cost})
+        return costs
+
+    def close(self):
+        """
+        Closes the evaluator.
+        """
+        self.evaluator.close()
+
+
+def run_pso(evaluator, rng):
+    """
+    Runs Particle Swarm Optimization, with the hyperparameters of pso.py, until the budget is used up.
+
+    :param evaluator: the budgeted evaluator.
+    :type evaluator: BudgetedEvaluator.
+    :param rng: random number generator.
+    :type rng: numpy.random.Generator.
+    """
+    from pso import ParticleSwarmOptimization, hyperparams
+    pso = ParticleSwarmOptimization(hyperparams, lower_bound, upper_bound, rng)
+    while not evaluator.is_exhausted():
+        positions = pso.ask()
+        pso.tell(evaluator.map(positions, cutoff=pso.get_cutoffs_to_evaluate()))
+
+
+def run_simulated_annealing(evaluator, rng):
+    """
+    Runs the parallel-tempering Simulated Annealing, with the hyperparameters of simulated_annealing.py, until
+    the budget is used up.
+
+    :param evaluator: the budgeted evaluator.
+    :type evaluator: BudgetedEvaluator.
+    :param rng: random number generator.
+    :type rng: numpy.random.Generator.
+    """
+    from simulated_annealing import ParallelTempering, temperatures, exchange_interval
+    chains = ParallelTempering(initial_guess, lower_bound, upper_bound, temperatures, exchange_interval, rng=rng)
+    while not evaluator.is_exhausted():
+        points = chains.ask()
+        chains.tell(evaluator.map(points, cutoff=chains.get_cutoffs()))
+
+
+def run_cmaes(evaluator, rng):
+    """
+    Runs CMA-ES, with the hyperparameters of cmaes.py, until the budget is used up or CMA-ES stops (e.g. when its
+    step size has collapsed).
+    The samples are kept inside the box, like the other optimizers.
+
+    :param evaluator: the budgeted evaluator.
+    :type evaluator: BudgetedEvaluator.
+    :param rng: random number generator.
+    :type rng: numpy.random.Generator.
+    """
+    import cma
+    from cmaes import sigma0, evaluate_generation
+    m0 = rng.uniform(lower_bound, upper_bound)
+    es = cma.CMAEvolutionStrategy(m0, sigma0, {'popsize': 5, 'bounds': [list(lower_bound), list(upper_bound)],
+                                               'seed': int(rng.integers(1, 2 ** 31 - 1)), 'verbose': -9})
+    cutoff = inf
+    while not evaluator.is_exhausted() and not es.stop():
+        samples = es.ask()
+        # Samples that cannot be among the mu best ones are aborted, and ranked below the exact costs
+        fitnesses, cutoff, _ = evaluate_generation(evaluator, samples, es.sp.weights.mu, cutoff)
+        es.tell(samples, fitnesses)
+
+
+def run_genetic_algorithm(evaluator, rng):
+    """
+    Runs the Genetic Algorithm, with the hyperparameters of algoritmo_genetico.py, until the budget is used up.
+
+    :param evaluator: the budgeted evaluator.
+    :type evaluator: BudgetedEvaluator.
+    :param rng: random number generator.
+    :type rng: numpy.random.Generator.
+    """
+    import pygad
+    import algoritmo_genetico as ga
+
+    def fitness_func(solutions, solutions_idx):
+        return [1.0 / np.abs(cost) for cost in evaluator.map(solutions)]
+
+    def on_generation(ga_instance):
+        if evaluator.is_exhausted():
+            return 'stop'
+
+    ga_instance = pygad.GA(num_generations=10 ** 6,  # the budget stops the algorithm
+                           num_parents_mating=ga.num_parents_mating,
+                           fitness_func=fitness_func,
+                           sol_per_pop=ga.sol_per_pop,
+                           num_genes=ga.num_genes,
+                           parent_selection_type=ga.parent_selection_type,
+                           keep_parents=ga.keep_parents,
+                           crossover_type=ga.crossover_type,
+                           mutation_type=ga.mutation_type,
+                           mutation_percent_genes=ga.mutation_percent_genes,
+                           fitness_batch_size=ga.sol_per_pop,
+                           gene_space=[[low, high] for low, high in zip(lower_bound, upper_bound)],
+                           on_generation=on_generation,
+                           random_seed=int(rng.integers(1, 2 ** 31 - 1)))
+    ga_instance.run()
+
+
+optimizers = {'ga': run_genetic_algorithm, 'sa': run_simulated_annealing, 'pso': run_pso, 'cmaes': run_cmaes}
+
+
+def run_optimizer(name, counter, max_episodes=None, max_seconds=None, seed=None, use_surrogate=False, screen_fraction=0.4):
+    """
+    Runs an optimizer under a budget.
+
+    Each run has its own in-memory cache, so no optimizer reuses the evaluations of another one.
+
+    :param name: name of the optimizer, one of the keys of optimizers.
+    :type name: str.
+    :param counter: evaluator that simulates the episodes, shared by the runs.
+    :type counter: ParallelEvaluator.
+    :param max_episodes: maximum number of simulated episodes, or None for no limit.
+    :type max_episodes: int.
+    :param max_seconds: maximum wall-clock time, in seconds, or None for no limit.
+    :type max_seconds: float.
+    :param seed: seed of the optimizer's random numbers.
+    :type seed: int.
+    :param use_surrogate: if the batches are pre-screened by a surrogate model.
+    :type use_surrogate: bool.
+    :param screen_fraction: fraction of each batch that is simulated when using the surrogate model.
+    :type screen_fraction: float.
+    :return: the result of the run, with its convergence trace.
+    :rtype: dict.
+    """
+    if max_episodes is None and max_seconds is None:
+        raise ValueError("A budget of episodes or seconds is needed")
+    evaluator = CachedEvaluator(counter, EvaluationCache(tolerance=cache_tolerance))
+    if use_surrogate:
+        evaluator = SurrogateEvaluator(evaluator, lower_bound, upper_bound, screen_fraction)
+    evaluator = BudgetedEvaluator(evaluator, counter, max_episodes, max_seconds)
+    optimizers[name](evaluator, np.random.default_rng(seed))
+    episodes = evaluator.get_episodes()
+    seconds = evaluator.get_elapsed_time()
+    return {'optimizer': name, 'seed': seed, 'max_episodes': max_episodes, 'max_seconds': max_seconds,
+            'best_cost': evaluator.best_cost,
+            'best_candidate': None if evaluator.best_candidate is None else evaluator.best_candidate.tolist(),
+            'evaluations': evaluator.evaluations, 'episodes': episodes, 'seconds': seconds,
+            'episodes_per_second': episodes / seconds if seconds > 0.0 else inf, 'trace': evaluator.trace}
+
+
+def get_best_cost_at(trace, key, budget):
+    """
+    Obtains the best cost found within a budget from a convergence trace, to compare optimizers at the same
+    number of evaluations, episodes or seconds.
+
+    :param trace: convergence trace of a run.
+    :type trace: list of dict.
+    :param key: 'evaluations', 'episodes' or 'seconds'.
+    :type key: str.
+    :param budget: the budget.
+    :type budget: float.
+    :return: the best cost, or infinity if the first batch was already beyond the budget.
+    :rtype: float.
+    """
+    best_cost = inf
+    for record in trace:
+        if record[key] > budget:
+            break
+        best_cost = record['best_cost']
+    return best_cost
+
+
+def load_results(path):
+    """
+    Loads the results saved by the runner.
+
+    :param path: path of the JSON file.
+    :type path: str.
+    :return: the result of each run.
+    :rtype: list of dict.
+    """
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the optimizers under the same budget and saves their convergence traces.')
+    parser.add_argument('--optimizers', nargs='+', choices=sorted(optimizers), default=['ga', 'sa', 'pso', 'cmaes'])
+    parser.add_argument('--episodes', type=int, default=None, help='budget of simulated episodes of each run')
+    parser.add_argument('--seconds', type=float, default=None, help='budget of wall-clock seconds of each run')
+    parser.add_argument('--runs', type=int, default=1, help='number of runs of each optimizer, with seeds 0, 1, ...')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--jit', action='store_true', help='simulate the episodes with the Numba kernel')
+    parser.add_argument('--surrogate', action='store_true', help='pre-screen the batches with a surrogate model')
+    parser.add_argument('--output', default='traces.json', help='JSON file where the results are saved')
+    arguments = parser.parse_args()
+    if arguments.episodes is None and arguments.seconds is None:
+        parser.error('a budget is needed: --episodes and/or --seconds')
+
+    results = []
+    with ParallelEvaluator(arguments.processes, seeds=replicate_seeds, jit=arguments.jit) as counter:
+        for name in arguments.optimizers:
+            for run in range(arguments.runs):
+                result = run_optimizer(name, counter, arguments.episodes, arguments.seconds, run, arguments.surrogate)
+                results.append(result)
+                print('{optimizer} (seed {seed}): best cost {best_cost:.3f}, {evaluations} evaluations, {episodes} episodes, '
+                      '{seconds:.1f} s, {episodes_per_second:.2f} episodes/s'.format(**result))
+    with open(arguments.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
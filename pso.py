@@ -1,31 +1,12 @@
-from behavior_tree_test import simulacao
-import random
+from evaluator import ParallelEvaluator, is_exact_cost
+from cache import EvaluationCache, CachedEvaluator
+from surrogate import SurrogateEvaluator
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from multi_fidelity import SuccessiveHalvingEvaluator, screen_population, default_fidelities
 import numpy as np
-from this import d
 from math import inf
 from utils import Params
 
-class Particle:
-    """
-    Represents a particle of the Particle Swarm Optimization algorithm.
-    """
-    def __init__(self, lower_bound, upper_bound):
-        """
-        Creates a particle of the Particle Swarm Optimization algorithm.
-
-        :param lower_bound: lower bound of the particle position.
-        :type lower_bound: numpy array.
-        :param upper_bound: upper bound of the particle position.
-        :type upper_bound: numpy array.
-        """
-        
-        self.x = np.random.uniform(lower_bound, upper_bound)
-        delta = upper_bound - lower_bound
-        self.v = np.random.uniform(-delta, delta)
-        self.best_position = None
-        self.J_best_position = inf
-
-
 class ParticleSwarmOptimization:
     """
     Represents the Particle Swarm Optimization algorithm.
@@ -34,17 +15,30 @@ class ParticleSwarmOptimization:
         cognitive_parameter: cognitive parameter.
         social_parameter: social parameter.
 
+    The swarm is stored as a structure of arrays: the positions, velocities and best positions of the particles
+    are (num_particles x dimension) matrices, so a whole generation is updated with a few vectorized operations.
+    A generation can be evaluated at once, with ask() and tell(), or one particle at a time, with
+    get_position_to_evaluate() and notify_evaluation(). The positions are kept inside the bounds.
+    Only exact costs update the best positions: censored, predicted and lower-fidelity costs (see
+    evaluator.is_exact_cost) only say that a position is probably not better, so they are ignored.
+
     :param hyperparams: hyperparameters used by Particle Swarm Optimization.
     :type hyperparams: Params.
     :param lower_bound: lower bound of particle position.
     :type lower_bound: numpy array.
     :param upper_bound: upper bound of particle position.
     :type upper_bound: numpy array.
+    :param rng: random number generator, or None to create a new one.
+    :type rng: numpy.random.Generator.
+    :param initial_positions: initial positions of the particles, one per row, or None to draw them uniformly
+    within the bounds.
+    :type initial_positions: numpy array.
     """
 
-    def __init__(self, hyperparams, lower_bound, upper_bound):
-        self.lower_bound = lower_bound
-        self.upper_bound = upper_bound
+    def __init__(self, hyperparams, lower_bound, upper_bound, rng=None, initial_positions=None):
+        self.lower_bound = np.asarray(lower_bound, dtype=float)
+        self.upper_bound = np.asarray(upper_bound, dtype=float)
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.count = 0
 
         self.num_particles = hyperparams.num_particles
@@ -54,13 +48,18 @@ class ParticleSwarmOptimization:
 
         self.best_global = None
         self.J_best_global = inf
-        self.best_iteration = None
-        self.J_best_iteration = inf
-        
-        self.particles = []
-        for i in range(0, self.num_particles):
-            self.particles.append(Particle(lower_bound, upper_bound))
-        self.particles = np.array(self.particles)
+
+        shape = (self.num_particles, len(self.lower_bound))
+        delta = self.upper_bound - self.lower_bound
+        if initial_positions is None:
+            self.x = self.rng.uniform(self.lower_bound, self.upper_bound, shape)
+        else:
+            self.x = np.clip(np.array(initial_positions, dtype=float).reshape(shape), self.lower_bound, self.upper_bound)
+        self.v = self.rng.uniform(-delta, delta, shape)
+        self.best_positions = self.x.copy()
+        self.J_best_positions = np.full(self.num_particles, inf)
+        # Costs of the current generation, filled by notify_evaluation() (a list, which keeps their flags)
+        self.costs = [inf] * self.num_particles
 
     def get_best_position(self):
         """
@@ -70,10 +69,6 @@ class ParticleSwarmOptimization:
         :rtype: numpy array.
         """
 
-        if self.J_best_iteration < self.J_best_global:
-            self.J_best_global = self.J_best_iteration
-            self.best_global = self.best_iteration
-
         return self.best_global
 
     def get_best_value(self):
@@ -86,6 +81,36 @@ class ParticleSwarmOptimization:
 
         return self.J_best_global
 
+    def ask(self):
+        """
+        Obtains the positions of the current generation.
+
+        :return: positions to evaluate, one per row.
+        :rtype: numpy array.
+        """
+
+        return self.x.copy()
+
+    def tell(self, costs):
+        """
+        Notifies the algorithm of the costs of the current generation, advancing to the next one.
+
+        :param costs: cost of each position returned by ask(), in the same order.
+        :type costs: numpy array.
+        """
+
+        exact = np.array([is_exact_cost(cost) for cost in costs], dtype=bool)
+        costs = np.where(exact, np.asarray(costs, dtype=float), inf)
+        improved = costs < self.J_best_positions
+        self.J_best_positions[improved] = costs[improved]
+        self.best_positions[improved] = self.x[improved]
+        best = np.argmin(costs)
+        if costs[best] < self.J_best_global:
+            self.J_best_global = costs[best]
+            self.best_global = self.x[best].copy()
+        self.count = 0
+        self.advance_generation()
+
     def get_position_to_evaluate(self):
         """
         Obtains a new position to evaluate.
@@ -94,23 +119,44 @@ class ParticleSwarmOptimization:
         :rtype: numpy array.
         """
         
-        return self.particles[self.count].x
+        return self.x[self.count]
 
-    def advance_generation(self):
+    def get_positions_to_evaluate(self):
+        """
+        Obtains the positions of the whole generation that still have to be evaluated.
+
+        :return: positions to evaluate, in the order they must be notified.
+        :rtype: numpy array.
+        """
+
+        return self.x[self.count:].copy()
+
+    def get_cutoffs_to_evaluate(self):
         """
-        Advances the generation of particles. Auxiliary method to be used by notify_evaluation().
+        Obtains the values above which the evaluations of the remaining positions of the generation cannot change
+        the algorithm's state, i.e. the values of the best positions of their particles.
+
+        :return: cutoff of each position, in the same order as get_positions_to_evaluate.
+        :rtype: numpy array.
         """
-        best_global = self.get_best_position()
 
-        self.best_iteration = None
-        self.J_best_iteration = inf
+        return self.J_best_positions[self.count:].copy()
 
-        for particle in self.particles:
-            rp = random.uniform(0.0, 1.0)
-            rg = random.uniform(0.0, 1.0)
-            
-            particle.v = self.omega*particle.v + self.phip*rp*(particle.best_position - particle.x) + self.phig*rg*(best_global - particle.x)
-            particle.x = particle.x + particle.v
+    def advance_generation(self):
+        """
+        Advances the generation of particles. Auxiliary method to be used by tell().
+        """
+        # As in the original algorithm, each particle draws one cognitive and one social random factor
+        rp = self.rng.uniform(0.0, 1.0, (self.num_particles, 1))
+        rg = self.rng.uniform(0.0, 1.0, (self.num_particles, 1))
+        # Until a position has an exact cost, there is no global best position to attract the particles
+        best_global = self.best_global if self.best_global is not None else self.x
+        self.v = self.omega * self.v + self.phip * rp * (self.best_positions - self.x) + self.phig * rg * (best_global - self.x)
+        self.x = self.x + self.v
+        # Particles leaving the box stop at its border, losing the velocity that took them out
+        outside = (self.x < self.lower_bound) | (self.x > self.upper_bound)
+        self.x = np.clip(self.x, self.lower_bound, self.upper_bound)
+        self.v[outside] = 0.0
 
     def notify_evaluation(self, value):
         """
@@ -120,21 +166,11 @@ class ParticleSwarmOptimization:
         :type value: float.
         """
 
-        J_particle_x = value
-        particle = self.particles[self.count]
-                
-        if J_particle_x < particle.J_best_position:
-            particle.J_best_position = J_particle_x
-            particle.best_position = particle.x
-        if J_particle_x < self.J_best_iteration:
-            self.J_best_iteration = J_particle_x
-            self.best_iteration = particle.x
-
+        self.costs[self.count] = value
         if self.count < self.num_particles - 1:
             self.count += 1
         else:
-            self.count = 0
-            self.advance_generation()
+            self.tell(self.costs)
 
 
 '''
@@ -158,20 +194,76 @@ hyperparams.social_parameter = 0.8
 # Defining the lower and upper bounds
 lower_bound = np.array([0.8*3.0, 0.8*20.0, 0.8*0.5, 0.8*0.05, 0.8*0.2])
 upper_bound = np.array([1.2*3.0, 1.2*20.0, 1.2*0.5, 1.2*0.05, 1.2*0.2])
-pso = ParticleSwarmOptimization(hyperparams, lower_bound, upper_bound)
 
 num_evaluations = 500
-n = 0
 epsilon = 75
-position = pso.get_position_to_evaluate()
-value = inf
-while n <= num_evaluations and value > epsilon:
-  n += 1
-  print(n,'. ')
-  position = pso.get_position_to_evaluate()
-  value = simulacao(position[0], position[1], position[2], position[3], position[4])
-  pso.notify_evaluation(value)
-
-# Finally, print the best position found by the algorithm and its value
-print('Best position:', pso.get_best_position())
-print('Best value:', pso.get_best_value())
\ No newline at end of file
+replicate_seeds = [1, 2, 3]  # common random numbers: every candidate is simulated with the same replicate seeds
+use_racing = False  # candidates that cannot beat the best one so far use fewer episodes; races are not cached
+max_replicates = 10  # maximum number of episodes of a race
+cache_path = 'evaluations.sqlite'  # evaluations reused across runs
+cache_tolerance = 1.0e-3 * (upper_bound - lower_bound)  # points closer than this share the same evaluation
+use_surrogate = False  # only the candidates a surrogate model finds most promising are simulated; the others get predicted costs
+screen_fraction = 0.4  # fraction of each generation that is simulated when using the surrogate model
+checkpoint_path = 'pso_checkpoint.pkl'  # the run is resumed from this file if it exists
+checkpoint_interval = 1  # number of generations between checkpoints
+use_successive_halving = False  # generations are evaluated with successive halving over fidelities, instead of racing
+fidelities = default_fidelities  # fidelities of successive halving, from the cheapest one to the full fidelity
+eta = 3  # only the best 1/eta of the positions are promoted to the next fidelity
+initial_pool_factor = 4  # with successive halving, the initial positions are the best of this many times as many
+
+if __name__ == '__main__':
+    n = 0
+    generation = 0
+    value = inf
+    cache = EvaluationCache(cache_path, tolerance=cache_tolerance)
+    evaluator = CachedEvaluator(ParallelEvaluator(seeds=replicate_seeds), cache)
+    if use_surrogate:
+        # The surrogate model starts from the evaluations cached by previous runs
+        evaluator = SurrogateEvaluator(evaluator, lower_bound, upper_bound, screen_fraction)
+        evaluator.load_archive(*cache.get_archive(replicate_seeds, len(replicate_seeds)))
+    batch_evaluator = evaluator
+    initial_positions = None
+    if use_successive_halving:
+        batch_evaluator = SuccessiveHalvingEvaluator(evaluator, fidelities, eta)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        pso, n, generation, value = checkpoint['pso'], checkpoint['n'], checkpoint['generation'], checkpoint['value']
+        if use_surrogate:
+            evaluator.set_state(checkpoint['surrogate'])
+        print('Resuming from', checkpoint_path, 'after', generation, 'generations')
+    else:
+        if use_successive_halving:
+            # The initial swarm is the best part of a larger random pool, screened at low fidelity
+            rng = np.random.default_rng()
+            pool = rng.uniform(lower_bound, upper_bound, (initial_pool_factor * hyperparams.num_particles, len(lower_bound)))
+            initial_positions = screen_population(evaluator, pool, hyperparams.num_particles, fidelities, eta)[0]
+        pso = ParticleSwarmOptimization(hyperparams, lower_bound, upper_bound, initial_positions=initial_positions)
+    with evaluator:
+        while n <= num_evaluations and value > epsilon:
+            print(n + 1,'. ')
+            # The whole generation is simulated at once by the worker processes
+            positions = pso.ask()
+            if use_racing and not use_successive_halving:
+                races = evaluator.race(positions, pso.get_best_value(), max_replicates)
+                values = [mean for mean, stderr, replicates in races]
+            else:
+                # A position worse than its particle's best one is aborted, since only its best position is kept
+                values = batch_evaluator.map(positions, cutoff=pso.get_cutoffs_to_evaluate())
+            pso.tell(values)
+            n += len(values)
+            value = min([float(v) for v in values if is_exact_cost(v)], default=inf)
+            generation += 1
+            if generation % checkpoint_interval == 0:
+                save_checkpoint(checkpoint_path, {'pso': pso, 'n': n, 'generation': generation, 'value': value,
+                                                  'surrogate': evaluator.get_state() if use_surrogate else None})
+        # The run has finished, so the next one starts from scratch
+        remove_checkpoint(checkpoint_path)
+        print('Cache:', cache.get_statistics())
+        if use_surrogate:
+            print('Surrogate:', evaluator.get_statistics())
+        if use_successive_halving:
+            print('Successive halving:', batch_evaluator.get_statistics())
+
+    # Finally, print the best position found by the algorithm and its value
+    print('Best position:', pso.get_best_position())
+    print('Best value:', pso.get_best_value())
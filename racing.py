@@ -0,0 +1,50 @@
+import numpy as np
+from math import inf, sqrt
+from behavior_tree_test import run_replicate, summarize_replicates
+
+
+def race(parameters, seeds, incumbent=inf, min_replicates=3, confidence=1.96, precision=0.05):
+    """
+    Estimates the cost of a parameter vector running its replicate episodes one at a time, stopping as soon as
+    the estimate is good enough.
+
+    After min_replicates episodes, the race stops when the lower confidence bound of the mean time is above the
+    incumbent's cost (the candidate cannot beat it), or when the confidence interval is narrower than a fraction
+    of the mean (the estimate is precise enough). Otherwise it runs one episode per seed.
+    The confidence bounds use the normal approximation of the mean.
+
+    :param parameters: behavior parameters (move_forward_time, move_in_spiral_time, go_back_time, spiral_factor,
+    initial_radius_spiral).
+    :type parameters: tuple.
+    :param seeds: seeds of the replicate episodes, in the order they are run. Their number is the maximum number
+    of episodes.
+    :type seeds: list of int.
+    :param incumbent: cost of the best parameter vector known so far.
+    :type incumbent: float.
+    :param min_replicates: number of episodes run before the stopping rules are checked.
+    :type min_replicates: int.
+    :param confidence: number of standard errors of the confidence bounds.
+    :type confidence: float.
+    :param precision: half width of the confidence interval, relative to the mean, considered precise enough.
+    :type precision: float.
+    :return: estimate of the mean time, its standard error and the number of episodes used.
+    :rtype: tuple.
+    """
+    tempo = []
+    for seed in seeds:
+        tempo.append(run_replicate(parameters, seed))
+        n = len(tempo)
+        if n < max(min_replicates, 2):
+            continue
+        mean = np.mean(tempo)
+        stderr = np.std(tempo, ddof=1) / sqrt(n)
+        if mean - confidence * stderr > incumbent:
+            # The candidate cannot beat the incumbent
+            break
+        if confidence * stderr <= precision * mean:
+            # The mean is already precise enough
+            break
+    n = len(tempo)
+    mean = float(summarize_replicates(tempo))
+    stderr = float(np.std(tempo, ddof=1) / sqrt(n)) if n > 1 else inf
+    return mean, stderr, n
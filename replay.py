@@ -0,0 +1,71 @@
+import os
+import argparse
+from utils import Pose
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT, M2PIX, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED
+from roomba import Roomba
+from simulation import Simulation, draw
+from trajectory import load_trajectory
+
+
+def replay(path, speed=1.0, frames=None, frame_step=1, window=None):
+    """
+    Renders a recorded episode with Simulation.draw.
+
+    :param path: path of the trajectory file.
+    :type path: str
+    :param speed: playback speed relative to real time, or 0 to render as fast as possible.
+    :type speed: float
+    :param frames: directory where the rendered frames are saved as PNG images, or None to not save them.
+    :type frames: str
+    :param frame_step: number of time steps between rendered frames.
+    :type frame_step: int
+    :param window: pygame's window used to draw the episode, created if not given.
+    """
+    import pygame
+    records, metadata = load_trajectory(path)
+    if window is None:
+        pygame.init()
+        window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Replay: " + os.path.basename(path))
+    if frames is not None:
+        os.makedirs(frames, exist_ok=True)
+    # The recorded poses are drawn by a roomba without behavior
+    roomba = Roomba(Pose(0.0, 0.0, 0.0), MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED, metadata['radius'], None)
+    simulation = Simulation(roomba)
+    clock = pygame.time.Clock()
+    node_names = metadata['node_names']
+    last_time = 0.0
+    for step in range(len(records)):
+        record = records[step]
+        roomba.pose.position.x = float(record['x'])
+        roomba.pose.position.y = float(record['y'])
+        roomba.pose.rotation = float(record['rotation'])
+        simulation.history.append(round(M2PIX * roomba.pose.position.x), round(M2PIX * roomba.pose.position.y))
+        if step % frame_step != 0 and step != len(records) - 1:
+            continue
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+        draw(simulation, window)
+        node = int(record['node'])
+        pygame.display.set_caption('t = {:.2f} s, {}'.format(record['t'], node_names[node] if node >= 0 else '-'))
+        if frames is not None:
+            pygame.image.save(window, os.path.join(frames, 'frame_{:06d}.png'.format(step)))
+        if speed > 0:
+            # A recorded step may span several time steps (see run_episode), so the frames follow the recorded times
+            frame_time = float(record['t']) - last_time
+            last_time = float(record['t'])
+            if frame_time > 0.0:
+                clock.tick(speed / frame_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replays an episode recorded with simulacao(..., record=prefix).')
+    parser.add_argument('path', help='trajectory file (.npy)')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed, 0 to render as fast as possible')
+    parser.add_argument('--frames', default=None, help='directory where the frames are saved as PNG images')
+    parser.add_argument('--frame-step', type=int, default=1, help='number of time steps between frames')
+    arguments = parser.parse_args()
+    import pygame
+    replay(arguments.path, arguments.speed, arguments.frames, arguments.frame_step)
+    pygame.quit()
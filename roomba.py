@@ -1,4 +1,5 @@
 from math import sin, cos, fabs
+from time import perf_counter
 from constants import SAMPLE_TIME
 
 
@@ -22,7 +23,7 @@ class Roomba(object):
     """
     Represents a roomba cleaning robot.
     """
-    def __init__(self, pose, max_linear_speed, max_angular_speed, radius, behavior):
+    def __init__(self, pose, max_linear_speed, max_angular_speed, radius, behavior, sample_time=SAMPLE_TIME):
         """
         Creates a roomba cleaning robot.
 
@@ -35,6 +36,8 @@ class Roomba(object):
         :param radius: the robot's radius.
         :type radius: float
         :param behavior: the robot's behavior (finite state machine or behavior tree).
+        :param sample_time: duration of a time step of the simulation, also used by the behavior's timers.
+        :type sample_time: float
         """
         self.pose = pose
         self.linear_speed = 0.0
@@ -44,6 +47,7 @@ class Roomba(object):
         self.radius = radius
         self.bumper_state = False
         self.behavior = behavior
+        self.sample_time = sample_time
 
     def set_velocity(self, linear_speed, angular_speed):
         """
@@ -75,11 +79,14 @@ class Roomba(object):
         """
         return self.bumper_state
 
-    def move(self):
+    def move(self, ticks=1):
         """
-        Moves the robot during one time step.
+        Moves the robot during one or more time steps, with its current velocity.
+
+        :param ticks: number of time steps.
+        :type ticks: int
         """
-        dt = SAMPLE_TIME
+        dt = self.sample_time * ticks
         v = self.linear_speed
         w = self.angular_speed
         # If the angular speed is too low, the complete movement equation fails due to a division by zero.
@@ -93,10 +100,59 @@ class Roomba(object):
             self.pose.position.y += (2.0 * v / w) * sin(self.pose.rotation + w * dt / 2.0) * sin(w * dt / 2.0)
         self.pose.rotation += w * dt
 
-    def update(self):
+    def get_step_ticks(self, max_ticks, clearance):
+        """
+        Computes how many time steps the robot may move at once after a tick of its behavior tree: the running
+        leaf must keep its velocity (its timer does not expire) and the robot must not touch a wall, which is
+        guaranteed while the distance traveled is below the clearance.
+
+        :param max_ticks: maximum number of time steps.
+        :type max_ticks: int
+        :param clearance: distance between the robot and the nearest wall.
+        :type clearance: float
+        :return: number of time steps, at least 1.
+        :rtype: int
+        """
+        leaf = self.behavior.get_running_leaf_node()
+        if leaf is None:
+            return 1
+        ticks = 1 + leaf.get_remaining_ticks(self, max_ticks - 1)
+        distance = fabs(self.linear_speed) * self.sample_time
+        while ticks > 1 and ticks * distance >= clearance:
+            ticks -= 1
+        return ticks
+
+    def update(self, max_ticks=1, clearance=0.0, phase_times=None):
         """
         Updates the robot, including its behavior.
+
+        With max_ticks above 1, the behavior is ticked once and the robot then moves as many time steps as
+        get_step_ticks allows, the running leaf skipping the ticks in between. The leaf would have run them with the
+        same status, so the timers and the wall contacts happen at the same time steps as ticking every step.
+
+        :param max_ticks: maximum number of time steps of this update.
+        :type max_ticks: int
+        :param clearance: distance between the robot and the nearest wall, used when max_ticks is above 1.
+        :type clearance: float
+        :param phase_times: wall time of each phase, where the time of the behavior and of the kinematics is
+        accumulated, or None to not measure it.
+        :type phase_times: dict
+        :return: number of time steps of this update.
+        :rtype: int
         """
+        if phase_times is not None:
+            start = perf_counter()
         self.behavior.update(self)
-        self.move()
-
+        ticks = 1
+        if max_ticks > 1:
+            ticks = self.get_step_ticks(max_ticks, clearance)
+            if ticks > 1:
+                self.behavior.get_running_leaf_node().skip(self, ticks - 1)
+        if phase_times is None:
+            self.move(ticks)
+            return ticks
+        behavior_end = perf_counter()
+        self.move(ticks)
+        phase_times['behavior'] += behavior_end - start
+        phase_times['kinematics'] += perf_counter() - behavior_end
+        return ticks
@@ -1,105 +1,263 @@
-import cma
-from behavior_tree_test import simulacao
-from math import sin, cos, pi, exp
-import random
+from evaluator import ParallelEvaluator
+from cache import EvaluationCache, CachedEvaluator
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from math import inf
 import numpy as np
 
 
 # Hyperparameters used for computing the random neighbor
-delta = 2.0e-1
-# Hyperparameters used for computing the temperature scheduling
-temperature0 = 1.0
-beta = 1.0
+delta = 1.0e-1  # standard deviation of the perturbation, relative to the width of the bounds
+# Hyperparameters used for computing the temperature scheduling, which multiplies the temperature ladder
+temperature0 = 1.0  # initial multiplier, so the chains start at the temperatures of the ladder
+beta = 1.0e-4  # the temperatures fall to a tenth of the ladder's after 300 iterations
+# Stopping criteria
+epsilon = 75.0  # the run stops once the best mean time is below this, in seconds
+max_iterations = 300  # maximum number of iterations
+# Hyperparameters of the chains
+temperatures = [2.0, 4.0, 8.0, 16.0]  # temperature ladder, in seconds of cost, one chain per temperature
+exchange_interval = 5  # number of iterations between state exchanges of the chains
 
-def random_neighbor(theta):
+def random_neighbor(theta, lower_bound, upper_bound, rng):
     """
     Returns a random neighbor of theta.
-    The random neighbor is sampled around a circle of radius <delta>.
-    The probability distribution of the angle is uniform(-pi, pi).
+    Every parameter is perturbed by a normal distribution with standard deviation <delta> times the width of the
+    bounds, and reflected back into the bounds.
 
     :param theta: current point.
     :type theta: numpy.array.
+    :param lower_bound: lower bound of the parameters.
+    :type lower_bound: numpy.array.
+    :param upper_bound: upper bound of the parameters.
+    :type upper_bound: numpy.array.
+    :param rng: random number generator.
+    :type rng: numpy.random.Generator.
     :return: random neighbor.
     :rtype: numpy.array.
     """
 
-    random_angle = random.uniform(0,2*pi)
-    neighbor = theta.copy()
-    neighbor[0] = theta[0] + delta*cos(random_angle)
-    neighbor[1] = theta[1] + delta*sin(random_angle)
-
-    return neighbor
+    width = upper_bound - lower_bound
+    neighbor = theta + delta * width * rng.standard_normal(len(theta))
+    # Reflecting at the bounds (a step larger than the box would need several reflections, so it is also clipped)
+    neighbor = np.where(neighbor < lower_bound, 2.0 * lower_bound - neighbor, neighbor)
+    neighbor = np.where(neighbor > upper_bound, 2.0 * upper_bound - neighbor, neighbor)
+    return np.clip(neighbor, lower_bound, upper_bound)
 
 def schedule(i):
     """
-    Defines the temperature schedule of the simulated annealing.
+    Defines the temperature schedule of the simulated annealing, as a multiplier of the temperature ladder, which
+    is in seconds of cost.
 
     :param i: current iteration.
     :type i: int.
-    :return: current temperature.
+    :return: current multiplier of the temperatures.
     :rtype: float.
     """
 
     return  temperature0/(1+beta*(i**2))
 
-def simulated_annealing(simulacao, random_neighbor, schedule, theta0, epsilon, max_iterations):
+
+class ParallelTempering(object):
     """
-    Executes the Simulated Annealing (SA) algorithm to minimize (optimize) a cost function.
+    Represents several simulated annealing chains that run concurrently, one per temperature of a ladder.
 
-    :param cost_function: function to be minimized.
-    :type cost_function: function.
-    :param random_neighbor: function which returns a random neighbor of a given point.
-    :type random_neighbor: numpy.array.
-    :param schedule: function which computes the temperature schedule.
-    :type schedule: function.
+    Each chain keeps the cost of its current point, so only the neighbors are simulated, and the neighbors of all
+    chains are simulated in a single batch (in parallel by a ParallelEvaluator). The Metropolis test of each chain
+    is turned into a cutoff before the simulation: the uniform random number r is drawn first, and the neighbor is
+    accepted if its cost is below cost - T * log(r), so simulations above that cutoff may be aborted.
+    Every exchange_interval iterations, chains at adjacent temperatures exchange their states with the replica
+    exchange probability, so good points found by the hot chains reach the cold ones.
+    The temperatures may also be annealed, being multiplied by a schedule.
+    """
+    def __init__(self, theta0, lower_bound, upper_bound, temperatures, exchange_interval=5, schedule=None, rng=None):
+        """
+        Creates the chains, all of them starting at the same point.
+
+        :param theta0: initial guess.
+        :type theta0: numpy.array.
+        :param lower_bound: lower bound of the parameters.
+        :type lower_bound: numpy.array.
+        :param upper_bound: upper bound of the parameters.
+        :type upper_bound: numpy.array.
+        :param temperatures: temperature of each chain. With equal temperatures, the chains are independent.
+        :type temperatures: list of float.
+        :param exchange_interval: number of iterations between state exchanges.
+        :type exchange_interval: int.
+        :param schedule: function of the iteration that multiplies the temperatures, or None to keep them fixed.
+        :type schedule: function.
+        :param rng: random number generator, or None to create a new one.
+        :type rng: numpy.random.Generator.
+        """
+        self.lower_bound = np.asarray(lower_bound, dtype=float)
+        self.upper_bound = np.asarray(upper_bound, dtype=float)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.exchange_interval = exchange_interval
+        self.schedule = schedule
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.num_chains = len(self.temperatures)
+        theta0 = np.clip(np.asarray(theta0, dtype=float), self.lower_bound, self.upper_bound)
+        self.thetas = np.tile(theta0, (self.num_chains, 1))
+        self.costs = None
+        self.best_theta = theta0
+        self.best_cost = inf
+        self.iteration = 0
+        self.neighbors = None
+        self.cutoffs = None
+        self.accepted = np.zeros(self.num_chains, dtype=int)
+        self.exchanges = 0
+
+    def get_temperatures(self):
+        """
+        Obtains the current temperature of each chain.
+
+        :return: the temperatures.
+        :rtype: numpy.array.
+        """
+        if self.schedule is None:
+            return self.temperatures
+        return self.temperatures * self.schedule(self.iteration)
+
+    def ask(self):
+        """
+        Obtains the points to be simulated: the initial point in the first iteration, and then a neighbor of the
+        current point of each chain.
+
+        :return: points to be simulated, one per row.
+        :rtype: numpy.array.
+        """
+        if self.costs is None:
+            # The chains start at the same point, which is simulated only once
+            self.neighbors = self.thetas[:1].copy()
+            self.cutoffs = None
+            return self.neighbors
+        self.neighbors = np.array([random_neighbor(theta, self.lower_bound, self.upper_bound, self.rng)
+                                   for theta in self.thetas])
+        # Metropolis test drawn in advance: accepting the neighbor is the same as its cost being below the cutoff
+        r = 1.0 - self.rng.random(self.num_chains)
+        self.cutoffs = self.costs - self.get_temperatures() * np.log(r)
+        return self.neighbors
+
+    def get_cutoffs(self):
+        """
+        Obtains the costs above which the points returned by ask() are rejected.
+
+        :return: cutoff of each point, or None in the first iteration.
+        :rtype: numpy.array.
+        """
+        return self.cutoffs
+
+    def tell(self, costs):
+        """
+        Notifies the chains of the costs of the points returned by ask().
+
+        :param costs: cost of each point, in the same order.
+        :type costs: list of float.
+        """
+        costs = np.asarray(costs, dtype=float)
+        if self.costs is None:
+            self.costs = np.full(self.num_chains, costs[0])
+            self.best_cost = costs[0]
+            return
+        accepted = costs < self.cutoffs
+        self.thetas[accepted] = self.neighbors[accepted]
+        self.costs[accepted] = costs[accepted]
+        self.accepted += accepted
+        best = np.argmin(self.costs)
+        if self.costs[best] < self.best_cost:
+            self.best_cost = self.costs[best]
+            self.best_theta = self.thetas[best].copy()
+        self.iteration += 1
+        if self.iteration % self.exchange_interval == 0:
+            self.exchange()
+
+    def exchange(self):
+        """
+        Proposes state exchanges between chains at adjacent temperatures, alternating between the even and the odd
+        pairs of chains.
+        """
+        temperatures = self.get_temperatures()
+        first = (self.iteration // self.exchange_interval) % 2
+        for i in range(first, self.num_chains - 1, 2):
+            j = i + 1
+            log_probability = (self.costs[i] - self.costs[j]) * (1.0 / temperatures[i] - 1.0 / temperatures[j])
+            if np.log(1.0 - self.rng.random()) < log_probability:
+                self.thetas[[i, j]] = self.thetas[[j, i]]
+                self.costs[[i, j]] = self.costs[[j, i]]
+                self.exchanges += 1
+
+
+def simulated_annealing(evaluator, theta0, lower_bound, upper_bound, temperatures, epsilon, max_iterations, schedule=None,
+                        checkpoint_path=None, checkpoint_interval=10, rng=None):
+    """
+    Executes the Simulated Annealing (SA) algorithm to minimize (optimize) a cost function, with several chains
+    that exchange their states (parallel tempering).
+
+    :param evaluator: evaluator of the cost function to be minimized.
+    :type evaluator: ParallelEvaluator.
     :param theta0: initial guess.
     :type theta0: numpy.array.
-    :param epsilon: used to stop the optimization if the current cost is less than epsilon.
+    :param lower_bound: lower bound of the parameters.
+    :type lower_bound: numpy.array.
+    :param upper_bound: upper bound of the parameters.
+    :type upper_bound: numpy.array.
+    :param temperatures: temperature of each chain.
+    :type temperatures: list of float.
+    :param epsilon: used to stop the optimization if the best cost is less than epsilon.
     :type epsilon: float.
     :param max_iterations: maximum number of iterations.
     :type max_iterations: int.
-    :return theta: local minimum.
+    :param schedule: function which computes the temperature schedule, multiplying the temperatures, or None to
+    keep them fixed.
+    :type schedule: function.
+    :param checkpoint_path: file where the state of the chains is saved, and from which the run is resumed if it
+    exists, or None to not save it. It is removed when the run finishes.
+    :type checkpoint_path: str.
+    :param checkpoint_interval: number of iterations between checkpoints.
+    :type checkpoint_interval: int.
+    :param rng: random number generator of the chains, or None to create a new one.
+    :type rng: numpy.random.Generator.
+    :return theta: best point found.
     :rtype theta: np.array.
-    :return history: history of points visited by the algorithm.
+    :return history: history of the best points found by the algorithm.
     :rtype history: list of np.array.
     """
 
-    theta = theta0
-    history = [theta0]
+    chains = ParallelTempering(theta0, lower_bound, upper_bound, temperatures, exchange_interval, schedule, rng)
+    history = []
     n = 0
-    while n <= max_iterations:
-      T = schedule(n)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        chains, history, n = checkpoint['chains'], checkpoint['history'], checkpoint['n']
+        print('Resuming from', checkpoint_path, 'after', n, 'iterations')
+    while n <= max_iterations and chains.best_cost > epsilon:
       n += 1
-      if T < 0:
-        break
-      neighbor = random_neighbor(theta)
-      deltaE = simulacao(neighbor[0],neighbor[1],neighbor[2],neighbor[3],neighbor[4]) - simulacao(theta[0],theta[1],theta[2],theta[3],theta[4])
-      if deltaE < 0:
-        theta = neighbor
-        history.append(neighbor)
-      else:
-        r = random.uniform(0,1)
-        print("aqui1")
-        if r >= np.exp(deltaE/T):
-          print("aqui2")
-          theta = neighbor
-          history.append(neighbor)
-    print("aqui2")
-    return theta, history
+      # The neighbors of all chains are simulated at the same time by the worker processes
+      points = chains.ask()
+      chains.tell(evaluator.map(points, cutoff=chains.get_cutoffs()))
+      if not history or chains.best_cost < history[-1][1]:
+        history.append((chains.best_theta, chains.best_cost))
+      if checkpoint_path is not None and n % checkpoint_interval == 0:
+        save_checkpoint(checkpoint_path, {'chains': chains, 'history': history, 'n': n})
+    # The run has finished, so the next one starts from scratch
+    remove_checkpoint(checkpoint_path)
+    print('Accepted:', chains.accepted, 'Exchanges:', chains.exchanges)
+    return chains.best_theta, [theta for theta, cost in history]
 
 
 
-def fit_simulated_annealing():
+def fit_simulated_annealing(evaluator):
     """
-    Uses Simulated Annealing (SA) to fit the ball parameters.
+    Uses Simulated Annealing (SA) to fit the roomba's behavior parameters.
 
-    :return theta: array containing the initial speed and the acceleration factor due to rolling friction.
+    :param evaluator: evaluator of the cost function.
+    :type evaluator: ParallelEvaluator.
+    :return theta: best behavior parameters found.
     :rtype theta: numpy.array.
-    :return history: history of points visited by the algorithm.
+    :return history: history of the best points found by the algorithm.
     :rtype history: list of numpy.array.
     """
-    
-    theta, history = simulated_annealing(simulacao, random_neighbor, schedule, initial_guess, 5, 300)
+
+    theta, history = simulated_annealing(evaluator, initial_guess, lower_bound, upper_bound, temperatures, epsilon,
+                                         max_iterations, schedule, checkpoint_path, checkpoint_interval)
     return theta, history
 
 move_foward_time = 3.0  # time moving forward before switching to the spiral behavior
@@ -111,8 +269,19 @@ initial_radius_spiral = 0.2  # initial spiral radius
 #a = simulacao(move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral)
 
 initial_guess = np.array([move_foward_time, move_in_spiral_time, go_back_time, spiral_factor, initial_radius_spiral])
+lower_bound = 0.8 * initial_guess
+upper_bound = 1.2 * initial_guess
+
+replicate_seeds = [1, 2, 3]  # common random numbers: every candidate is simulated with the same replicate seeds
+cache_path = 'evaluations.sqlite'  # evaluations reused across runs
+cache_tolerance = 1.0e-3 * 0.4 * initial_guess  # points closer than this share the same evaluation
+checkpoint_path = 'sa_checkpoint.pkl'  # the run is resumed from this file if it exists
+checkpoint_interval = 10  # number of iterations between checkpoints
 
-# Solving the problem using Simulated Annealing algorithm
-theta_sa, history_sa = fit_simulated_annealing()
+if __name__ == '__main__':
+    # Solving the problem using Simulated Annealing algorithm
+    with CachedEvaluator(ParallelEvaluator(seeds=replicate_seeds), EvaluationCache(cache_path, tolerance=cache_tolerance)) as evaluator:
+        theta_sa, history_sa = fit_simulated_annealing(evaluator)
+        print('Cache:', evaluator.cache.get_statistics())
 
-print(theta_sa)
\ No newline at end of file
+    print(theta_sa)
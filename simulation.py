@@ -1,22 +1,87 @@
-import pygame
+import time
+import numpy as np
 from math import sin, cos
 from constants import SCREEN_WIDTH, SCREEN_HEIGHT, PIX2M, M2PIX
+# pygame is only imported by the drawing code, so headless simulations never load it
+
+
+class TrajectoryHistory(object):
+    """
+    Represents the last positions of the robot, in pixels, stored in a preallocated ring buffer.
+
+    Every point is written twice, at its index in the ring and at that index plus the capacity, so the last points
+    are always a contiguous slice of the buffer and can be read in order without copying.
+    """
+    def __init__(self, capacity):
+        """
+        Creates an empty trajectory history.
+
+        :param capacity: maximum number of points kept. To keep a whole episode, use its number of time steps.
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros((2 * capacity, 2), dtype=int)
+        self.count = 0
+
+    def append(self, x, y):
+        """
+        Adds a point to the history, overwriting the oldest one if the history is full.
+
+        :param x: x coordinate of the point, in pixels.
+        :type x: int
+        :param y: y coordinate of the point, in pixels.
+        :type y: int
+        """
+        index = self.count % self.capacity
+        buffer = self.buffer
+        buffer[index, 0] = x
+        buffer[index, 1] = y
+        buffer[index + self.capacity, 0] = x
+        buffer[index + self.capacity, 1] = y
+        self.count += 1
+
+    def get_points(self):
+        """
+        Obtains the points of the history, from the oldest to the newest.
+
+        :return: view of the points, one (x, y) row per point.
+        :rtype: numpy array
+        """
+        if self.count < self.capacity:
+            return self.buffer[:self.count]
+        start = self.count % self.capacity
+        return self.buffer[start:start + self.capacity]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
 
 
 class Simulation(object):
     """
     Represents the simulation.
     """
-    def __init__(self, roomba):
+    def __init__(self, roomba, history_size=2000):
         """
         Creates the simulation.
 
         :param roomba: the roomba robot used in this simulation.
         :type roomba: Roomba
+        :param history_size: number of positions kept in the movement history, or 0 to not record it, e.g. in
+        headless runs.
+        :type history_size: int
         """
-        self.point_list = []
+        self.history = TrajectoryHistory(history_size) if history_size > 0 else None
         self.roomba = roomba
 
+    @property
+    def point_list(self):
+        """
+        The movement history, from the oldest to the newest position, in pixels.
+        """
+        if self.history is None:
+            return np.zeros((0, 2), dtype=int)
+        return self.history.get_points()
+
     def check_collision(self):
         """
         Checks collision between the robot and the walls.
@@ -48,19 +113,57 @@ class Simulation(object):
             bumper_state = True
         return bumper_state
 
-    def update(self):
+    def get_clearance(self):
+        """
+        Obtains the distance between the robot and the nearest wall, along the axes.
+
+        :return: the clearance.
+        :rtype: float
+        """
+        x = self.roomba.pose.position.x
+        y = self.roomba.pose.position.y
+        radius = self.roomba.radius
+        return min(x - radius, SCREEN_WIDTH * PIX2M - radius - x, y - radius, SCREEN_HEIGHT * PIX2M - radius - y)
+
+    def update(self, stats=None, max_ticks=1):
         """
         Updates the simulation.
+
+        :param stats: statistics where the time of each phase of the update is accumulated, the wall collisions are
+        counted and the running leaf of the behavior tree is recorded, or None to not measure them.
+        :type stats: EpisodeStats
+        :param max_ticks: maximum number of time steps of this update (see Roomba.update).
+        :type max_ticks: int
+        :return: number of time steps of this update.
+        :rtype: int
         """
+        if stats is not None:
+            clock = time.perf_counter
+            start = clock()
         # Adding roomba's current position to the movement history
-        self.point_list.append((round(M2PIX * self.roomba.pose.position.x), round(M2PIX * self.roomba.pose.position.y)))
-        if len(self.point_list) > 2000:
-            self.point_list.pop(0)
+        if self.history is not None:
+            self.history.append(round(M2PIX * self.roomba.pose.position.x), round(M2PIX * self.roomba.pose.position.y))
+        if stats is not None:
+            history_end = clock()
         # Verifying collision
         bumper_state = self.check_collision()
         self.roomba.set_bumper_state(bumper_state)
-        # Updating the robot's behavior and movement
-        self.roomba.update()
+        clearance = self.get_clearance() if max_ticks > 1 else 0.0
+        if stats is None:
+            # Updating the robot's behavior and movement
+            return self.roomba.update(max_ticks, clearance)
+        stats.phase_times['history'] += history_end - start
+        stats.phase_times['collision'] += clock() - history_end
+        # The roomba measures its behavior and kinematics phases
+        ticks = self.roomba.update(max_ticks, clearance, stats.phase_times)
+        stats.steps += 1
+        stats.collisions += bumper_state
+        # Both BehaviorTree and CompiledBehaviorTree know their running leaf, unlike other behaviors
+        get_running_leaf_node = getattr(self.roomba.behavior, 'get_running_leaf_node', None)
+        if get_running_leaf_node is not None:
+            leaf = get_running_leaf_node()
+            stats.record_leaf(leaf.node_name if leaf is not None else None)
+        return ticks
 
     def draw(self, window):
         """
@@ -68,9 +171,11 @@ class Simulation(object):
 
         :param window: pygame's window where the drawing will occur.
         """
+        import pygame
         # If we have less than 2 points, we are unable to plot the movement history
-        if len(self.point_list) >= 2:
-            pygame.draw.lines(window, (255, 0, 0), False, self.point_list, 4)
+        point_list = self.point_list
+        if len(point_list) >= 2:
+            pygame.draw.lines(window, (255, 0, 0), False, point_list, 4)
         # Computing roomba's relevant points and radius in pixels
         sx = round(M2PIX * self.roomba.pose.position.x)
         sy = round(M2PIX * self.roomba.pose.position.y)
@@ -92,6 +197,7 @@ def draw(simulation, window):
     :param simulation: the simulation object.
     :param window: pygame's window where the drawing will occur.
     """
+    import pygame
     window.fill((224, 255, 255))
     simulation.draw(window)
     pygame.display.update()
@@ -0,0 +1,338 @@
+import numpy as np
+from math import inf, erf, sqrt, pi, ceil
+from evaluator import is_exact_cost
+
+
+class PredictedCost(float):
+    """
+    Cost of a parameter vector predicted by the surrogate model instead of simulated.
+
+    It is raised above the best cost simulated through the SurrogateEvaluator, but it may still be below the
+    simulated cost of the same parameter vector (or of a PSO particle's best position), so optimizers must not
+    adopt it as a best cost (see evaluator.is_exact_cost); it only ranks the parameter vectors of a batch.
+    Being a float, it can be used wherever a cost is expected; isinstance tells it apart from a simulated cost.
+    """
+    predicted = True
+
+
+class GaussianProcess(object):
+    """
+    Represents a Gaussian process regression model with a squared exponential kernel and a constant mean.
+
+    The inputs are scaled to the unit box and the outputs are standardized. The length scale and the noise
+    (the simulated costs are noisy) are chosen by maximizing the marginal likelihood over a grid.
+    """
+    def __init__(self, lower_bound, upper_bound, length_scales=(0.1, 0.2, 0.4, 0.8, 1.6), noises=(1.0e-3, 1.0e-2, 0.1, 0.3)):
+        """
+        Creates the Gaussian process.
+
+        :param lower_bound: lower bound of the inputs.
+        :type lower_bound: numpy array.
+        :param upper_bound: upper bound of the inputs.
+        :type upper_bound: numpy array.
+        :param length_scales: length scales tried when fitting the model, relative to the box.
+        :type length_scales: tuple of float.
+        :param noises: noise variances tried when fitting the model, relative to the outputs' variance.
+        :type noises: tuple of float.
+        """
+        self.lower_bound = np.asarray(lower_bound, dtype=float)
+        self.upper_bound = np.asarray(upper_bound, dtype=float)
+        self.length_scales = length_scales
+        self.noises = noises
+        self.x = None
+        self.y_mean = 0.0
+        self.y_std = 1.0
+        self.length_scale = None
+        self.noise = None
+        self.cholesky = None
+        self.alpha = None
+
+    def scale(self, x):
+        """
+        Scales inputs to the unit box.
+        """
+        return (np.atleast_2d(np.asarray(x, dtype=float)) - self.lower_bound) / (self.upper_bound - self.lower_bound)
+
+    def kernel(self, x1, x2, length_scale):
+        """
+        Computes the squared exponential kernel between two sets of scaled inputs.
+        """
+        distances = np.sum(x1 ** 2, axis=1)[:, np.newaxis] + np.sum(x2 ** 2, axis=1)[np.newaxis, :] - 2.0 * x1 @ x2.T
+        return np.exp(-0.5 * np.maximum(distances, 0.0) / length_scale ** 2)
+
+    def fit(self, x, y):
+        """
+        Fits the model to observed costs.
+
+        :param x: observed inputs, one per row.
+        :type x: numpy array.
+        :param y: observed costs.
+        :type y: numpy array.
+        """
+        self.x = self.scale(x)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = np.mean(y)
+        self.y_std = np.std(y) if np.std(y) > 0.0 else 1.0
+        y = (y - self.y_mean) / self.y_std
+        best_likelihood = -inf
+        for length_scale in self.length_scales:
+            kernel = self.kernel(self.x, self.x, length_scale)
+            for noise in self.noises:
+                try:
+                    cholesky = np.linalg.cholesky(kernel + noise * np.eye(len(y)))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, y))
+                likelihood = -0.5 * y @ alpha - np.sum(np.log(np.diag(cholesky)))
+                if likelihood > best_likelihood:
+                    best_likelihood = likelihood
+                    self.length_scale, self.noise, self.cholesky, self.alpha = length_scale, noise, cholesky, alpha
+
+    def predict(self, x):
+        """
+        Predicts the costs of new inputs.
+
+        :param x: inputs, one per row.
+        :type x: numpy array.
+        :return: predicted mean and standard deviation of each cost.
+        :rtype: tuple of numpy arrays.
+        """
+        x = self.scale(x)
+        kernel = self.kernel(x, self.x, self.length_scale)
+        mean = kernel @ self.alpha
+        v = np.linalg.solve(self.cholesky, kernel.T)
+        variance = np.maximum(1.0 - np.sum(v ** 2, axis=0), 1.0e-12)
+        return self.y_mean + self.y_std * mean, self.y_std * np.sqrt(variance)
+
+
+def expected_improvement(mean, std, best):
+    """
+    Computes the expected improvement over the best cost of predicted costs, for a minimization.
+
+    :param mean: predicted mean of each cost.
+    :type mean: numpy array.
+    :param std: predicted standard deviation of each cost.
+    :type std: numpy array.
+    :param best: best cost observed so far.
+    :type best: float.
+    :return: expected improvement of each cost.
+    :rtype: numpy array.
+    """
+    z = (best - mean) / std
+    cdf = 0.5 * (1.0 + np.vectorize(erf)(z / sqrt(2.0)))
+    pdf = np.exp(-0.5 * z ** 2) / sqrt(2.0 * pi)
+    return (best - mean) * cdf + std * pdf
+
+
+class SurrogateEvaluator(object):
+    """
+    Puts a surrogate model in front of an evaluator, such as CachedEvaluator, to pre-screen batches of parameter
+    vectors.
+
+    Every simulated cost that is not censored is added to an archive, on which a Gaussian process is trained. In
+    each batch, only the parameter vectors with the largest expected improvement are simulated; the others get a
+    PredictedCost, the model's prediction raised above the best cost simulated by this evaluator. Until the archive
+    has min_archive costs, every parameter vector is simulated.
+    """
+    def __init__(self, evaluator, lower_bound, upper_bound, screen_fraction=0.5, min_archive=10, max_archive=300):
+        """
+        Creates the surrogate-assisted evaluator.
+
+        :param evaluator: evaluator used for the simulated parameter vectors.
+        :type evaluator: CachedEvaluator.
+        :param lower_bound: lower bound of the parameters.
+        :type lower_bound: numpy array.
+        :param upper_bound: upper bound of the parameters.
+        :type upper_bound: numpy array.
+        :param screen_fraction: fraction of each batch that is simulated (at least one parameter vector).
+        :type screen_fraction: float.
+        :param min_archive: number of simulated costs needed before the batches are screened.
+        :type min_archive: int.
+        :param max_archive: maximum number of costs the model is trained on (half are the best ones, the others
+        are spread over the parameter space).
+        :type max_archive: int.
+        """
+        self.evaluator = evaluator
+        self.model = GaussianProcess(lower_bound, upper_bound)
+        self.screen_fraction = screen_fraction
+        self.min_archive = min_archive
+        self.max_archive = max_archive
+        self.archive_x = []
+        self.archive_y = []
+        self.best_simulated = inf
+        self.simulated = 0
+        self.predicted = 0
+
+    def load_archive(self, candidates, costs):
+        """
+        Adds previously simulated costs to the archive, e.g. the ones kept by EvaluationCache.get_archive.
+        Censored, predicted and lower-fidelity costs are left out, since they are not the costs being modeled.
+
+        :param candidates: parameter vectors.
+        :type candidates: list of numpy array.
+        :param costs: their costs.
+        :type costs: list of float.
+        """
+        for candidate, cost in zip(candidates, costs):
+            if not is_exact_cost(cost):
+                continue
+            self.archive_x.append(np.asarray(candidate, dtype=float))
+            self.archive_y.append(float(cost))
+
+    def screen(self, candidates):
+        """
+        Chooses the parameter vectors of a batch to be simulated.
+
+        :param candidates: parameter vectors.
+        :type candidates: list of numpy array.
+        :return: indices of the parameter vectors to be simulated, and the predicted cost of every parameter vector
+        (None if the batch is not screened).
+        :rtype: tuple
+        """
+        if len(self.archive_y) < self.min_archive:
+            return list(range(len(candidates))), None
+        training = self.get_training_set()
+        self.model.fit(np.array(self.archive_x)[training], np.array(self.archive_y)[training])
+        mean, std = self.model.predict(np.array(candidates, dtype=float))
+        improvement = expected_improvement(mean, std, min(self.archive_y))
+        num_simulated = max(1, int(ceil(self.screen_fraction * len(candidates))))
+        return sorted(np.argsort(-improvement)[:num_simulated].tolist()), mean
+
+    def get_training_set(self):
+        """
+        Chooses at most max_archive costs of the archive to train the model on: the best half, which matter the most
+        for the expected improvement, and costs spread over the parameter space, chosen one at a time as the
+        farthest from the ones already chosen (so the model does not extrapolate far from the optimum).
+
+        :return: indices of the chosen costs.
+        :rtype: numpy array.
+        """
+        if len(self.archive_y) <= self.max_archive:
+            return np.arange(len(self.archive_y))
+        order = np.argsort(self.archive_y)
+        chosen = list(order[:self.max_archive // 2])
+        remaining = order[self.max_archive // 2:]
+        x = self.model.scale(np.array(self.archive_x))
+        distances = np.min(np.sum((x[remaining, np.newaxis, :] - x[np.newaxis, chosen, :]) ** 2, axis=2), axis=1)
+        while len(chosen) < self.max_archive:
+            farthest = np.argmax(distances)
+            chosen.append(remaining[farthest])
+            distances = np.minimum(distances, np.sum((x[remaining] - x[remaining[farthest]]) ** 2, axis=1))
+        return np.array(chosen)
+
+    def get_predicted_cost(self, mean, incumbent=inf):
+        """
+        Converts a predicted mean into a PredictedCost, which is above the best cost simulated by this evaluator
+        and the incumbent (the archive loaded from previous runs may have better costs, which the optimizer has
+        never seen).
+        """
+        return PredictedCost(max(float(mean), np.nextafter(min(self.best_simulated, incumbent), inf)))
+
+    def map(self, candidates, cutoff=None, fidelity=None):
+        """
+        Evaluates a batch of parameter vectors, simulating only the most promising ones.
+        Lower-fidelity batches are simulated entirely and kept out of the archive.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param cutoff: cost above which the simulations are aborted, either one for all of them or one per
+        parameter vector, as in ParallelEvaluator.map.
+        :type cutoff: float or list of float.
+        :param fidelity: fidelity of the evaluations, as in ParallelEvaluator.map.
+        :type fidelity: Fidelity.
+        :return: cost of each parameter vector, in the same order.
+        :rtype: list of float.
+        """
+        if fidelity is not None:
+            return self.evaluator.map(candidates, cutoff, fidelity=fidelity)
+        candidates = [np.asarray(candidate, dtype=float) for candidate in candidates]
+        simulated, mean = self.screen(candidates)
+        if cutoff is not None and np.ndim(cutoff) > 0:
+            cutoff = [cutoff[i] for i in simulated]
+        costs = self.evaluator.map([candidates[i] for i in simulated], cutoff)
+        self.load_archive([candidates[i] for i in simulated], costs)
+        self.best_simulated = min([self.best_simulated] + [float(cost) for cost in costs if is_exact_cost(cost)])
+        results = [None] * len(candidates)
+        for i, cost in zip(simulated, costs):
+            results[i] = cost
+        for i in range(len(candidates)):
+            if results[i] is None:
+                results[i] = self.get_predicted_cost(mean[i])
+        self.simulated += len(simulated)
+        self.predicted += len(candidates) - len(simulated)
+        return results
+
+    def race(self, candidates, incumbent=inf, max_replicates=10, **options):
+        """
+        Races the most promising parameter vectors of a batch with the evaluator.
+        The race means are kept out of the archive and of the best simulated cost, since a race stopped after a few
+        episodes gives a noisy mean, not the cost being modeled. The predicted costs are above the incumbent.
+
+        :param candidates: parameter vectors to be evaluated.
+        :type candidates: list of numpy array.
+        :param incumbent: cost of the best parameter vector known so far.
+        :type incumbent: float.
+        :param max_replicates: maximum number of episodes of each race.
+        :type max_replicates: int.
+        :param options: other keyword arguments of the evaluator's race.
+        :return: estimate of the mean time, its standard error and the number of episodes used, for each
+        parameter vector. The predicted ones use no episodes and have an infinite standard error.
+        :rtype: list of tuple.
+        """
+        candidates = [np.asarray(candidate, dtype=float) for candidate in candidates]
+        simulated, mean = self.screen(candidates)
+        races = self.evaluator.race([candidates[i] for i in simulated], incumbent, max_replicates, **options)
+        results = [None] * len(candidates)
+        for i, race in zip(simulated, races):
+            results[i] = race
+        for i in range(len(candidates)):
+            if results[i] is None:
+                results[i] = (self.get_predicted_cost(mean[i], incumbent), inf, 0)
+        self.simulated += len(simulated)
+        self.predicted += len(candidates) - len(simulated)
+        return results
+
+    def get_state(self):
+        """
+        Obtains the state of the evaluator (its archive and counters), e.g. to be saved in a checkpoint. The model
+        is not part of it, since it is fitted again from the archive in every batch.
+
+        :return: the state.
+        :rtype: dict.
+        """
+        return {'archive_x': list(self.archive_x), 'archive_y': list(self.archive_y),
+                'best_simulated': self.best_simulated, 'simulated': self.simulated, 'predicted': self.predicted}
+
+    def set_state(self, state):
+        """
+        Restores a state obtained with get_state, replacing the archive.
+
+        :param state: the state.
+        :type state: dict.
+        """
+        self.archive_x = list(state['archive_x'])
+        self.archive_y = list(state['archive_y'])
+        self.best_simulated = state['best_simulated']
+        self.simulated = state['simulated']
+        self.predicted = state['predicted']
+
+    def get_statistics(self):
+        """
+        Obtains the number of simulated and predicted parameter vectors.
+
+        :return: the statistics.
+        :rtype: dict.
+        """
+        return {'simulated': self.simulated, 'predicted': self.predicted, 'archive': len(self.archive_y)}
+
+    def close(self):
+        """
+        Closes the evaluator.
+        """
+        self.evaluator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
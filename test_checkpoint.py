@@ -0,0 +1,87 @@
+import cma
+import numpy as np
+import pytest
+from checkpoint import save_checkpoint, load_checkpoint
+from pso import ParticleSwarmOptimization, hyperparams, lower_bound, upper_bound
+from cmaes import evaluate_generation
+from simulated_annealing import simulated_annealing, schedule, temperatures, initial_guess
+
+
+def cost(point):
+    # Deterministic stand-in for the simulation, with its minimum inside the bounds
+    return float(np.sum(((point - 1.1 * lower_bound) / (upper_bound - lower_bound)) ** 2))
+
+
+class Evaluator(object):
+    """
+    Evaluates the cost function, raising KeyboardInterrupt at a given call to interrupt the run.
+    """
+    def __init__(self, interrupt_at=None):
+        self.calls = 0
+        self.interrupt_at = interrupt_at
+
+    def map(self, points, cutoff=None):
+        self.calls += 1
+        if self.calls == self.interrupt_at:
+            raise KeyboardInterrupt
+        return [cost(point) for point in points]
+
+
+def run_pso(pso, generation, num_generations):
+    while generation < num_generations:
+        pso.tell([cost(position) for position in pso.ask()])
+        generation += 1
+    return pso
+
+
+def run_cmaes(es, cutoff, num_generations):
+    while es.countiter < num_generations:
+        samples = es.ask()
+        fitnesses, cutoff, costs = evaluate_generation(Evaluator(), samples, es.sp.weights.mu, cutoff)
+        es.tell(samples, fitnesses)
+    return es, cutoff
+
+
+def test_pso_resumes(tmp_path):
+    path = str(tmp_path / 'pso.pkl')
+    expected = run_pso(ParticleSwarmOptimization(hyperparams, lower_bound, upper_bound, np.random.default_rng(0)), 0, 8)
+    save_checkpoint(path, {'pso': run_pso(ParticleSwarmOptimization(hyperparams, lower_bound, upper_bound,
+                                                                     np.random.default_rng(0)), 0, 3), 'generation': 3})
+    checkpoint = load_checkpoint(path)
+    pso = run_pso(checkpoint['pso'], checkpoint['generation'], 8)
+    assert np.array_equal(pso.x, expected.x)
+    assert np.array_equal(pso.best_positions, expected.best_positions)
+    assert pso.get_best_value() == expected.get_best_value()
+
+
+def test_cmaes_resumes(tmp_path):
+    path = str(tmp_path / 'cmaes.pkl')
+    m0 = 0.5 * (lower_bound + upper_bound)
+    options = {'popsize': 5, 'seed': 1, 'verbose': -9}
+    expected, expected_cutoff = run_cmaes(cma.CMAEvolutionStrategy(m0, 0.1, options), np.inf, 8)
+    es, cutoff = run_cmaes(cma.CMAEvolutionStrategy(m0, 0.1, options), np.inf, 3)
+    save_checkpoint(path, {'es': es, 'cutoff': cutoff})
+    # The samples of the resumed strategy come from the generator pickled with it, whatever numpy.random's state
+    np.random.seed(0)
+    checkpoint = load_checkpoint(path)
+    es, cutoff = run_cmaes(checkpoint['es'], checkpoint['cutoff'], 8)
+    assert np.array_equal(es.mean, expected.mean)
+    assert es.sigma == expected.sigma
+    assert es.best.f == expected.best.f
+    assert cutoff == expected_cutoff
+
+
+def test_simulated_annealing_resumes(tmp_path):
+    path = str(tmp_path / 'sa.pkl')
+    options = dict(schedule=schedule, checkpoint_interval=5)
+    expected = simulated_annealing(Evaluator(), initial_guess, lower_bound, upper_bound, temperatures, 0.0, 30,
+                                   checkpoint_path=str(tmp_path / 'other.pkl'), rng=np.random.default_rng(0), **options)
+    with pytest.raises(KeyboardInterrupt):
+        simulated_annealing(Evaluator(interrupt_at=18), initial_guess, lower_bound, upper_bound, temperatures, 0.0, 30,
+                            checkpoint_path=path, rng=np.random.default_rng(0), **options)
+    # The resumed run takes the chains from the checkpoint, so its own generator is never used
+    theta, history = simulated_annealing(Evaluator(), initial_guess, lower_bound, upper_bound, temperatures, 0.0, 30,
+                                         checkpoint_path=path, rng=np.random.default_rng(1), **options)
+    assert np.array_equal(theta, expected[0])
+    assert len(history) == len(expected[1])
+    assert all(np.array_equal(point, expected_point) for point, expected_point in zip(history, expected[1]))
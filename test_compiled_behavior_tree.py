@@ -0,0 +1,54 @@
+import numpy as np
+from itertools import count
+from behavior_tree import BehaviorTree, LeafNode, SequenceNode, SelectorNode, ExecutionStatus
+from compiled_behavior_tree import CompiledBehaviorTree
+
+
+class ScriptedNode(LeafNode):
+    """
+    Leaf that logs its calls and returns the statuses of a script, in a loop.
+    """
+    def __init__(self, node_name, script, log):
+        super().__init__(node_name)
+        self.script = script
+        self.log = log
+        self.executions = 0
+
+    def enter(self, agent):
+        self.log.append(('enter', self.node_name))
+
+    def execute(self, agent):
+        self.log.append(('execute', self.node_name))
+        status = self.script[self.executions % len(self.script)]
+        self.executions += 1
+        return status
+
+
+def build_tree(rng, log, numbers, depth=0):
+    """
+    Builds a random tree of sequences, selectors and scripted leaves. The same generator state builds the same tree.
+    """
+    name = 'node{}'.format(next(numbers))
+    if depth >= 4 or rng.random() < 0.3:
+        script = [list(ExecutionStatus)[status] for status in rng.integers(0, 3, size=rng.integers(1, 6))]
+        return ScriptedNode(name, script, log)
+    node = SequenceNode(name) if rng.random() < 0.5 else SelectorNode(name)
+    for k in range(rng.integers(1, 5)):
+        node.add_child(build_tree(rng, log, numbers, depth + 1))
+    return node
+
+
+def test_compiled_tree_matches_interpreted_tree():
+    for seed in range(500):
+        interpreted_log = []
+        interpreted = BehaviorTree(build_tree(np.random.default_rng(seed), interpreted_log, count()))
+        compiled_log = []
+        compiled = CompiledBehaviorTree(BehaviorTree(build_tree(np.random.default_rng(seed), compiled_log, count())))
+        for tick in range(50):
+            status = interpreted.root.execute(None)
+            interpreted_log.append(('status', status.value))
+            compiled_log.append(('status', compiled.update(None)))
+            running_leaf = interpreted.get_running_leaf_node()
+            compiled_leaf = compiled.get_running_leaf_node()
+            assert (running_leaf and running_leaf.node_name) == (compiled_leaf and compiled_leaf.node_name)
+        assert compiled_log == interpreted_log, 'tree {}'.format(seed)
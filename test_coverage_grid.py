@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from coverage_grid import CoverageTracker, PackedCoverageGrids, get_grid_shape, pack_mask
+
+
+@pytest.mark.parametrize('cell_size', [0.01, 0.02, 0.04])
+def test_packed_grids_match_tracker(cell_size):
+    # Random masks stamped all over the room, past the walls and at every bit offset inside a byte
+    rng = np.random.default_rng(0)
+    num_grids = 3
+    margin = 12
+    packed = PackedCoverageGrids(num_grids, cell_size, margin=margin)
+    trackers = [CoverageTracker(*get_grid_shape(1.0 / cell_size)) for grid in range(num_grids)]
+    height, width = trackers[0].grid.shape
+    assert (packed.height, packed.width) == (height, width)
+    for stamp in range(300):
+        mask = rng.random((rng.integers(1, margin + 1), rng.integers(1, margin + 1))) < 0.7
+        grids = rng.permutation(num_grids)[:rng.integers(1, num_grids + 1)]
+        tops = rng.integers(-margin, height + margin - mask.shape[0] + 1, size=len(grids))
+        lefts = rng.integers(-margin, width + margin - mask.shape[1] + 1, size=len(grids))
+        if stamp % 3 == 0:
+            # Stamps flush against a wall
+            tops[0] = [-mask.shape[0] + 1, 0, height - mask.shape[0], height - 1][stamp % 4]
+            lefts[-1] = [-mask.shape[1] + 1, 0, width - mask.shape[1], width - 1][stamp // 3 % 4]
+        newly_cleaned = packed.stamp_mask(grids, tops, lefts, pack_mask(mask))
+        expected = [trackers[grid].stamp_mask(top, left, mask) for grid, top, left in zip(grids, tops, lefts)]
+        assert newly_cleaned.tolist() == expected
+    for grid in range(num_grids):
+        assert np.array_equal(packed.get_grid(grid), trackers[grid].grid)
+    expected = [tracker.cleaned_cells for tracker in trackers]
+    assert packed.cleaned_cells.tolist() == expected
+    assert packed.count_cleaned_cells().tolist() == expected
@@ -0,0 +1,34 @@
+import pytest
+from behavior_tree_test import run_replicate
+from jit_simulation import run_jit_replicate
+from event_simulation import run_event_replicate
+from batch_simulation import simulate_batch
+from multi_fidelity import Fidelity
+
+
+seeds = [1, 2, 3]
+default_parameters = (3.0, 20.0, 0.5, 0.05, 0.2)
+default_times = [95.7, 103.6167, 145.2]  # times of the default parameters with seeds 1, 2 and 3
+
+
+def test_run_replicate():
+    times = [run_replicate(default_parameters, seed) for seed in seeds]
+    assert times == pytest.approx(default_times, abs=1.0e-4)
+
+
+@pytest.mark.parametrize('parameters', [default_parameters, (2.5, 17.0, 0.45, 0.045, 0.19)])
+def test_simulators_match(parameters):
+    expected = [run_replicate(parameters, seed) for seed in seeds]
+    assert [run_jit_replicate(parameters, seed) for seed in seeds] == pytest.approx(expected)
+    assert [run_event_replicate(parameters, seed) for seed in seeds] == pytest.approx(expected)
+    assert simulate_batch([parameters], seeds=seeds)[1][0].tolist() == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('sample_time', [0.1, 0.2])
+def test_swept_steps_match(sample_time):
+    # The behavior ticks at every 1/60 s within the longer steps, so the episodes barely change
+    fidelity = Fidelity(sample_time=sample_time, swept=True)
+    expected = [run_replicate(default_parameters, seed, fidelity=Fidelity(swept=True)) for seed in seeds]
+    times = [run_replicate(default_parameters, seed, fidelity=fidelity) for seed in seeds]
+    assert times == pytest.approx(expected, rel=0.01)
+    assert [run_jit_replicate(default_parameters, seed, fidelity=fidelity) for seed in seeds] == pytest.approx(times)
@@ -0,0 +1,83 @@
+import json
+import numpy as np
+from math import ceil
+from constants import SAMPLE_TIME, MAX_EPISODE_TIME
+
+# One record per time step: the time, the robot's pose and velocity after the step and the running leaf
+TRAJECTORY_DTYPE = np.dtype([('t', np.float64), ('x', np.float32), ('y', np.float32), ('rotation', np.float32),
+                             ('linear_speed', np.float32), ('angular_speed', np.float32), ('node', np.int8)])
+
+
+def get_metadata_path(path):
+    """
+    Obtains the path of the JSON file with the metadata of a trajectory file.
+
+    :param path: path of the trajectory file.
+    :type path: str
+    :return: path of the metadata file.
+    :rtype: str
+    """
+    return path[:-len('.npy')] + '.json' if path.endswith('.npy') else path + '.json'
+
+
+class TrajectoryRecorder(object):
+    """
+    Records the trajectory of an episode in a preallocated structured array, to be saved in a NumPy file.
+
+    The file can be loaded with memory mapping, and a JSON file next to it keeps the episode's metadata (seed,
+    parameters, names of the behavior nodes), so the episode can be replayed or simulated again.
+    """
+    def __init__(self, capacity=None):
+        """
+        Creates an empty recorder.
+
+        :param capacity: maximum number of time steps, by default the number of steps of the longest episode.
+        :type capacity: int
+        """
+        if capacity is None:
+            capacity = int(ceil(MAX_EPISODE_TIME / SAMPLE_TIME)) + 2
+        self.records = np.zeros(capacity, dtype=TRAJECTORY_DTYPE)
+        self.count = 0
+
+    def record(self, t, roomba):
+        """
+        Records the state of the robot after a time step.
+
+        :param t: time of the episode.
+        :type t: float
+        :param roomba: the robot.
+        :type roomba: Roomba
+        """
+        get_running_leaf = getattr(roomba.behavior, 'get_running_leaf', None)
+        self.records[self.count] = (t, roomba.pose.position.x, roomba.pose.position.y, roomba.pose.rotation,
+                                    roomba.linear_speed, roomba.angular_speed,
+                                    get_running_leaf() if get_running_leaf is not None else -1)
+        self.count += 1
+
+    def save(self, path, metadata):
+        """
+        Saves the recorded time steps and the episode's metadata.
+
+        :param path: path of the trajectory file, which should end with .npy.
+        :type path: str
+        :param metadata: metadata of the episode, which must be serializable to JSON.
+        :type metadata: dict
+        """
+        np.save(path, self.records[:self.count])
+        with open(get_metadata_path(path), 'w') as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+
+
+def load_trajectory(path):
+    """
+    Loads a trajectory file, memory mapped, and its metadata.
+
+    :param path: path of the trajectory file.
+    :type path: str
+    :return: the recorded time steps and the episode's metadata.
+    :rtype: tuple
+    """
+    records = np.load(path, mmap_mode='r')
+    with open(get_metadata_path(path)) as metadata_file:
+        metadata = json.load(metadata_file)
+    return records, metadata